@@ -1,66 +1,91 @@
-import os
-import json
-import sys
+import startup_profile
 import boto3
-from datetime import datetime, timezone
 import asyncio
-from decimal import Decimal
-from typing import Any, Dict
+import signal
 
 from aws_lambda_powertools import Logger
-from botocore.exceptions import ClientError
-from boto3.dynamodb.conditions import Key
 
 import constants
-from helper import generate_edit_instructions_with_ref_other_ver, generate_edit_instructions_with_ref_ver1, generate_edit_instructions_without_ref_ver1, generate_edit_instructions_without_ref_other_ver
-# NEW IMPORT
-from gemini_helper import cleanup_gemini_files 
+# helper / gemini_helper / planner / result_cache pull in google-genai, googleapiclient, pydantic and httpx;
+# they are imported inside main() by the branch that needs them
+from version_store import VersionStore
+from rate_limiter import current_org_id
+from retry_policy import log_retry_metrics, reset_retry_budgets
+from deadline import Deadline, run_stage, within
+from exceptions import DeadlineExceededError, JobCancelledError
+from checkpoint import JobCheckpoint, job_inputs_key
+from job_lease import JobLease, FINISHED_STATUSES
+from cancellation import CancellationWatcher, current_cancellation
+from project_loader import load_project_context, version_loader
+from edl_codec import decode_edits
+from async_dynamodb import get_async_dynamodb
+from config_provider import config
+from payload_loader import load_payload
+
+startup_profile.mark("imports")
 
 logger = Logger(service=f"{constants.SERVICE_NAME}-pipeline-step")
 
 dynamodb = boto3.resource('dynamodb')
-
-PAYLOAD_JSON = os.environ.get('PAYLOAD_JSON')
+# Pooled async client for the job's reads and writes; the boto3 resource above serves blocking paths
+db = get_async_dynamodb()
 
 RECC_TABLE_NAME = constants.RECC_DYNAMODB_TABLE
 EDITLABS_TABLE_NAME = constants.EDITTABLE_TABLE
 
-def floats_to_decimals(obj: Any) -> Any:
-    if isinstance(obj, list):
-        return [floats_to_decimals(i) for i in obj]
-    if isinstance(obj, dict):
-        return {k: floats_to_decimals(v) for k, v in obj.items()}
-    if isinstance(obj, float):
-        return Decimal(str(obj))
-    return obj
-
-def _parse_payload(event):
-    body = event
-    if isinstance(body, dict):
-        return body
-    if isinstance(body, str):
+def _import_generation_modules():
+    """Loads the generation-only modules, so the imports in main() are just lookups."""
+    import helper, planner, result_cache  # noqa: F401
+
+async def _finish_cancelled(version_store, checkpoint, project_file_names, project_files_variables):
+    """
+    Marks a cancelled version CANCELLED. Deletes only the Gemini uploads this job made (the project's own
+    files stay for other versions) and restores the project's file list if a draft had replaced it.
+    """
+    job_files = checkpoint.get("existing_file_names", []) if checkpoint else []
+    files_to_delete = [name for name in job_files if name not in project_file_names]
+    if files_to_delete:
         try:
-            return json.loads(body)
-        except json.JSONDecodeError:
-            return body
-    return {}
+            from gemini_helper import cleanup_gemini_files
+            await cleanup_gemini_files(files_to_delete)
+        except Exception as e:
+            logger.warning(f"Failed to delete the cancelled job's Gemini files: {e}")
+    await version_store.update(
+        {'status': 'CANCELLED', 'checkpoint': None},
+        project_fields={'existing_file_names': project_file_names, 'files_variables': project_files_variables}
+    )
+    logger.info(f"Version marked CANCELLED, {len(files_to_delete)} Gemini uploads deleted.")
 
 async def main():
     org_id = None
     project_id = None
     version_index = None # Initialize for safety
+    version_store = None
+    lease = None
+    heartbeat = None
+    checkpoint = None
+    cancellation = None
+    watcher = None
+    project_file_names = []
+    project_files_variables = []
+    # Job-wide time budget; every stage below gets the smaller of its own budget and what is left of this
+    deadline = Deadline(constants.JOB_BUDGET_SECONDS)
+    # Retry budgets are per job, not per process
+    reset_retry_budgets()
 
     try:
-        if not PAYLOAD_JSON or not EDITLABS_TABLE_NAME or not RECC_TABLE_NAME:
+        if not EDITLABS_TABLE_NAME or not RECC_TABLE_NAME:
             raise ValueError("Missing required environment variables")
 
-        payload = _parse_payload(PAYLOAD_JSON)
+        payload = await load_payload()
         org_id = payload.get("org_id")
         project_id = payload.get("project_id")
         clean_request = payload.get("clean",0) # <--- CHECK FOR CLEAN FLAG
 
         if not org_id or not project_id:
-             raise ValueError("Missing 'org_id' or 'project_id' in PAYLOAD_JSON")
+             raise ValueError("Missing 'org_id' or 'project_id' in the job payload")
+        # Gemini calls of this job count against the org's fair share of the shared rate limits
+        current_org_id.set(org_id)
 
         # Initialize Table
         editlabs_table = dynamodb.Table(EDITLABS_TABLE_NAME)
@@ -73,16 +98,17 @@ async def main():
             logger.info("🧹 CLEANUP REQUEST RECEIVED")
             logger.info("=" * 60)
             logger.info(f"Org: {org_id}, Project: {project_id}")
+            startup_profile.report("clean")
 
             # 1. Fetch the project to find file names
             logger.info("Fetching project to retrieve active Gemini files...")
-            edit_job_response = await asyncio.to_thread(
-                editlabs_table.get_item,
-                Key={'org_id': org_id, 'project_id': project_id}
+            edit_item = await db.get_item(
+                EDITLABS_TABLE_NAME,
+                {'org_id': org_id, 'project_id': project_id},
+                projection="existing_file_names"
             )
-            edit_item = edit_job_response.get("Item")
             
-            if not edit_item:
+            if edit_item is None:
                 logger.warning(f"Project {project_id} not found. Skipping cleanup.")
                 return
 
@@ -91,16 +117,18 @@ async def main():
             
             if files_to_delete:
                 # 3. Call the Gemini Cleanup Function
+                from gemini_helper import cleanup_gemini_files
+                await asyncio.to_thread(config.load)
                 await cleanup_gemini_files(files_to_delete)
             else:
                 logger.info("No 'existing_file_names' found in DynamoDB. Nothing to clean on Gemini.")
 
             # 4. Remove the file references from DynamoDB (so we don't try to use them again)
             logger.info("Removing 'existing_file_names' from DynamoDB record...")
-            await asyncio.to_thread(
-                editlabs_table.update_item,
-                Key={'org_id': org_id, 'project_id': project_id},
-                UpdateExpression="REMOVE existing_file_names"
+            await db.update_item(
+                EDITLABS_TABLE_NAME,
+                {'org_id': org_id, 'project_id': project_id},
+                "REMOVE existing_file_names"
             )
             
             logger.info("✅ Cleanup sequence finished successfully.")
@@ -112,7 +140,7 @@ async def main():
         # ==============================================================================
         version = payload.get("version")
         if not version:
-             raise ValueError("Missing 'version' in PAYLOAD_JSON (and 'clean' was not requested)")
+             raise ValueError("Missing 'version' in the job payload (and 'clean' was not requested)")
 
         logger.info("=" * 60)
         logger.info("🚀 STARTING EDIT GENERATION PIPELINE STEP")
@@ -121,94 +149,177 @@ async def main():
         logger.info(f"Org ID: {org_id}")
         logger.info("=" * 60)
 
-        recc_table = dynamodb.Table(RECC_TABLE_NAME)
-
-        logger.info("Fetching edit job details.")
-        edit_job_response = await asyncio.to_thread(
-            editlabs_table.get_item,
-            Key={'org_id': org_id, 'project_id': project_id}
-        )
-        edit_item = edit_job_response.get("Item")
-        versions_list = edit_item.get("versions", [])
-        
-        # Calculate Index Early for Error Handling
-        version_index = next(
-            (i for i, item in enumerate(versions_list) if item.get("version") == version), 
-            None
-        )
-        if version_index is None:
-            raise ValueError(f"Version '{version}' not found in project '{project_id}'")
+        logger.info("Fetching edit job details and channel context.")
+        # The generation modules import and the API keys load on threads while the context reads are in flight
+        with startup_profile.timed("context_and_generation_imports"):
+            job_context, _, _ = await asyncio.gather(
+                load_project_context(
+                    db,
+                    EDITLABS_TABLE_NAME,
+                    RECC_TABLE_NAME,
+                    org_id=org_id,
+                    project_id=project_id,
+                    version=version,
+                    channel_id=payload.get("channel_id")
+                ),
+                asyncio.to_thread(_import_generation_modules),
+                asyncio.to_thread(config.load)
+            )
+        from helper import generate_edit_instructions_with_ref_other_ver, generate_edit_instructions_with_ref_ver1, generate_edit_instructions_without_ref_ver1, generate_edit_instructions_without_ref_other_ver
+        from planner import plan_generation_job, token_usage_record
+        from result_cache import result_cache, result_cache_key
+        startup_profile.report("generate")
+        edit_item = job_context["project"]
+        version_index = job_context["version_index"]
+        version_store = VersionStore(editlabs_table, org_id, project_id, version, version_index=version_index, db=db)
 
-        # ... (Rest of your existing generation logic goes here) ...
-        
         channel_id = edit_item.get("channel_id")
         raw_video_urls = edit_item.get("raw_videos_url")
         reference_url = edit_item.get("reference_video_link")
         existing_file_names = edit_item.get("existing_file_names", [])
         old_files_variables=edit_item.get("files_variables",[])
-        
-        target_version_data = next(
-            (item for item in versions_list if item.get("version") == version), 
-            None
-        )
+        project_file_names = list(existing_file_names)
+        project_files_variables = list(old_files_variables)
+
+        target_version_data = job_context["version_data"]
         logger.info(f"Found data for version: {target_version_data.get('version')}")
 
         creator_notes = target_version_data.get("creator_notes")
-        
+
         # Get old edits if this is a revision
         old_edits = {}
+        old_version_data = None
         if version != "v1":
-            old_version = f"v{str(int(version[1:])-1)}"
-            old_version_data = next(
-                (item for item in versions_list if item.get("version") == old_version), 
-                None
-            )
+            old_version_data = job_context["old_version_data"]
             if not old_version_data:
-                raise ValueError(f"Could not find previous version data ({old_version}) required for revision.")
-            old_edits = old_version_data.get("all_edits", {})
+                raise ValueError(f"Could not find previous version data (v{int(version[1:]) - 1}) required for revision.")
+            load_version = version_loader(editlabs_table, org_id, project_id, legacy=version_index is not None)
+            old_edits = await asyncio.to_thread(decode_edits, old_version_data, load_version) or {}
 
         if not channel_id: raise ValueError(f"Job {project_id} is missing 'channel_id'.")
         if not creator_notes: raise ValueError(f"Job {project_id} is missing 'creator_notes'.")
         if not raw_video_urls: raise ValueError(f"Job {project_id} is missing 'raw_video_urls'.")
 
-        # ... (Context Fetching Logic) ...
-        logger.info(f"Fetching context data for channel_id={channel_id}")
-        partition_key = org_id
-        sort_key_prefix = f"CHANNEL_CONTEXT#{channel_id}#"
-        context_response = await asyncio.to_thread(
-            recc_table.query,
-            KeyConditionExpression=Key('org_id').eq(partition_key) & Key('id').begins_with(sort_key_prefix),
-            Limit=1,
-            ScanIndexForward=False
-        )
-        context_items = context_response.get("Items", [])
-        if not context_items:
-            raise ValueError(f"No context data found for org_id={org_id} and channel_id={channel_id}")
-        context_item = context_items[0]
-        channel_info = context_item.get("channel_info_for_thumbnails", {})
+        channel_info = job_context["channel_info"]
         if not channel_info:
             raise ValueError("Channel info data is empty or missing from context item.")
 
-        # Mark Status as STARTED
-        time_now_started = datetime.now(timezone.utc).isoformat()
-        await asyncio.to_thread(
-            editlabs_table.update_item,
-            Key={'org_id': org_id, 'project_id': project_id},
-            UpdateExpression=f"SET #versions[{version_index}].#status = :status, #versions[{version_index}].#updated_at = :updated_at,#out_updated_at = :out_updated_at",
-            ExpressionAttributeNames={
-                '#versions': 'versions',      
-                '#status': 'status',          
-                '#updated_at': 'updated_at',
-                '#out_updated_at': 'updated_at'
-            },
-            ExpressionAttributeValues={
-                ':status': 'STARTED',
-                ':updated_at': time_now_started,
-                ':out_updated_at':time_now_started
-            }
+        # Size the job (tokens, model, sampling, split strategy) before any Gemini call
+        estimate_only = payload.get("estimate_only", 0)
+        plan = None
+        try:
+            plan = await run_stage(deadline, "planning", plan_generation_job(
+                raw_video_urls=raw_video_urls,
+                reference_url=reference_url,
+                version=version,
+                creator_notes=creator_notes,
+                channel_info=channel_info,
+                old_edits=old_edits
+            ))
+        except Exception as e:
+            if estimate_only:
+                raise
+            logger.warning(f"Job planning failed, falling back to default sizing: {e}")
+
+        token_estimate = plan.model_dump() if plan else None
+
+        if estimate_only:
+            # BRANCH: ESTIMATE ONLY (the API reads the version's token_estimate back)
+            await version_store.update({'token_estimate': token_estimate})
+            logger.info(f"Estimate-only request finished: {plan.estimated_input_tokens} input tokens, ${plan.estimated_cost_usd}.")
+            return
+
+        # One task per version: a duplicate (double submit, Step Functions retry) exits or attaches to the running one
+        lease = JobLease(version_store, version)
+        attached = False
+        while not await lease.acquire():
+            if constants.JOB_LEASE_DUPLICATE_MODE != "attach":
+                logger.info(f"Version {version} of project {project_id} is already being generated, exiting.")
+                return
+            logger.info(f"Version {version} of project {project_id} is already being generated, waiting for its result.")
+            attached = True
+            holder_state = await within(deadline, lease.wait_for_holder())
+            if holder_state.get("status") in FINISHED_STATUSES:
+                logger.info(f"Running task finished with status {holder_state.get('status')}, nothing left to do.")
+                return
+        if attached:
+            # The holder went away (e.g. Spot interruption): resume from the checkpoint it left behind
+            target_version_data = await version_store.get_version()
+
+        main_task = asyncio.current_task()
+        heartbeat = asyncio.create_task(lease.keep_alive(on_lost=main_task.cancel))
+
+        # A cancel request (the version's cancel_requested) aborts in-flight requests and stops the job between stages
+        cancellation = CancellationWatcher(version_store)
+        current_cancellation.set(cancellation)
+        await cancellation.poll()
+        cancellation.check()
+        watcher = asyncio.create_task(cancellation.watch(on_cancel=main_task.cancel))
+
+        # Resume after the last stage a previous attempt of this job completed (same inputs only)
+        checkpoint = JobCheckpoint.load(
+            version_store,
+            target_version_data,
+            job_inputs_key(raw_video_urls, reference_url, creator_notes, version)
         )
+        if checkpoint.get("existing_file_names"):
+            existing_file_names = checkpoint.get("existing_file_names")
+            old_files_variables = checkpoint.get("files_variables", [])
+
+        # ECS stops tasks with SIGTERM: persist the checkpoint and mark the version INTERRUPTED so a rerun resumes
+        def on_sigterm():
+            logger.warning("SIGTERM received, saving checkpoint before exit.")
+            try:
+                checkpoint.flush_sync(status='INTERRUPTED')
+            except Exception as flush_err:
+                logger.error(f"Failed to save checkpoint on SIGTERM: {flush_err}")
+            main_task.cancel()
+
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, on_sigterm)
+
+        # Identical inputs return the cached edits without touching Gemini ("fresh_take" asks for a new generation)
+        cache_key = None
+        if result_cache.enabled:
+            try:
+                cache_key = await result_cache_key(
+                    org_id=org_id,
+                    raw_video_urls=raw_video_urls,
+                    reference_url=reference_url,
+                    channel_info=channel_info,
+                    creator_notes=creator_notes,
+                    old_edits=old_edits,
+                    version=version,
+                    plan=plan
+                )
+            except Exception as e:
+                logger.warning(f"Could not compute the result cache key, generating without the cache: {e}")
+
+        cached = await result_cache.get(cache_key) if cache_key and not payload.get("fresh_take", 0) else None
+        if cached:
+            logger.info(f"Result cache hit ({cache_key}), returning {len(cached['all_edits'])} cached edits.")
+            edits_fields, removed_fields = await version_store.edits_fields(cached["all_edits"], old_edits)
+            await version_store.update({
+                'status': 'DONE',
+                **edits_fields,
+                'token_usage': {'cache_hit': True, 'cache_key': cache_key, 'cached_at': cached.get("created_at")},
+                'token_estimate': token_estimate,
+                'checkpoint': None
+            }, remove_fields=removed_fields)
+            return
+
+        # Mark Status as STARTED
+        await version_store.update({'status': 'STARTED', 'token_estimate': token_estimate}, remove_fields=['edl'])
+
+        # Streamed edits are appended to the version's all_edits (status STREAMING) while the model writes
+        on_partial_edits = version_store.append_edits if constants.STREAMING_ENABLED else None
+
+        async def on_draft(draft_edits, draft_active_files, draft_files_variables):
+            # Fast-model draft (status DRAFT); the DONE write below replaces it with the refined edits
+            await version_store.update(
+                {'status': 'DRAFT', 'all_edits': draft_edits},
+                project_fields={'existing_file_names': draft_active_files, 'files_variables': draft_files_variables}
+            )
 
-        final_json = None
         edits = None
         active_files = []
 
@@ -220,7 +331,12 @@ async def main():
                 channel_info_for_edit=channel_info,
                 creator_notes=creator_notes,
                 existing_file_names=existing_file_names,
-                old_file_variables=old_files_variables
+                old_file_variables=old_files_variables,
+                plan=plan,
+                on_partial_edits=on_partial_edits,
+                on_draft=on_draft,
+                deadline=deadline,
+                checkpoint=checkpoint
             )
             if response_payload == -1: raise ValueError("Invalid reference URL passed")
             if response_payload == -2: raise ValueError("Reference video does not exist")
@@ -237,7 +353,12 @@ async def main():
                 creator_notes=creator_notes,
                 existing_file_names=existing_file_names,
                 old_edits=old_edits,
-                old_file_variables=old_files_variables
+                old_file_variables=old_files_variables,
+                plan=plan,
+                on_partial_edits=on_partial_edits,
+                on_draft=on_draft,
+                deadline=deadline,
+                checkpoint=checkpoint
             )
             if response_payload == -1: raise ValueError("Invalid reference URL passed")
             if response_payload == -2: raise ValueError("Reference video does not exist")
@@ -252,7 +373,12 @@ async def main():
                 channel_info_for_edit=channel_info,
                 creator_notes=creator_notes,
                 existing_file_names=existing_file_names,
-                old_file_variables=old_files_variables
+                old_file_variables=old_files_variables,
+                plan=plan,
+                on_partial_edits=on_partial_edits,
+                on_draft=on_draft,
+                deadline=deadline,
+                checkpoint=checkpoint
             )
             edits = response_payload["data"]
             active_files = response_payload["active_files"]
@@ -265,7 +391,12 @@ async def main():
                 creator_notes=creator_notes,
                 existing_file_names=existing_file_names,
                 old_edits=old_edits,
-                old_file_variables=old_files_variables
+                old_file_variables=old_files_variables,
+                plan=plan,
+                on_partial_edits=on_partial_edits,
+                on_draft=on_draft,
+                deadline=deadline,
+                checkpoint=checkpoint
             )
             edits = response_payload["data"]
             active_files = response_payload["active_files"]
@@ -275,73 +406,57 @@ async def main():
             raise ValueError("Edit generation process returned no result.")
 
         logger.info("Edit generation successful.")
-        time_now_done = datetime.now(timezone.utc).isoformat()
-        
-        # Update DynamoDB with Success
-        await asyncio.to_thread(
-            editlabs_table.update_item,
-            Key={'org_id': org_id, 'project_id': project_id},
-            UpdateExpression=f"""SET 
-                #versions[{version_index}].#status = :status, 
-                #versions[{version_index}].#updated_at = :updated_at,
-                #versions[{version_index}].#all_edits = :all_edits,
-                #existing_file_names = :existing_file_names,
-                #files_variables = :files_variables,
-                #out_updated_at = :out_updated_at
-
-            """,
-            ExpressionAttributeNames={
-                '#versions': 'versions',
-                '#status': 'status',
-                '#updated_at': 'updated_at',
-                '#all_edits': 'all_edits',       
-                '#existing_file_names': 'existing_file_names',
-                '#files_variables' : 'files_variables',
-                '#out_updated_at': 'updated_at'
-            },
-            ExpressionAttributeValues={
-                ':status': 'DONE',
-                ':updated_at': time_now_done,
-                ':all_edits': floats_to_decimals(edits), 
-                ':existing_file_names': active_files,
-                ':files_variables' : files_variables,
-                ':out_updated_at':time_now_done
-            }
+        token_usage = token_usage_record(plan, response_payload.get("usage"))
+
+        # Update DynamoDB with Success (overwrites any draft or streamed partial edits)
+        edits_fields, removed_fields = await version_store.edits_fields(edits, old_edits)
+        await version_store.update(
+            {'status': 'DONE', **edits_fields, 'token_usage': token_usage, 'checkpoint': None},
+            project_fields={'existing_file_names': active_files, 'files_variables': files_variables},
+            remove_fields=removed_fields
         )
 
+        if cache_key:
+            await result_cache.put(cache_key, org_id, edits, response_payload.get("usage"))
+
         logger.info("Edit Generation Step completed successfully!")
         await asyncio.sleep(0.25)
 
+    except (asyncio.CancelledError, JobCancelledError) as e:
+        # SIGTERM and a lost lease also cancel the task; only a cancel request ends the job as CANCELLED
+        if cancellation is None or not cancellation.requested:
+            raise
+        if isinstance(e, asyncio.CancelledError):
+            asyncio.current_task().uncancel()
+        logger.info("Generation cancelled on request, cleaning up.")
+        await _finish_cancelled(version_store, checkpoint, project_file_names, project_files_variables)
+
     except Exception as e:
         logger.error(f"Pipeline failed: {e}", exc_info=True)
         
         # Only attempt status update if this was a GENERATION attempt (we have an index)
-        # If it was a clean attempt, we just raise
-        if org_id and project_id and version_index is not None and 'editlabs_table' in locals():
+        # If it was a clean attempt, we just raise; a duplicate never overwrites the lease holder's status
+        if version_store is not None and (lease is None or lease.held):
             try:
                 logger.info("Attempting to update status to FAILED in DynamoDB...")
-                time_now_failed = datetime.now(timezone.utc).isoformat()
-                
-                await asyncio.to_thread(
-                    editlabs_table.update_item,
-                    Key={'org_id': org_id, 'project_id': project_id},
-                    UpdateExpression=f"SET #versions[{version_index}].#status = :status, #versions[{version_index}].#updated_at = :updated_at,#out_updated_at = :out_updated_at",
-                    ExpressionAttributeNames={
-                        '#versions': 'versions',
-                        '#status': 'status',
-                        '#updated_at': 'updated_at',
-                        '#out_updated_at': 'updated_at'
-                    },
-                    ExpressionAttributeValues={
-                        ':status': 'FAILED',
-                        ':updated_at': time_now_failed,
-                        ':out_updated_at':time_now_failed
-                    }
-                )
+                if isinstance(e, DeadlineExceededError):
+                    # Record which stage ran out of time so slow stages can be tuned from the versions list
+                    await version_store.set_status('FAILED', failed_stage=e.stage, failure_reason=str(e))
+                else:
+                    await version_store.set_status('FAILED')
             except Exception as update_err:
                 logger.error(f"CRITICAL: Failed to update DynamoDB status to FAILED: {update_err}")
 
         raise e
+    finally:
+        if heartbeat is not None:
+            heartbeat.cancel()
+        if watcher is not None:
+            watcher.cancel()
+        if lease is not None:
+            await lease.release()
+        await db.close()
+        log_retry_metrics()
 
 if __name__ == '__main__':
     asyncio.run(main())
@@ -0,0 +1,61 @@
+import asyncio
+import contextvars
+import logging
+from typing import Any, Callable
+
+import constants
+from exceptions import JobCancelledError
+from version_store import VersionStore
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+CANCEL_REQUESTED = "CANCEL_REQUESTED"
+
+
+class CancellationWatcher:
+    """
+    Watches one version for a cancel request: its cancel_requested set to true, or status CANCEL_REQUESTED.
+    The flag survives the pipeline's own status writes, so it is the field a caller should set.
+
+    watch() polls every CANCEL_POLL_SECONDS and calls `on_cancel()` (which cancels the running task and with it
+    every in-flight request); check() raises JobCancelledError between stages once a request was seen.
+    """
+
+    def __init__(self, version_store: VersionStore):
+        self.version_store = version_store
+        self.requested = False
+
+    async def _cancel_requested(self) -> bool:
+        version_item = await self.version_store.get_version(["status", "cancel_requested"])
+        return bool(version_item.get("cancel_requested")) or version_item.get("status") == CANCEL_REQUESTED
+
+    async def poll(self) -> bool:
+        if not self.requested and await self._cancel_requested():
+            logger.warning(f"Cancellation requested for version {self.version_store.version}.")
+            self.requested = True
+        return self.requested
+
+    async def watch(self, on_cancel: Callable[[], Any]) -> None:
+        while True:
+            await asyncio.sleep(constants.CANCEL_POLL_SECONDS)
+            try:
+                if await self.poll():
+                    on_cancel()
+                    return
+            except Exception as e:
+                logger.warning(f"Cancellation poll failed: {e}")
+
+    def check(self) -> None:
+        if self.requested:
+            raise JobCancelledError("Version was cancelled while generating")
+
+
+# Set once per job in main(), so helpers can check for cancellation between stages without a parameter
+current_cancellation: contextvars.ContextVar[CancellationWatcher | None] = contextvars.ContextVar("current_cancellation", default=None)
+
+
+def raise_if_cancelled() -> None:
+    watcher = current_cancellation.get()
+    if watcher is not None:
+        watcher.check()
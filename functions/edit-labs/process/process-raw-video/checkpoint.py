@@ -0,0 +1,93 @@
+import hashlib
+import json
+import logging
+from datetime import datetime, timezone
+from typing import Any, Dict, List
+
+from json_codec import to_dynamodb
+from version_store import VersionStore
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Stages in the order a job completes them; a resumed job reuses the artifacts of every completed stage
+STAGES = ("reference_summary", "uploaded", "generated")
+
+
+def job_inputs_key(raw_video_urls: List[str], reference_url: str | None, creator_notes: str, version: str) -> str:
+    """Hash of the inputs a checkpoint was taken for; a checkpoint for other inputs is ignored."""
+    payload = json.dumps([list(raw_video_urls or []), reference_url, creator_notes, version], default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class JobCheckpoint:
+    """
+    Stage checkpoint of one generation job, stored as the version's checkpoint attribute:
+    {"stage", "inputs_key", "existing_file_names", "files_variables", "reference_summary",
+     "all_edits", "usage", "updated_at"}.
+
+    Each stage saves as soon as it completes, so a resubmitted or interrupted job resumes after the
+    last completed stage instead of re-uploading, re-summarizing and regenerating.
+    """
+
+    def __init__(self, version_store: VersionStore, inputs_key: str, data: Dict[str, Any] | None = None):
+        self.version_store = version_store
+        self.inputs_key = inputs_key
+        self.data = dict(data or {})
+        self.data["inputs_key"] = inputs_key
+
+    @classmethod
+    def load(cls, version_store: VersionStore, version_item: Dict[str, Any], inputs_key: str) -> "JobCheckpoint":
+        saved = version_item.get("checkpoint") or {}
+        if saved and saved.get("inputs_key") != inputs_key:
+            logger.info("Discarding checkpoint taken for different job inputs.")
+            saved = {}
+        checkpoint = cls(version_store, inputs_key, saved)
+        if checkpoint.stage:
+            logger.info(f"Resuming from checkpoint stage '{checkpoint.stage}' ({checkpoint.data.get('updated_at')}).")
+        return checkpoint
+
+    @property
+    def stage(self) -> str | None:
+        return self.data.get("stage")
+
+    def reached(self, stage: str) -> bool:
+        return self.stage in STAGES and STAGES.index(self.stage) >= STAGES.index(stage)
+
+    def get(self, field: str, default: Any = None) -> Any:
+        return self.data.get(field, default)
+
+    async def save(self, stage: str | None = None, **fields: Any) -> None:
+        """Merges `fields` into the checkpoint, advances the stage (never backwards) and persists it."""
+        self.data.update(fields)
+        if stage and not self.reached(stage):
+            self.data["stage"] = stage
+        self.data["updated_at"] = datetime.now(timezone.utc).isoformat()
+        try:
+            await self.version_store.update({'checkpoint': self.data})
+        except Exception as e:
+            # A lost checkpoint only costs redone work on a retry; never fail the job for it
+            logger.warning(f"Failed to save checkpoint at stage '{self.stage}': {e}")
+
+    def flush_sync(self, status: str | None = None) -> None:
+        """Blocking write of the current checkpoint (and optionally the version status), for the SIGTERM handler."""
+        self.data["updated_at"] = datetime.now(timezone.utc).isoformat()
+        store = self.version_store
+        stamp_parts, stamp_names, stamp_values = store.stamp(self.data["updated_at"])
+        set_parts = [f"{store.path('#checkpoint')} = :checkpoint", *stamp_parts]
+        names = {'#checkpoint': 'checkpoint', **stamp_names}
+        values = {':checkpoint': to_dynamodb(self.data), **stamp_values}
+        if status:
+            set_parts.append(f"{store.path('#status')} = :status")
+            names['#status'] = 'status'
+            values[':status'] = status
+        store.table.update_item(
+            Key=store.key,
+            UpdateExpression="SET " + ", ".join(set_parts),
+            ExpressionAttributeNames=store.names(names),
+            ExpressionAttributeValues=values
+        )
+
+    async def on_files_ready(self, file_names: List[str], file_uris: List[str]) -> None:
+        """Callback for the Gemini helpers once the raw videos are uploaded (or verified)."""
+        await self.save("uploaded", existing_file_names=list(file_names), files_variables=list(file_uris))
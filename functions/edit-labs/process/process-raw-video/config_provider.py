@@ -0,0 +1,100 @@
+import logging
+import os
+import threading
+import time
+from typing import Dict
+
+import boto3
+
+import constants
+from retry_policy import get_retry_policy
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# GetParameters accepts at most 10 names per call
+SSM_BATCH_SIZE = 10
+
+
+class ConfigProvider:
+    """
+    Secrets and config from SSM Parameter Store, read in one GetParameters batch and cached in-process.
+
+    `parameters` maps a config name (e.g. "GEMINI_API_KEY") to its SSM parameter name. An environment variable of
+    the config name, when set, wins over SSM (local runs). The first get() loads every parameter at once; a daemon
+    thread then refreshes them every CONFIG_REFRESH_SECONDS, and a failed refresh keeps the values already loaded.
+    """
+
+    def __init__(self, parameters: Dict[str, str], refresh_seconds: float = 300.0):
+        self.parameters = {name: path for name, path in parameters.items() if path}
+        self.refresh_seconds = refresh_seconds
+        self.retry_policy = get_retry_policy("ssm")
+        self._values: Dict[str, str] = {}
+        self._loaded_at = None
+        self._lock = threading.Lock()
+        self._refresher = None
+        self._client = None
+
+    def _fetch(self) -> Dict[str, str]:
+        if self._client is None:
+            self._client = boto3.client("ssm")
+        by_path = {path: name for name, path in self.parameters.items()}
+        paths = list(by_path)
+        values = {}
+        for start in range(0, len(paths), SSM_BATCH_SIZE):
+            batch = paths[start:start + SSM_BATCH_SIZE]
+            response = self.retry_policy.run_sync(
+                lambda: self._client.get_parameters(Names=batch, WithDecryption=True),
+                label="SSM get_parameters"
+            )
+            for parameter in response.get("Parameters", []):
+                values[by_path[parameter["Name"]]] = parameter["Value"]
+            if response.get("InvalidParameters"):
+                logger.error(f"SSM parameters not found: {response['InvalidParameters']}")
+        return values
+
+    def load(self) -> None:
+        """Reads every parameter now (blocking) and starts the background refresh."""
+        with self._lock:
+            if self.parameters:
+                self._values = self._fetch()
+            self._loaded_at = time.monotonic()
+            if self._refresher is None and self.parameters:
+                self._refresher = threading.Thread(target=self._refresh_loop, name="config-refresh", daemon=True)
+                self._refresher.start()
+
+    def _refresh_loop(self) -> None:
+        while True:
+            time.sleep(self.refresh_seconds)
+            try:
+                values = self._fetch()
+                with self._lock:
+                    self._values.update(values)
+                    self._loaded_at = time.monotonic()
+            except Exception as e:
+                logger.warning(f"Config refresh failed, keeping the loaded values: {e}")
+
+    def get(self, name: str, default: str = "") -> str:
+        override = os.environ.get(name)
+        if override:
+            return override
+        if self._loaded_at is None:
+            try:
+                self.load()
+            except Exception as e:
+                logger.error(f"Failed to load config from SSM: {e}")
+                return default
+        return self._values.get(name, default)
+
+
+config = ConfigProvider(
+    {
+        "GEMINI_API_KEY": constants.GEMINI_API_KEY_SSM_PATH,
+        "YOUTUBE_API_KEY": constants.YOUTUBE_API_KEY_SSM_PATH
+    },
+    refresh_seconds=constants.CONFIG_REFRESH_SECONDS
+)
+
+
+def get_config(name: str, default: str = "") -> str:
+    return config.get(name, default)
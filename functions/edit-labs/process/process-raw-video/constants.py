@@ -1,3 +1,4 @@
+import json
 import os
 
 REF_VID_SUMMARY_PROMPT="""
@@ -52,16 +53,180 @@ REF_VID_SUMMARY_PROMPT="""
 
 """
 
-GEMINI_API_KEY=os.environ.get("GEMINI_API_KEY","")
-YOUTUBE_API_KEY=os.environ.get("YOUTUBE_API_KEY","")
+# API keys are read by config_provider in one batched SSM call (GEMINI_API_KEY / YOUTUBE_API_KEY env vars override it)
+GEMINI_API_KEY_SSM_PATH = os.environ.get("GEMINI_API_KEY_SSM_PATH", "")
+YOUTUBE_API_KEY_SSM_PATH = os.environ.get("YOUTUBE_API_KEY_SSM_PATH", "")
+CONFIG_REFRESH_SECONDS = float(os.environ.get("CONFIG_REFRESH_SECONDS", "300"))
 
 SERVICE_NAME = "process-raw-video"
 METRICS_NAMESPACE = "EditLabs"
 RECC_DYNAMODB_TABLE = "recommendations"
 EDITTABLE_TABLE = "edit-labs"
 DDB_CONTEXT_PREFIX = "CONTEXT"
-
-
+GEMINI_TEMPERATURE = float(os.environ.get("GEMINI_TEMPERATURE", "0.4"))
+
+# --- Raw edit generation mode ---
+# "direct": every clip in one generate_content request.
+# "map_reduce": clips (or windows of long clips) are scanned concurrently, then sequenced by one text-only call.
+# "auto": map_reduce once the project crosses either threshold below.
+# Defaults to "direct": map_reduce output has not been validated against the direct path yet.
+GENERATION_MODE = os.environ.get("GENERATION_MODE", "direct").lower()
+MAP_REDUCE_MIN_VIDEOS = int(os.environ.get("MAP_REDUCE_MIN_VIDEOS", "4"))
+MAP_REDUCE_MIN_TOTAL_SECONDS = int(os.environ.get("MAP_REDUCE_MIN_TOTAL_SECONDS", "1800"))
+MAP_WINDOW_SECONDS = int(os.environ.get("MAP_WINDOW_SECONDS", "600"))
+MAP_REDUCE_CONCURRENCY = int(os.environ.get("MAP_REDUCE_CONCURRENCY", "4"))
+MAP_MODEL = os.environ.get("MAP_MODEL", "gemini-2.5-pro")
+REDUCE_MODEL = os.environ.get("REDUCE_MODEL", "gemini-2.5-pro")
+
+# --- Streaming generation ---
+# Streamed all_edits entries are appended to versions[i].all_edits (status STREAMING) every STREAM_BATCH_SIZE edits.
+STREAMING_ENABLED = os.environ.get("STREAMING_ENABLED", "true").lower() == "true"
+STREAM_BATCH_SIZE = int(os.environ.get("STREAM_BATCH_SIZE", "3"))
+
+# --- EDL validation / repair ---
+EDL_REPAIR_ENABLED = os.environ.get("EDL_REPAIR_ENABLED", "true").lower() == "true"
+EDL_MIN_SEGMENT_SECONDS = float(os.environ.get("EDL_MIN_SEGMENT_SECONDS", "1"))
+EDL_REPAIR_MODEL = os.environ.get("EDL_REPAIR_MODEL", "gemini-2.5-pro")
+MAX_EDL_CONTINUATIONS = int(os.environ.get("MAX_EDL_CONTINUATIONS", "2"))
+
+# --- Model routing / latency hedging ---
+# Once a request on the primary model outlives hedge_after_seconds (the path's p95 latency SLO), the same
+# request is fired on the hedge model and the first schema-valid answer wins. 0 disables hedging for a path.
+MODEL_ROUTES = {
+    "raw_edits": {
+        "primary": os.environ.get("RAW_EDITS_MODEL", "gemini-2.5-pro"),
+        "hedge": os.environ.get("RAW_EDITS_HEDGE_MODEL", "gemini-2.5-flash"),
+        "hedge_after_seconds": float(os.environ.get("RAW_EDITS_HEDGE_AFTER_SECONDS", "300")),
+    },
+    "reference_summary": {
+        "primary": os.environ.get("REFERENCE_SUMMARY_MODEL", "gemini-2.5-pro"),
+        "hedge": os.environ.get("REFERENCE_SUMMARY_HEDGE_MODEL", "gemini-2.5-flash"),
+        "hedge_after_seconds": float(os.environ.get("REFERENCE_SUMMARY_HEDGE_AFTER_SECONDS", "180")),
+    },
+    "map": {
+        "primary": MAP_MODEL,
+        "hedge": os.environ.get("MAP_HEDGE_MODEL", "gemini-2.5-flash"),
+        "hedge_after_seconds": float(os.environ.get("MAP_HEDGE_AFTER_SECONDS", "150")),
+    },
+    "draft": {
+        "primary": os.environ.get("DRAFT_MODEL", "gemini-2.5-flash"),
+        "hedge": os.environ.get("DRAFT_HEDGE_MODEL", ""),
+        "hedge_after_seconds": float(os.environ.get("DRAFT_HEDGE_AFTER_SECONDS", "0")),
+    },
+    "reduce": {
+        "primary": REDUCE_MODEL,
+        "hedge": os.environ.get("REDUCE_HEDGE_MODEL", "gemini-2.5-flash"),
+        "hedge_after_seconds": float(os.environ.get("REDUCE_HEDGE_AFTER_SECONDS", "120")),
+    },
+}
+
+# --- Token-budget planner ---
+# Gemini bills video at ~258 tokens per frame (66 at low media resolution) plus 32 tokens per second of audio.
+VIDEO_FRAME_TOKENS_DEFAULT = 258
+VIDEO_FRAME_TOKENS_LOW = 66
+AUDIO_TOKENS_PER_SECOND = 32
+TEXT_CHARS_PER_TOKEN = 4
+REF_SUMMARY_TOKENS_ESTIMATE = 4000
+EDL_OUTPUT_TOKENS_ESTIMATE = 8000
+MAP_CANDIDATES_OUTPUT_TOKENS_ESTIMATE = 1500
+PLANNER_UNKNOWN_CLIP_SECONDS = int(os.environ.get("PLANNER_UNKNOWN_CLIP_SECONDS", "600"))
+PLANNER_INPUT_TOKEN_BUDGET = int(os.environ.get("PLANNER_INPUT_TOKEN_BUDGET", "900000"))
+PLANNER_MIN_FPS = float(os.environ.get("PLANNER_MIN_FPS", "0.25"))
+PLANNER_FAST_MODEL = os.environ.get("PLANNER_FAST_MODEL", "gemini-2.5-flash")
+# Jobs at or under this many input tokens go to the fast model (0 disables)
+PLANNER_FAST_MODEL_MAX_TOKENS = int(os.environ.get("PLANNER_FAST_MODEL_MAX_TOKENS", "0"))
+REF_SINGLE_CALL_TOKEN_LIMIT = int(os.environ.get("REF_SINGLE_CALL_TOKEN_LIMIT", "1500000"))
+
+# USD per 1M tokens; "long" rates apply above long_context_threshold input tokens
+GEMINI_PRICING_PER_MILLION = {
+    "gemini-2.5-pro": {"input": 1.25, "output": 10.0, "input_long": 2.50, "output_long": 15.0, "long_context_threshold": 200000},
+    "gemini-2.5-flash": {"input": 0.30, "output": 2.50},
+}
+
+
+
+# --- Draft-then-refine ---
+# A fast-model draft is written with status DRAFT, then the full-quality pass reuses the uploads and overwrites it.
+# Opt-in: the draft is an extra flash call (latency and cost) on every direct job.
+DRAFT_REFINE_ENABLED = os.environ.get("DRAFT_REFINE_ENABLED", "false").lower() == "true"
+DRAFT_MODEL = MODEL_ROUTES["draft"]["primary"]
+
+# --- Deadlines ---
+# Job-wide time budget (seconds) and per-stage budgets inside it; a stage never outlives the job budget.
+JOB_BUDGET_SECONDS = float(os.environ.get("JOB_BUDGET_SECONDS", "3300"))
+STAGE_BUDGET_SECONDS = {
+    "planning": float(os.environ.get("PLANNING_BUDGET_SECONDS", "120")),
+    "download": float(os.environ.get("DOWNLOAD_BUDGET_SECONDS", "600")),
+    "reference_summary": float(os.environ.get("REFERENCE_SUMMARY_BUDGET_SECONDS", "900")),
+    "draft": float(os.environ.get("DRAFT_BUDGET_SECONDS", "600")),
+    "upload": float(os.environ.get("UPLOAD_BUDGET_SECONDS", "900")),
+    "generation": float(os.environ.get("GENERATION_BUDGET_SECONDS", "2400")),
+    "repair": float(os.environ.get("REPAIR_BUDGET_SECONDS", "300")),
+}
+
+# --- Job lease ---
+# One task per project version: the lease expires unless renewed every heartbeat, so a dead task's lease is reclaimed.
+# A duplicate invocation either exits ("exit") or waits for the running task's result ("attach").
+JOB_LEASE_SECONDS = int(os.environ.get("JOB_LEASE_SECONDS", "300"))
+JOB_LEASE_HEARTBEAT_SECONDS = float(os.environ.get("JOB_LEASE_HEARTBEAT_SECONDS", "60"))
+JOB_LEASE_DUPLICATE_MODE = os.environ.get("JOB_LEASE_DUPLICATE_MODE", "exit").lower()
+JOB_LEASE_ATTACH_POLL_SECONDS = float(os.environ.get("JOB_LEASE_ATTACH_POLL_SECONDS", "15"))
+
+# --- Cancellation ---
+# How often a running job checks its version for cancel_requested / status CANCEL_REQUESTED
+CANCEL_POLL_SECONDS = float(os.environ.get("CANCEL_POLL_SECONDS", "10"))
+
+# --- EDL storage ---
+# Final all_edits are stored as a zlib blob, or, when EDL_OFFLOAD_BUCKET is set and it is smaller, as a delta
+# against an immutable S3 snapshot of the previous version's edits; blobs over the threshold go to the bucket too.
+# Off by default: the project details / versions API returns all_edits as-is, so enable this only once
+# every reader decodes the `edl` record with edl_codec.decode_edits().
+EDL_CODEC_ENABLED = os.environ.get("EDL_CODEC_ENABLED", "false").lower() == "true"
+EDL_OFFLOAD_BUCKET = os.environ.get("EDL_OFFLOAD_BUCKET", "")
+EDL_OFFLOAD_THRESHOLD_BYTES = int(os.environ.get("EDL_OFFLOAD_THRESHOLD_BYTES", "65536"))
+
+# --- Result cache ---
+# Finished all_edits keyed by a hash of every generation input; a resubmit with identical inputs is served from
+# here without calling Gemini (payload "fresh_take": 1 skips the lookup). Disabled when the table name is unset.
+# Entries expire after the TTL; an org's oldest entries are evicted once its entries exceed RESULT_CACHE_MAX_ORG_BYTES
+# or RESULT_CACHE_MAX_ORG_ENTRIES.
+RESULT_CACHE_TABLE_NAME = os.environ.get("RESULT_CACHE_TABLE_NAME", "")
+RESULT_CACHE_TTL_SECONDS = int(os.environ.get("RESULT_CACHE_TTL_SECONDS", str(30 * 24 * 3600)))
+RESULT_CACHE_MAX_ENTRY_BYTES = int(os.environ.get("RESULT_CACHE_MAX_ENTRY_BYTES", "350000"))
+RESULT_CACHE_MAX_ORG_BYTES = int(os.environ.get("RESULT_CACHE_MAX_ORG_BYTES", str(20 * 1024 * 1024)))
+# Entries listed in one org's index item (about 150 bytes each)
+RESULT_CACHE_MAX_ORG_ENTRIES = int(os.environ.get("RESULT_CACHE_MAX_ORG_ENTRIES", "1000"))
+# Bump to invalidate every cached result (e.g. after a change to edit formatting)
+RESULT_CACHE_VERSION = os.environ.get("RESULT_CACHE_VERSION", "1")
+
+# --- Startup ---
+# Seconds from the first import to a branch being ready (imports, clients, context reads) before a warning is
+# logged; the STARTUP_PROFILE line breaks the time down. PYTHONPROFILEIMPORTTIME=1 adds per-module timings.
+STARTUP_TARGET_SECONDS = float(os.environ.get("STARTUP_TARGET_SECONDS", "3"))
+
+# --- Gemini rate limiting ---
+# Per-minute quotas shared by every running task through RATE_LIMIT_TABLE_NAME (in-process bucket when unset).
+# Buckets are model names plus "files" for uploads; a missing "tpm" limits requests only. "reserve_tokens" is what
+# a call reserves up front until this process has seen real usage for the model; the difference is settled after.
+RATE_LIMIT_TABLE_NAME = os.environ.get("RATE_LIMIT_TABLE_NAME", "")
+GEMINI_RATE_LIMITS = {
+    "gemini-2.5-pro": {
+        "rpm": int(os.environ.get("GEMINI_PRO_RPM", "150")),
+        "tpm": int(os.environ.get("GEMINI_PRO_TPM", "2000000")),
+        "reserve_tokens": int(os.environ.get("GEMINI_PRO_RESERVE_TOKENS", "200000"))
+    },
+    "gemini-2.5-flash": {
+        "rpm": int(os.environ.get("GEMINI_FLASH_RPM", "1000")),
+        "tpm": int(os.environ.get("GEMINI_FLASH_TPM", "1000000")),
+        "reserve_tokens": int(os.environ.get("GEMINI_FLASH_RESERVE_TOKENS", "50000"))
+    },
+    "files": {"rpm": int(os.environ.get("GEMINI_FILES_RPM", "60"))},
+}
+# After a DynamoDB error the limiter uses the in-process bucket for this long, then tries the shared one again
+RATE_LIMIT_FALLBACK_SECONDS = float(os.environ.get("RATE_LIMIT_FALLBACK_SECONDS", "30"))
+# Fair-share weights by org_id, e.g. {"org-large": 1, "org-priority": 3}
+RATE_LIMIT_ORG_WEIGHTS = json.loads(os.environ.get("RATE_LIMIT_ORG_WEIGHTS", "{}"))
+RATE_LIMIT_DEFAULT_ORG_WEIGHT = float(os.environ.get("RATE_LIMIT_DEFAULT_ORG_WEIGHT", "1"))
 
 
 
@@ -552,3 +717,86 @@ REVISION_VIDEO_PROMPT_NO_REF = """
     // ... more segments follow ...
     ]
 """
+
+
+
+MAP_CANDIDATES_PROMPT = """
+    # ROLE
+    You are a Story Producer scouting raw footage for a **YouTube Short**. You are NOT writing the final edit yet; a second pass will sequence the moments you find.
+
+    # INPUT
+    You are given ONE raw video file (or one time window of it):
+    * **Source Video Index:** {source_video_index}
+    * **Source Video Name:** {source_video_name}
+    * **Window:** {window_start} to {window_end}
+
+    The edit brief the final Short must follow is below. Use it only to judge which moments matter; do NOT produce the EDL it describes.
+
+    --- EDIT BRIEF START ---
+    {edit_brief}
+    --- EDIT BRIEF END ---
+
+    # TASK
+    1. Watch the whole window and list every moment that could earn a place in the final Short (hooks, key statements, reactions, visually striking shots, payoffs, useful B-roll).
+    2. Prioritise moments the creator notes ask for.
+    3. Keep each moment tight (usually 1-8 seconds) and make sure the timestamps contain the complete action or sentence.
+    4. Report `start_time` and `end_time` relative to the start of the WINDOW ("HH:MM:SS", where 00:00:00 is {window_start} in the source video); they are shifted to source video time afterwards.
+    5. Return an empty `candidates` list if nothing in this window is usable.
+"""
+
+
+
+REDUCE_EDITS_PROMPT = """
+    # ROLE
+    You are the editor assembling the final **YouTube Short** from moments already scouted in the raw footage. You cannot watch the videos; the candidate list below is your only view of them.
+
+    # RULES
+    * Every segment in `all_edits` MUST come from a candidate below: keep its `source_video_index` and `source_video_name`, and keep `start_time`/`end_time` inside that candidate's range (you may trim it).
+    * `duration_seconds` must equal `end_time` minus `start_time`.
+    * Prefer higher `strength` candidates and respect each candidate's `suggested_role` when building the hook, body and payoff.
+    * Follow the edit brief below for pacing, length, style, vertical 9:16 adaptation and every other output field.
+
+    --- EDIT BRIEF START ---
+    {edit_brief}
+    --- EDIT BRIEF END ---
+
+    # CANDIDATE MOMENTS (JSON)
+    {candidates}
+"""
+
+
+
+REPAIR_SEGMENTS_PROMPT = """
+    # ROLE
+    You are the editor fixing a few broken segments in an otherwise finished **YouTube Short** Edit Decision List (EDL).
+
+    # CURRENT EDL (JSON)
+    {current_edl}
+
+    # SOURCE VIDEO LENGTHS
+    {video_durations}
+
+    # SEGMENTS TO REPLACE
+{problems}
+
+    # TASK
+    1. Watch the attached raw videos and write exactly {segment_count} replacement segment(s), in the order listed above.
+    2. Each replacement must fill the same place in the story as the segment it replaces, keep its `sequence_index`, and use footage that exists: `start_time` < `end_time` <= the source video length.
+    3. Do not reuse footage already used by the other segments of the current EDL.
+    4. Follow the edit brief below for every other field.
+
+    --- EDIT BRIEF START ---
+    {edit_brief}
+    --- EDIT BRIEF END ---
+"""
+
+
+
+CONTINUE_EDITS_PROMPT = """
+    # CONTINUATION
+    Your previous answer to the task above was cut off. The first {segment_count} segments below were received intact:
+
+    {produced_edits}
+
+    Continue the SAME Edit Decision List from `sequence_index` {next_index}. Return ONLY the remaining segments in `all_edits`, following every rule above and without repeating footage already used. If the list above is already the complete EDL, return an empty `all_edits` list.
+"""
@@ -0,0 +1,69 @@
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable
+
+import constants
+from exceptions import DeadlineExceededError
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+class Deadline:
+    """
+    Absolute time limit (time.monotonic) for the job or one of its stages.
+    A stage deadline is the earlier of its own budget (constants.STAGE_BUDGET_SECONDS) and its parent's.
+    """
+
+    def __init__(self, seconds: float, stage: str = "job", at: float | None = None):
+        self.stage = stage
+        self.at = at if at is not None else time.monotonic() + seconds
+
+    def remaining(self) -> float:
+        return max(0.0, self.at - time.monotonic())
+
+    @property
+    def expired(self) -> bool:
+        return time.monotonic() >= self.at
+
+    def child(self, stage: str, seconds: float | None = None) -> "Deadline":
+        budget = seconds if seconds is not None else constants.STAGE_BUDGET_SECONDS.get(stage)
+        at = self.at if not budget else min(self.at, time.monotonic() + budget)
+        return Deadline(0, stage=stage, at=at)
+
+    def check(self) -> None:
+        if self.expired:
+            raise DeadlineExceededError(self.stage)
+
+    async def run(self, awaitable: Awaitable[Any]) -> Any:
+        """Awaits `awaitable`, cancelling it and raising DeadlineExceededError when the deadline passes."""
+        if self.expired:
+            if asyncio.iscoroutine(awaitable):
+                awaitable.close()
+            raise DeadlineExceededError(self.stage)
+        try:
+            return await asyncio.wait_for(awaitable, self.remaining())
+        except asyncio.TimeoutError:
+            if not self.expired:
+                raise
+            logger.error(f"Stage '{self.stage}' ran out of time.")
+            raise DeadlineExceededError(self.stage) from None
+
+
+def stage_deadline(deadline: Deadline | None, stage: str) -> Deadline | None:
+    return deadline.child(stage) if deadline is not None else None
+
+
+async def run_stage(deadline: Deadline | None, stage: str, awaitable: Awaitable[Any]) -> Any:
+    """Awaits `awaitable` within the `stage` budget of `deadline` (no limit when deadline is None)."""
+    if deadline is None:
+        return await awaitable
+    return await deadline.child(stage).run(awaitable)
+
+
+async def within(deadline: Deadline | None, awaitable: Awaitable[Any]) -> Any:
+    """Awaits `awaitable` bounded by `deadline` itself (no limit when deadline is None)."""
+    if deadline is None:
+        return await awaitable
+    return await deadline.run(awaitable)
@@ -0,0 +1,139 @@
+import json
+import logging
+import re
+from typing import Any, Dict, List
+
+from pydantic import ValidationError
+
+from schemas import EDIT_ADAPTER, EDIT_LIST_ADAPTER, EditSchema
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+class EditStreamParser:
+    """
+    Incrementally extracts complete objects from the `all_edits` array of a JSON document
+    that arrives in pieces (streamed model output). Each call to feed() returns the objects
+    that were completed by the new text.
+    """
+
+    def __init__(self, array_key: str | None = "all_edits"):
+        # array_key=None reads a bare top-level array
+        if array_key is None:
+            self._array_start = re.compile(r'\[')
+        else:
+            self._array_start = re.compile(r'"%s"\s*:\s*\[' % re.escape(array_key))
+        self._buffer = ""
+        self._pos = 0
+        self._in_array = False
+        self._array_closed = False
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._object_start = None
+        self.objects_found = 0
+
+    @property
+    def finished(self) -> bool:
+        """True once the closing bracket of the array has been seen."""
+        return self._array_closed
+
+    @property
+    def pending_text(self) -> str:
+        """The text of the object currently being received, if any."""
+        if self._object_start is None:
+            return ""
+        return self._buffer[self._object_start:]
+
+    def feed(self, text: str) -> List[Dict[str, Any]]:
+        self._buffer += text
+        completed = []
+
+        while self._pos < len(self._buffer) and not self._array_closed:
+            if not self._in_array:
+                match = self._array_start.search(self._buffer)
+                if not match:
+                    break
+                self._in_array = True
+                self._pos = match.end()
+                continue
+
+            char = self._buffer[self._pos]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char in "{[":
+                if self._depth == 0 and char == "{":
+                    self._object_start = self._pos
+                self._depth += 1
+            elif char in "}]":
+                if self._depth == 0:
+                    # Closing bracket of all_edits itself
+                    self._array_closed = True
+                    break
+                self._depth -= 1
+                if self._depth == 0 and self._object_start is not None:
+                    raw_object = self._buffer[self._object_start:self._pos + 1]
+                    self._object_start = None
+                    parsed = _loads_lenient(raw_object)
+                    if parsed is None:
+                        logger.warning(f"Skipping malformed edit object: {raw_object[:80]}...")
+                    else:
+                        completed.append(parsed)
+                        self.objects_found += 1
+            self._pos += 1
+
+        return completed
+
+
+_TRAILING_COMMA = re.compile(r",\s*([}\]])")
+_LINE_COMMENT = re.compile(r"^\s*//.*$", re.M)
+
+
+def _loads_lenient(raw: str) -> Any:
+    """json.loads, retried once with trailing commas and // comment lines removed."""
+    try:
+        return json.loads(raw)
+    except json.JSONDecodeError:
+        pass
+    try:
+        return json.loads(_TRAILING_COMMA.sub(r"\1", _LINE_COMMENT.sub("", raw)))
+    except json.JSONDecodeError:
+        return None
+
+
+def salvage_edits(text: str) -> List[EditSchema]:
+    """
+    Recovers every complete, valid EditSchema entry from a truncated or slightly malformed
+    RawVideoResponseSchema response (markdown fences, trailing commas, cut-off tail, bare array).
+    """
+    if not text:
+        return []
+
+    parser = EditStreamParser()
+    objects = parser.feed(text)
+    if not objects and not parser.finished:
+        parser = EditStreamParser(array_key=None)
+        objects = parser.feed(text)
+    if not objects:
+        return []
+
+    try:
+        return EDIT_LIST_ADAPTER.validate_python(objects)
+    except ValidationError:
+        pass
+
+    salvaged = []
+    for obj in objects:
+        try:
+            salvaged.append(EDIT_ADAPTER.validate_python(obj))
+        except ValidationError as e:
+            logger.warning(f"Dropping salvaged edit that fails validation: {e.errors()[:1]}")
+    return salvaged
@@ -0,0 +1,132 @@
+import logging
+from datetime import timedelta
+from pathlib import Path
+from typing import Any, Dict, List
+
+import constants
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+def _name_key(name: str | None) -> str:
+    return Path(str(name or "")).name.strip().casefold()
+
+
+def whole_seconds(value: timedelta) -> int:
+    """Rounds a timestamp to the whole seconds of the HH:MM:SS output (the one rounding rule for EDL times)."""
+    return int(round(value.total_seconds()))
+
+
+def _free_spans(start: int, end: int, taken: List[tuple]) -> List[tuple]:
+    """Parts of [start, end) not covered by any of the `taken` spans."""
+    spans = []
+    cursor = start
+    for other_start, other_end in sorted(taken):
+        if other_end <= cursor or other_start >= end:
+            continue
+        if other_start > cursor:
+            spans.append((cursor, other_start))
+        cursor = max(cursor, other_end)
+    if cursor < end:
+        spans.append((cursor, end))
+    return spans
+
+
+def validate_and_repair_edits(
+    all_edits: List[Dict[str, Any]],
+    video_names: List[str],
+    video_durations: List[float | None]
+) -> tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """
+    Checks every segment of a generated EDL against the real clips and fixes what can be fixed locally:
+    source index/name remapping, swapped start/end, clamping to the measured clip length, overlaps
+    with other segments of the same clip, duration_seconds and sequence order.
+
+    Works column-wise over the whole EDL (one pass per rule), in whole seconds. Edits keep timedelta start/end times.
+    Returns (repaired edits in sequence order, problems) where each problem is
+    {"position", "reason"} for a segment that needs the model to regenerate it.
+    """
+    min_seconds = constants.EDL_MIN_SEGMENT_SECONDS
+    edits = [dict(edit) for edit in sorted(all_edits, key=lambda e: e.get("sequence_index") or 0)]
+    count = len(edits)
+    names_by_key = {_name_key(name): i for i, name in enumerate(video_names)}
+    fixes = {"source": 0, "swapped": 0, "clamped": 0, "overlap": 0, "duration": 0, "order": 0}
+    problems: Dict[int, str] = {}
+
+    # Columns
+    sources = [edit.get("source_video_index") for edit in edits]
+    starts = [whole_seconds(edit["start_time"]) for edit in edits]
+    ends = [whole_seconds(edit["end_time"]) for edit in edits]
+
+    # 1. Source clip: the file name wins over the index, then the name is rewritten from the index
+    for i in range(count):
+        by_name = names_by_key.get(_name_key(edits[i].get("source_video_name")))
+        if by_name is not None:
+            sources[i] = by_name + 1
+        elif not (isinstance(sources[i], int) and 1 <= sources[i] <= len(video_names)):
+            problems[i] = f"source_video_index {sources[i]} / source_video_name '{edits[i].get('source_video_name')}' match no uploaded video"
+
+    # 2. Swapped bounds
+    for i in range(count):
+        if ends[i] < starts[i]:
+            starts[i], ends[i] = ends[i], starts[i]
+            fixes["swapped"] += 1
+
+    # 3. Clamp to the measured clip length
+    for i in range(count):
+        if i in problems:
+            continue
+        duration = video_durations[sources[i] - 1] if sources[i] - 1 < len(video_durations) else None
+        if starts[i] < 0:
+            starts[i] = 0
+            fixes["clamped"] += 1
+        if duration:
+            if starts[i] >= duration - min_seconds:
+                problems[i] = f"starts at {starts[i]:.0f}s but source video {sources[i]} is only {duration:.0f}s long"
+                continue
+            if ends[i] > duration:
+                ends[i] = int(duration)
+                fixes["clamped"] += 1
+
+    # 4. Overlaps with earlier segments of the same clip: keep the longest part no earlier segment covers
+    taken: Dict[int, List[tuple]] = {}
+    for i in range(count):
+        if i in problems:
+            continue
+        free = _free_spans(starts[i], ends[i], taken.get(sources[i], []))
+        if not free and ends[i] > starts[i]:
+            problems[i] = f"repeats footage already used ({starts[i]}s-{ends[i]}s of source video {sources[i]})"
+            continue
+        longest = max(free, key=lambda span: span[1] - span[0], default=(starts[i], ends[i]))
+        if longest != (starts[i], ends[i]):
+            starts[i], ends[i] = longest
+            fixes["overlap"] += 1
+        if ends[i] - starts[i] < min_seconds:
+            problems[i] = f"is shorter than {min_seconds}s after trimming"
+        else:
+            taken.setdefault(sources[i], []).append((starts[i], ends[i]))
+
+    # 5. Write the columns back, recompute durations and renumber the sequence
+    for i, edit in enumerate(edits):
+        duration_seconds = ends[i] - starts[i]
+        source_name = edit.get("source_video_name")
+        if isinstance(sources[i], int) and 1 <= sources[i] <= len(video_names):
+            source_name = Path(video_names[sources[i] - 1]).name
+        if edit.get("source_video_index") != sources[i] or edit.get("source_video_name") != source_name:
+            fixes["source"] += 1
+        if edit.get("duration_seconds") != duration_seconds:
+            fixes["duration"] += 1
+        if edit.get("sequence_index") != i + 1:
+            fixes["order"] += 1
+        edit.update({
+            "sequence_index": i + 1,
+            "source_video_index": sources[i],
+            "start_time": timedelta(seconds=starts[i]),
+            "end_time": timedelta(seconds=ends[i]),
+            "source_video_name": source_name,
+            "duration_seconds": duration_seconds
+        })
+
+    logger.info(f"EDL validation: {count} segments, fixes={fixes}, unrepairable={len(problems)}")
+    return edits, [{"position": i, "reason": reason} for i, reason in sorted(problems.items())]
@@ -9,17 +9,37 @@ logger = logging.getLogger(__name__)
 import asyncio
 import os
 import re
-from googleapiclient.discovery import build
 from datetime import timedelta
 import constants
+from schemas import CandidateMomentsSchema, EDIT_LIST_ADAPTER
+from edl_stream import EditStreamParser, salvage_edits
+from types import SimpleNamespace
+from model_router import hedged_call
+from rate_limiter import gemini_slot
+from retry_policy import get_retry_policy
+from deadline import Deadline, stage_deadline, within
+from cancellation import raise_if_cancelled
+from exceptions import DeadlineExceededError, JobCancelledError
+from json_codec import prompt_json
+from config_provider import get_config
 
 from google import genai
 from google.genai import types
 from google.api_core import exceptions as core_exceptions
-from googleapiclient.errors import HttpError
-from googleapiclient.discovery import build
 
-youtube_api=constants.YOUTUBE_API_KEY
+
+GEMINI_RETRY = get_retry_policy("gemini")
+GEMINI_UPLOAD_RETRY = get_retry_policy("gemini_upload")
+YOUTUBE_RETRY = get_retry_policy("youtube")
+
+
+class EdlTruncatedError(ValueError):
+    """Raised when an edit list is still truncated after MAX_EDL_CONTINUATIONS continuations."""
+    pass
+
+
+# Model output that fails the schema (or stays truncated) is worth another attempt; the API itself answered fine
+MODEL_OUTPUT_ERRORS = (ValidationError, json.JSONDecodeError, EdlTruncatedError)
 
 
 def _get_video_id(url: str) -> str | None:
@@ -57,18 +77,21 @@ def _parse_iso8601_duration(duration_string: str) -> int:
         raise
 
 
-async def youtube_video_exists(url: str,video_id:str) -> int|bool:
+async def youtube_video_exists(url: str,video_id:str,deadline:Deadline|None=None) -> int|bool:
     """Checks if a YouTube video exists using the YouTube Data API v3."""
     if not video_id:
         return False
-    api_key = youtube_api
+    # googleapiclient is only needed for reference videos, so it is imported on first use
+    from googleapiclient.discovery import build
+    from googleapiclient.errors import HttpError
+    api_key = get_config("YOUTUBE_API_KEY")
     if not api_key:
         logger.error("YOUTUBE_API_KEY environment variable not set.")
         return False
     try:
         youtube = build('youtube', 'v3', developerKey=api_key)
         request = youtube.videos().list(part="id", id=video_id)
-        response = await asyncio.to_thread(request.execute)
+        response = await YOUTUBE_RETRY.run(lambda: asyncio.to_thread(request.execute), label="YouTube videos.list", deadline=deadline)
         if response.get('items'):
             return True
         else:
@@ -81,12 +104,13 @@ async def youtube_video_exists(url: str,video_id:str) -> int|bool:
         return False
 
 
-async def _get_youtube_video_duration(video_id: str) -> int | None:
+async def _get_youtube_video_duration(video_id: str, deadline: Deadline | None = None) -> int | None:
     """Fetches video duration from the YouTube Data API."""
+    from googleapiclient.discovery import build
     try:
-        youtube = build('youtube', 'v3', developerKey=youtube_api)
+        youtube = build('youtube', 'v3', developerKey=get_config("YOUTUBE_API_KEY"))
         request = youtube.videos().list(part="contentDetails", id=video_id)
-        response = await asyncio.to_thread(request.execute)
+        response = await YOUTUBE_RETRY.run(lambda: asyncio.to_thread(request.execute), label="YouTube videos.list", deadline=deadline)
         if not response.get("items"):
             logger.error(f"Error: Video with ID '{video_id}' not found.")
             raise
@@ -108,6 +132,7 @@ async def _wait_for_files_active(client, files: List[Any]):
         
         # Safety timeout loop (max 60s per file)
         for _ in range(12):
+            raise_if_cancelled()
             try:
                 # Poll file status
                 file = await client.files.get(name=file_id)
@@ -123,23 +148,26 @@ async def _wait_for_files_active(client, files: List[Any]):
                 logger.warning(f"Error checking file status for {file_id}: {e}")
                 await asyncio.sleep(2)
 
-async def gemini_video_understanding_with_youtube_and_schema(youtube_url:str,schema:Type[BaseModel],prompt:str)->Dict[Any,Any]|str|int:
+async def gemini_video_understanding_with_youtube_and_schema(youtube_url:str,schema:Type[BaseModel],prompt:str,split_video:bool|None=None,deadline:Deadline|None=None)->Dict[Any,Any]|str|int:
     """
     Analyzes a YouTube video using the Gemini model.
+    `split_video` comes from the job planner; when it is None the video is sized with count_tokens.
+    Every call is bounded by `deadline` and retries that cannot finish before it are skipped.
     """
     client = None
     async_client = None
     
     try:
-        client = genai.Client(api_key=constants.GEMINI_API_KEY)
+        client = genai.Client(api_key=get_config("GEMINI_API_KEY"))
         async_client = client.aio
         
         async def _count_tokens(url: str) -> int:
             try:
-                token_count_response = await async_client.models.count_tokens(
-                    model='gemini-2.5-flash',
-                    contents=types.Content(parts=[types.Part(file_data=types.FileData(file_uri=url))]),
-                )
+                async with gemini_slot('gemini-2.5-flash', tokens=0):
+                    token_count_response = await within(deadline, async_client.models.count_tokens(
+                        model='gemini-2.5-flash',
+                        contents=types.Content(parts=[types.Part(file_data=types.FileData(file_uri=url))]),
+                    ))
                 return token_count_response.total_tokens
             except core_exceptions.InvalidArgument:
                 logger.info("Video size exceeds token counting limits, proceeding with chunking.")
@@ -154,88 +182,89 @@ async def gemini_video_understanding_with_youtube_and_schema(youtube_url:str,sch
             logger.error("user has passed an invalid url as video id does not exists.")
             return -1
 
-        exists= await youtube_video_exists(url=youtube_url,video_id=video_id)
+        exists= await youtube_video_exists(url=youtube_url,video_id=video_id,deadline=deadline)
         if not exists:
             logger.error("The passed video does not exist in youtube.")
             return -2
 
-        token_count = await _count_tokens(youtube_url)
-        if token_count != -1 and token_count < 1500000:
+        if split_video is None:
+            token_count = await _count_tokens(youtube_url)
+            single_call = token_count != -1 and token_count < constants.REF_SINGLE_CALL_TOKEN_LIMIT
+        else:
+            single_call = not split_video
+
+        if single_call:
             logger.info("Video is small enough to be processed in a single call.")
-            MAX_RETRIES = 3
-            delay = 3
-            for attempt in range(MAX_RETRIES):
-                try:
-                    logger.info(f"Attempt number: {attempt + 1}")
-                    config = types.GenerateContentConfig(response_mime_type="application/json", response_schema=schema, temperature=0.4)
-                    response = await async_client.models.generate_content(
-                        model='gemini-2.5-pro',
-                        contents=types.Content(
-                            parts=[
-                                types.Part(file_data=types.FileData(file_uri=youtube_url)),
-                                types.Part(text=prompt)
-                            ]
-                        ),
-                        config=config
-                    )
-                    return schema.model_validate_json(response.text).model_dump().get("explanation","")
-                except (ValidationError, json.JSONDecodeError) as e:
-                    logger.warning(f"Attempt {attempt + 1} failed validation. Error: {e}")
-                except Exception as e:
-                    logger.error(f"Attempt {attempt + 1} failed with error: {e}")
+            config = types.GenerateContentConfig(response_mime_type="application/json", response_schema=schema, temperature=constants.GEMINI_TEMPERATURE)
 
-                if attempt < MAX_RETRIES - 1:
-                    logger.info(f"Waiting {delay} seconds before next retry...")
-                    await asyncio.sleep(delay)
-                    delay *= 2
-                else:
-                    logger.error("Exceeded the maximum limit of retries for single-call processing.")
-                    raise
+            async def _summarize(model: str, is_primary: bool) -> str:
+                response = await _generate_content(
+                    async_client,
+                    model=model,
+                    contents=types.Content(
+                        parts=[
+                            types.Part(file_data=types.FileData(file_uri=youtube_url)),
+                            types.Part(text=prompt)
+                        ]
+                    ),
+                    config=config
+                )
+                return schema.model_validate_json(response.text).model_dump().get("explanation","")
+
+            return await GEMINI_RETRY.run(
+                lambda: hedged_call("reference_summary", _summarize),
+                retry_on=MODEL_OUTPUT_ERRORS,
+                label="Reference summary",
+                deadline=deadline
+            )
         else:
             logger.info("Video is large, processing in concurrent chunks.")
             video_id = _get_video_id(youtube_url)
             if not video_id:
                 raise ValueError("Could not extract video ID from the YouTube URL.")
-            duration = await _get_youtube_video_duration(video_id=video_id)
-            config = types.GenerateContentConfig(response_mime_type="application/json", response_schema=schema, temperature=0.4)
+            duration = await _get_youtube_video_duration(video_id=video_id, deadline=deadline)
+            config = types.GenerateContentConfig(response_mime_type="application/json", response_schema=schema, temperature=constants.GEMINI_TEMPERATURE)
             chunk_duration_seconds = 1800  # 30 minutes
 
             async def _process_chunk_with_retry(start_time: int, end_time: int) -> str:
-                MAX_RETRIES_CHUNK = 3
-                delay_chunk = 3
                 start_offset_str = f"{start_time}s"
                 end_offset_str = f"{end_time}s"
+                logger.info(f"Processing chunk {start_offset_str}-{end_offset_str}")
 
-                for attempt in range(MAX_RETRIES_CHUNK):
-                    try:
-                        logger.info(f"Processing chunk {start_offset_str}-{end_offset_str}, attempt {attempt + 1}")
-                        response = await async_client.models.generate_content(
-                            model='gemini-2.5-pro',
-                            contents=types.Content(
-                                parts=[
-                                    types.Part(
-                                        file_data=types.FileData(file_uri=youtube_url),
-                                        video_metadata=types.VideoMetadata(
-                                            start_offset=start_offset_str,
-                                            end_offset=end_offset_str
-                                        )
-                                    ),
-                                    types.Part(text=prompt)
-                                ]
-                            ),
-                            config=config
-                        )
-                        response_data = schema.model_validate_json(response.text).model_dump()
-                        return response_data.get("explanation", "")
-                    except (ValidationError, json.JSONDecodeError, asyncio.TimeoutError, Exception) as e:
-                        logger.warning(f"Chunk {start_offset_str}-{end_offset_str} attempt {attempt + 1} failed: {e}")
-                        if attempt < MAX_RETRIES_CHUNK - 1:
-                            await asyncio.sleep(delay_chunk)
-                            delay_chunk *= 2
-                        else:
-                            logger.error(f"Chunk {start_offset_str}-{end_offset_str} failed after all retries.")
-                            return ""  
-                return ""
+                async def _summarize_chunk(model: str, is_primary: bool) -> str:
+                    response = await _generate_content(
+                        async_client,
+                        model=model,
+                        contents=types.Content(
+                            parts=[
+                                types.Part(
+                                    file_data=types.FileData(file_uri=youtube_url),
+                                    video_metadata=types.VideoMetadata(
+                                        start_offset=start_offset_str,
+                                        end_offset=end_offset_str
+                                    )
+                                ),
+                                types.Part(text=prompt)
+                            ]
+                        ),
+                        config=config
+                    )
+                    response_data = schema.model_validate_json(response.text).model_dump()
+                    return response_data.get("explanation", "")
+
+                try:
+                    return await GEMINI_RETRY.run(
+                        lambda: hedged_call("reference_summary", _summarize_chunk),
+                        retry_on=MODEL_OUTPUT_ERRORS,
+                        label=f"Reference chunk {start_offset_str}-{end_offset_str}",
+                        deadline=deadline
+                    )
+                except (DeadlineExceededError, JobCancelledError):
+                    # The job ends here; an empty chunk would hide the failed stage
+                    raise
+                except Exception as e:
+                    logger.error(f"Chunk {start_offset_str}-{end_offset_str} failed: {e}")
+                    return ""
 
             tasks = []
             for start_time in range(0, duration, chunk_duration_seconds):
@@ -269,169 +298,364 @@ async def gemini_video_understanding_with_youtube_and_schema(youtube_url:str,sch
         await asyncio.sleep(0.25)
 
 
+def _media_resolution(media_resolution: str | None):
+    """Maps the planner's media resolution ("low"/"medium"/"default") to the Gemini enum."""
+    if media_resolution == "low":
+        return types.MediaResolution.MEDIA_RESOLUTION_LOW
+    if media_resolution == "medium":
+        return types.MediaResolution.MEDIA_RESOLUTION_MEDIUM
+    return None
+
+
+def _with_fps(file_parts: List[Any], fps: float | None) -> List[Any]:
+    """Returns the video parts sampled at `fps` (Gemini default is 1 fps)."""
+    if not fps:
+        return list(file_parts)
+    return [
+        types.Part(file_data=part.file_data, video_metadata=types.VideoMetadata(fps=fps))
+        for part in file_parts
+    ]
+
+
+def _new_usage() -> Dict[str, int]:
+    return {"input_tokens": 0, "output_tokens": 0, "raw_edit_input_tokens": 0, "raw_edit_output_tokens": 0}
+
+
+def _add_usage(usage: Dict[str, int], response: Any, raw_edit: bool = False) -> Dict[str, int]:
+    """
+    Adds a response's token usage (prompt / output) to a running total. `raw_edit` marks the calls the
+    planner's raw-edit estimate covers (the generation call, or the map and reduce calls), which are also
+    counted under raw_edit_*; continuations and repairs only add to the totals.
+    """
+    metadata = getattr(response, "usage_metadata", None)
+    input_tokens = getattr(metadata, "prompt_token_count", 0) or 0
+    output_tokens = getattr(metadata, "candidates_token_count", 0) or 0
+    usage = {**usage, "input_tokens": usage["input_tokens"] + input_tokens, "output_tokens": usage["output_tokens"] + output_tokens}
+    if raw_edit:
+        usage["raw_edit_input_tokens"] = usage.get("raw_edit_input_tokens", 0) + input_tokens
+        usage["raw_edit_output_tokens"] = usage.get("raw_edit_output_tokens", 0) + output_tokens
+    return usage
+
+
+async def _generate_content(async_client, **kwargs) -> Any:
+    """async_client.models.generate_content through the shared Gemini rate limiter."""
+    async with gemini_slot(kwargs["model"]) as slot:
+        response = await async_client.models.generate_content(**kwargs)
+        slot.record(response)
+        return response
+
+
+async def _stream_generate_content(async_client, model: str, contents: Any, config: Any, on_edits) -> SimpleNamespace:
+    """
+    Streams a generate_content call and hands every completed `all_edits` entry to
+    `on_edits(batch, replace)` in batches of STREAM_BATCH_SIZE. `replace` is True for the
+    first batch of the call so a retried attempt overwrites the previous attempt's partial edits.
+    Returns an object with the full `text` and the final `usage_metadata`, like a regular response.
+    """
+    parser = EditStreamParser()
+    text_chunks = []
+    batch = []
+    usage_metadata = None
+    first_batch = True
+
+    async def _emit(edits, replace):
+        try:
+            await on_edits(edits, replace)
+        except Exception as e:
+            logger.warning(f"Failed to publish {len(edits)} streamed edits: {e}")
+
+    async with gemini_slot(model) as slot:
+        stream = await async_client.models.generate_content_stream(model=model, contents=contents, config=config)
+        async for chunk in stream:
+            if getattr(chunk, "usage_metadata", None):
+                usage_metadata = chunk.usage_metadata
+            text = chunk.text or ""
+            text_chunks.append(text)
+            batch.extend(parser.feed(text))
+            if len(batch) >= constants.STREAM_BATCH_SIZE:
+                await _emit(batch, first_batch)
+                first_batch = False
+                batch = []
+        slot.record(SimpleNamespace(usage_metadata=usage_metadata))
+
+    if batch:
+        await _emit(batch, first_batch)
+    logger.info(f"Stream finished with {parser.objects_found} edits.")
+    return SimpleNamespace(text="".join(text_chunks), usage_metadata=usage_metadata)
+
+
+async def _salvage_and_continue(
+    async_client,
+    model_name: str,
+    contents: List[Any],
+    config: Any,
+    schema: Type[BaseModel],
+    response_text: str,
+    usage: Dict[str, int],
+    deadline: Deadline | None = None
+) -> tuple[Dict[str, Any], Dict[str, int]]:
+    """
+    Recovers the complete `all_edits` entries from a truncated or slightly malformed response and
+    asks the model only for a continuation after the last good segment (up to MAX_EDL_CONTINUATIONS),
+    each within `deadline`.
+    Re-raises the original validation error when nothing can be salvaged, and raises EdlTruncatedError when
+    the list is still cut off after the last continuation, so a partial EDL is never returned as complete.
+    """
+    salvaged = salvage_edits(response_text) if "all_edits" in schema.model_fields else []
+    if not salvaged:
+        schema.model_validate_json(response_text)  # nothing to keep: surface the original error
+    logger.info(f"Salvaged {len(salvaged)} complete segments from an invalid response; requesting continuation.")
+
+    for continuation in range(constants.MAX_EDL_CONTINUATIONS):
+        produced = [
+            {
+                **edit.model_dump(),
+                "start_time": _seconds_to_hms(edit.start_time.total_seconds()),
+                "end_time": _seconds_to_hms(edit.end_time.total_seconds())
+            }
+            for edit in salvaged
+        ]
+        continuation_prompt = constants.CONTINUE_EDITS_PROMPT.format(
+            segment_count=len(salvaged),
+            next_index=len(salvaged) + 1,
+            produced_edits=prompt_json(produced)
+        )
+        response = await within(deadline, _generate_content(
+            async_client,
+            model=model_name,
+            contents=list(contents) + [types.Part(text=continuation_prompt)],
+            config=config
+        ))
+        usage = _add_usage(usage, response)
+
+        try:
+            remaining = EDIT_LIST_ADAPTER.validate_python(
+                schema.model_validate_json(response.text).model_dump()["all_edits"]
+            )
+            truncated = False
+        except (ValidationError, json.JSONDecodeError):
+            remaining = salvage_edits(response.text)
+            truncated = True
+
+        for offset, edit in enumerate(remaining):
+            edit.sequence_index = len(salvaged) + offset + 1
+        salvaged.extend(remaining)
+        logger.info(f"Continuation {continuation + 1} added {len(remaining)} segments.")
+        if not truncated:
+            return {"all_edits": [edit.model_dump() for edit in salvaged]}, usage
+        if not remaining:
+            break
+
+    logger.warning(f"Edit list is still truncated after {len(salvaged)} segments (MAX_EDL_CONTINUATIONS={constants.MAX_EDL_CONTINUATIONS}).")
+    raise EdlTruncatedError(f"Edit list still truncated after {len(salvaged)} segments")
+
+
+async def gemini_files_active(file_names: List[str]) -> bool:
+    """True when every named Gemini file still exists and is ACTIVE (uploads expire after 48 hours)."""
+    if not file_names:
+        return False
+    client = genai.Client(api_key=get_config("GEMINI_API_KEY"))
+    try:
+        files = await asyncio.gather(*[client.aio.files.get(name=name) for name in file_names])
+        return all(file.state.name == "ACTIVE" for file in files)
+    except Exception as e:
+        logger.info(f"Stored Gemini files are no longer usable: {e}")
+        return False
+    finally:
+        try:
+            if hasattr(client.aio, 'close'):
+                await client.aio.close()
+            client.close()
+        except Exception as e:
+            logger.debug(f"Client close error (ignored): {e}")
+
+
+async def _prepare_raw_video_parts(
+    client,
+    async_client,
+    video_list: list[str],
+    old_file_variables: list,
+    existing_file_names: List[str] = None,
+    deadline: Deadline | None = None
+) -> tuple[list, list, list]:
+    """
+    Reuses still-valid Gemini uploads or uploads the local videos (within the "upload" stage budget).
+    Returns (file Part objects, Gemini file names, file URIs) in video order.
+    """
+    upload_deadline = stage_deadline(deadline, "upload")
+    uploaded_file_names = []
+    files_variables = [] # This will hold ONLY types.Part objects now
+    saving_uris=[]
+
+    # ==========================================
+    # 1. HANDLE EXISTING FILES
+    # ==========================================
+    if existing_file_names:
+        logger.info(f"Found {len(existing_file_names)} existing Gemini files. Verifying availability...")
+
+        valid_files = []
+        for fname in existing_file_names:
+            try:
+                await async_client.files.get(name=fname)
+                valid_files.append(fname)
+            except Exception as e:
+                logger.warning(f"File {fname} expired or not found: {e}")
+
+        if len(valid_files) == len(existing_file_names):
+            logger.info("All existing files verified. Skipping upload.")
+            uploaded_file_names = valid_files 
+
+            # STRICT TYPE ENFORCEMENT: Create Part objects
+            files_variables =[]
+            for uri in old_file_variables:
+                part_obj = types.Part(
+                        file_data=types.FileData(
+                            file_uri=uri,
+                            mime_type="video/mp4"
+                        )
+                    )
+                files_variables.append(part_obj)
+            saving_uris=old_file_variables
+
+        else:
+            logger.warning("Some files expired. Re-uploading videos...")
+            existing_file_names = None
+
+    # ==========================================
+    # 2. HANDLE NEW UPLOADS
+    # ==========================================
+    if not existing_file_names:
+        logger.info(f"Starting upload for {len(video_list)} files...")
+        files_to_wait_for = []
+
+        for video_file_path in video_list:
+            if not os.path.exists(video_file_path):
+                    raise FileNotFoundError(f"Input video file not found: {video_file_path}")
+
+            logger.debug(f"Uploading: {video_file_path}")
+
+            async def _upload(path: str = video_file_path):
+                # Sync upload
+                async with gemini_slot("files"):
+                    return await asyncio.to_thread(client.files.upload, file=path)
+
+            # Network errors (httpx ReadError / ConnectError / RemoteProtocolError) and 429/5xx are retried
+            video_variable = await GEMINI_UPLOAD_RETRY.run(_upload, label=f"Upload {video_file_path}", deadline=upload_deadline)
+
+            # FIX: Do NOT add the video_variable directly.
+            # Create a clean Part object using the URI.
+            part_obj = types.Part(
+                file_data=types.FileData(
+                    file_uri=video_variable.uri,
+                    mime_type=video_variable.mime_type # Use the mime type detected during upload
+                )
+            )
+
+            files_variables.append(part_obj)
+            logger.info(f"file variables:{files_variables}")
+            saving_uris.append(video_variable.uri)
+            uploaded_file_names.append(video_variable.name)
+            files_to_wait_for.append(video_variable)
+
+            logger.info(f"Successfully uploaded {video_file_path}")
+
+        logger.info("All files uploaded successfully.")
+
+        # CRITICAL FIX: Wait for processing
+        await within(upload_deadline, _wait_for_files_active(async_client, files_to_wait_for))
+
+    return files_variables, uploaded_file_names, saving_uris
+
+
 async def gemini_raw_edits_direct_video(
     video_list: list[str],
     schema: Type[BaseModel],
     prompt: str,
     old_file_variables:list,
-    existing_file_names: List[str] = None
+    existing_file_names: List[str] = None,
+    model_name: str | None = None,
+    media_resolution: str | None = None,
+    fps: float | None = None,
+    on_edits = None,
+    route: str = "raw_edits",
+    deadline: Deadline | None = None,
+    on_files_ready = None
 ) -> dict[Any,Any]:
 
     uploaded_file_names = []
-    files_variables = [] # This will hold ONLY types.Part objects now
     saving_uris=[]
     final_result = None
+    usage = _new_usage()
     error_occurred = None 
-    model_name = 'gemini-2.5-pro'
-    temperature = 0.4
+    temperature = constants.GEMINI_TEMPERATURE
     
     client = None
     async_client = None
 
     try:
-        client = genai.Client(api_key=constants.GEMINI_API_KEY)
+        client = genai.Client(api_key=get_config("GEMINI_API_KEY"))
         async_client = client.aio 
         
         try:
             # ==========================================
-            # 1. HANDLE EXISTING FILES
+            # 1-2. REUSE EXISTING FILES OR UPLOAD
             # ==========================================
-            if existing_file_names:
-                logger.info(f"Found {len(existing_file_names)} existing Gemini files. Verifying availability...")
-                
-                valid_files = []
-                for fname in existing_file_names:
-                    try:
-                        await async_client.files.get(name=fname)
-                        valid_files.append(fname)
-                    except Exception as e:
-                        logger.warning(f"File {fname} expired or not found: {e}")
-                
-                if len(valid_files) == len(existing_file_names):
-                    logger.info("All existing files verified. Skipping upload.")
-                    uploaded_file_names = valid_files 
-                    
-                    # STRICT TYPE ENFORCEMENT: Create Part objects
-                    files_variables =[]
-                    for uri in old_file_variables:
-                        part_obj = types.Part(
-                                file_data=types.FileData(
-                                    file_uri=uri,
-                                    mime_type="video/mp4"
-                                )
-                            )
-                        files_variables.append(part_obj)
-                    saving_uris=old_file_variables
-
-                else:
-                    logger.warning("Some files expired. Re-uploading videos...")
-                    existing_file_names = None
+            files_variables, uploaded_file_names, saving_uris = await _prepare_raw_video_parts(
+                client,
+                async_client,
+                video_list=video_list,
+                old_file_variables=old_file_variables,
+                existing_file_names=existing_file_names,
+                deadline=deadline
+            )
+            if on_files_ready:
+                await on_files_ready(uploaded_file_names, saving_uris)
 
-            # ==========================================
-            # 2. HANDLE NEW UPLOADS
-            # ==========================================
-            if not existing_file_names:
-                logger.info(f"Starting upload for {len(video_list)} files...")
-                MAX_UPLOAD_RETRIES = 3
-                files_to_wait_for = []
-
-                for video_file_path in video_list:
-                    if not os.path.exists(video_file_path):
-                            raise FileNotFoundError(f"Input video file not found: {video_file_path}")
-                    
-                    logger.debug(f"Uploading: {video_file_path}")
-                    
-                    for attempt in range(MAX_UPLOAD_RETRIES):
-                        try:
-                            # Sync upload
-                            video_variable = await asyncio.to_thread(client.files.upload, file=video_file_path)
-                            
-                            # FIX: Do NOT add the video_variable directly.
-                            # Create a clean Part object using the URI.
-                            part_obj = types.Part(
-                                file_data=types.FileData(
-                                    file_uri=video_variable.uri,
-                                    mime_type=video_variable.mime_type # Use the mime type detected during upload
-                                )
-                            )
-                            
-                            files_variables.append(part_obj)
-                            logger.info(f"file variables:{files_variables}")
-                            saving_uris.append(video_variable.uri)
-                            uploaded_file_names.append(video_variable.name)
-                            files_to_wait_for.append(video_variable)
-                            
-                            logger.info(f"Successfully uploaded {video_file_path} on attempt {attempt + 1}")
-                            break 
-
-                        except (httpx.ReadError, httpx.ConnectError, httpx.RemoteProtocolError) as e:
-                            logger.warning(f"Network error on upload attempt {attempt + 1}/{MAX_UPLOAD_RETRIES} for {video_file_path}: {e}")
-                            if attempt < MAX_UPLOAD_RETRIES - 1:
-                                await asyncio.sleep(2 * (attempt + 1))
-                            else:
-                                logger.error(f"Failed to upload {video_file_path} after {MAX_UPLOAD_RETRIES} attempts.")
-                                raise e 
-                
-                logger.info("All files uploaded successfully.")
-                
-                # CRITICAL FIX: Wait for processing
-                await _wait_for_files_active(async_client, files_to_wait_for)
-            
             if not error_occurred:
                 logger.info("Proceeding to content generation.")
                 config = types.GenerateContentConfig(
                     response_mime_type="application/json",
                     response_schema=schema, 
-                    temperature=temperature
+                    temperature=temperature,
+                    media_resolution=_media_resolution(media_resolution)
                 )
-                MAX_RETRIES_CHUNK = 3
-                delay_chunk = 10
-                
                 # STRICT TYPE ENFORCEMENT: Wrap text in Part too
                 text_part = types.Part(text=prompt)
-                contents_to_send = files_variables + [text_part] 
+                contents_to_send = _with_fps(files_variables, fps) + [text_part] 
 
-                for attempt in range(MAX_RETRIES_CHUNK):
-                    try:
-                        logger.info(f"Attempting content generation {attempt + 1}/{MAX_RETRIES_CHUNK}...")
-                        response = await async_client.models.generate_content(
-                            model=model_name,
+                async def _generate_once(model: str, is_primary: bool) -> tuple[Dict[str, Any], Dict[str, int]]:
+                    # Only the primary request streams partial edits; a hedge just races to the final answer
+                    if is_primary and on_edits and constants.STREAMING_ENABLED:
+                        response = await _stream_generate_content(async_client, model, contents_to_send, config, on_edits)
+                    else:
+                        response = await _generate_content(
+                            async_client,
+                            model=model,
                             contents=contents_to_send,
                             config=config
                         )
-                        logger.info(f"Received response on attempt {attempt + 1}.")
-                        response_dict = schema.model_validate_json(response.text).model_dump()
-                        logger.info(f"Successfully validated response on attempt {attempt + 1}.")
-                        final_result = response_dict
-                        error_occurred = None 
-                        break 
-
-                    except core_exceptions.InvalidArgument as e:
-                        logger.error(f"Invalid argument: {e}")
-                        error_occurred = e; break 
-                    except core_exceptions.PermissionDenied as e:
-                        logger.error(f"Invalid API Key: {e}")
-                        error_occurred = e; break 
-                    except core_exceptions.NotFound as e:
-                        logger.error(f"Model not found: {e}")
-                        error_occurred = e; break 
-
-                    except (ValidationError, json.JSONDecodeError) as e:
-                        logger.warning(f"Attempt {attempt + 1} validation error: {e}")
-                        error_occurred = e 
-                    except Exception as e:
-                        logger.error(f"Attempt {attempt + 1} failed: {e}")
-                        error_occurred = e 
-
-                    if attempt < MAX_RETRIES_CHUNK - 1:
-                        logger.info(f"Waiting {delay_chunk} seconds...")
-                        await asyncio.sleep(delay_chunk)
-                        delay_chunk *= 2
-                    else:
-                        logger.error(f"Failed after {MAX_RETRIES_CHUNK} retries.")
+                    logger.info(f"Received response from {model}.")
+                    call_usage = _add_usage(_new_usage(), response, raw_edit=True)
+                    try:
+                        return schema.model_validate_json(response.text).model_dump(), call_usage
+                    except (ValidationError, json.JSONDecodeError):
+                        # Keep the complete segments and ask only for the rest instead of regenerating
+                        return await _salvage_and_continue(
+                            async_client, model, contents_to_send, config, schema, response.text, call_usage, deadline
+                        )
 
-                if final_result is None and error_occurred is None:
-                    error_occurred = RuntimeError(f"Failed to generate content after {MAX_RETRIES_CHUNK} retries.")
+                # Fatal API errors (bad request, bad key, unknown model) are raised at once; 429/5xx and
+                # schema-invalid output are retried under the shared Gemini policy
+                try:
+                    final_result, usage = await GEMINI_RETRY.run(
+                        lambda: hedged_call(route, _generate_once, model_name),
+                        retry_on=MODEL_OUTPUT_ERRORS,
+                        label="Raw edit generation",
+                        deadline=deadline
+                    )
+                    logger.info("Successfully validated response.")
+                except Exception as e:
+                    error_occurred = e
 
         except Exception as e:
             logger.error(f"Error in upload/generation block: {e}")
@@ -472,13 +696,307 @@ async def gemini_raw_edits_direct_video(
             return {
                 "data": final_result,
                 "active_files": uploaded_file_names,
-                "files_variables":saving_uris
+                "files_variables":saving_uris,
+                "usage": usage
             }
     else:
             raise RuntimeError("Function finished unexpectedly.")
+
+
+def _seconds_to_hms(seconds: float) -> str:
+    """Formats a number of seconds as a zero-padded HH:MM:SS string."""
+    hours, remainder = divmod(int(seconds), 3600)
+    minutes, secs = divmod(remainder, 60)
+    return f"{hours:02}:{minutes:02}:{secs:02}"
+
+
+def _plan_map_windows(clip_count: int, video_durations: List[float | None] | None) -> List[tuple]:
+    """
+    Splits the clips into map units of (clip_index, start_seconds, end_seconds).
+    Clips without a known duration, or shorter than MAP_WINDOW_SECONDS, are one unit with no offsets.
+    """
+    window_seconds = max(60, constants.MAP_WINDOW_SECONDS)
+    windows = []
+    for clip_index in range(clip_count):
+        duration = None
+        if video_durations and clip_index < len(video_durations):
+            duration = video_durations[clip_index]
+
+        if not duration or duration <= window_seconds:
+            windows.append((clip_index, None, None))
+            continue
+
+        total = int(duration) + 1
+        for start in range(0, total, window_seconds):
+            windows.append((clip_index, start, min(start + window_seconds, total)))
+    return windows
+
+
+async def gemini_raw_edits_map_reduce(
+    video_list: list[str],
+    schema: Type[BaseModel],
+    prompt: str,
+    old_file_variables:list,
+    existing_file_names: List[str] = None,
+    video_durations: List[float | None] = None,
+    media_resolution: str | None = None,
+    on_edits = None,
+    deadline: Deadline | None = None,
+    on_files_ready = None
+) -> dict[Any,Any]:
+    """
+    Map-reduce variant of gemini_raw_edits_direct_video for projects with many or very long clips.
+    Map: every clip (or MAP_WINDOW_SECONDS window of a long clip) is scanned concurrently for candidate moments.
+    Reduce: one text-only call sequences the candidates into the final `all_edits`.
+    Returns the same {"data", "active_files", "files_variables"} payload as the direct path.
+    """
+    client = None
+    async_client = None
+    usage = _new_usage()
+
+    try:
+        client = genai.Client(api_key=get_config("GEMINI_API_KEY"))
+        async_client = client.aio
+
+        # 1. Reuse or upload the raw videos once; every map unit references the same files
+        files_variables, uploaded_file_names, saving_uris = await _prepare_raw_video_parts(
+            client,
+            async_client,
+            video_list=video_list,
+            old_file_variables=old_file_variables,
+            existing_file_names=existing_file_names,
+            deadline=deadline
+        )
+        if on_files_ready:
+            await on_files_ready(uploaded_file_names, saving_uris)
+
+        # 2. MAP: candidate moments per clip / window with a bounded worker pool
+        windows = _plan_map_windows(len(files_variables), video_durations)
+        semaphore = asyncio.Semaphore(max(1, constants.MAP_REDUCE_CONCURRENCY))
+        map_config = types.GenerateContentConfig(
+            response_mime_type="application/json",
+            response_schema=CandidateMomentsSchema,
+            temperature=constants.GEMINI_TEMPERATURE,
+            media_resolution=_media_resolution(media_resolution)
+        )
+
+        async def _map_window(clip_index: int, start: int | None, end: int | None) -> List[Dict[str, Any]]:
+            nonlocal usage
+            clip_name = os.path.basename(video_list[clip_index]) if clip_index < len(video_list) else f"video_{clip_index + 1}"
+            window_label = f"{clip_name} [{start}s-{end}s]" if start is not None else clip_name
+
+            file_part = files_variables[clip_index]
+            if start is not None:
+                file_part = types.Part(
+                    file_data=file_part.file_data,
+                    video_metadata=types.VideoMetadata(start_offset=f"{start}s", end_offset=f"{end}s")
+                )
+
+            map_prompt = constants.MAP_CANDIDATES_PROMPT.format(
+                edit_brief=prompt,
+                source_video_index=clip_index + 1,
+                source_video_name=clip_name,
+                window_start=_seconds_to_hms(start or 0),
+                window_end=_seconds_to_hms(end) if end is not None else "end of video"
+            )
+
+            async def _scan(model: str, is_primary: bool):
+                response = await _generate_content(
+                    async_client,
+                    model=model,
+                    contents=[file_part, types.Part(text=map_prompt)],
+                    config=map_config
+                )
+                return response, CandidateMomentsSchema.model_validate_json(response.text).model_dump()["candidates"]
+
+            async with semaphore:
+                logger.info(f"Map {window_label}")
+                try:
+                    response, candidates = await GEMINI_RETRY.run(
+                        lambda: hedged_call("map", _scan),
+                        retry_on=MODEL_OUTPUT_ERRORS,
+                        label=f"Map {window_label}",
+                        deadline=deadline
+                    )
+                except (DeadlineExceededError, JobCancelledError):
+                    # The job ends here; an empty window would hide the failed stage
+                    raise
+                except Exception as e:
+                    logger.error(f"Map {window_label} failed: {e}")
+                    return []
+                usage = _add_usage(usage, response, raw_edit=True)
+
+            for candidate in candidates:
+                # The clip index and name are known here; never trust the model with them
+                candidate["source_video_index"] = clip_index + 1
+                candidate["source_video_name"] = clip_name
+                if start:
+                    # The map prompt asks for window-relative times
+                    candidate["start_time"] += timedelta(seconds=start)
+                    candidate["end_time"] += timedelta(seconds=start)
+            return candidates
+
+        logger.info(f"Map stage: {len(windows)} units across {len(files_variables)} clips (concurrency {constants.MAP_REDUCE_CONCURRENCY}).")
+        map_results = await asyncio.gather(*[_map_window(*window) for window in windows])
+
+        candidates = [candidate for result in map_results for candidate in result]
+        if not candidates:
+            raise RuntimeError("Map stage produced no candidate moments.")
+        candidates.sort(key=lambda c: (c["source_video_index"], c["start_time"]))
+        logger.info(f"Map stage produced {len(candidates)} candidate moments.")
+
+        # 3. REDUCE: sequence the candidates into the final EDL (text only, no video tokens)
+        candidates_for_prompt = [
+            {
+                **candidate,
+                "start_time": _seconds_to_hms(candidate["start_time"].total_seconds()),
+                "end_time": _seconds_to_hms(candidate["end_time"].total_seconds())
+            }
+            for candidate in candidates
+        ]
+        reduce_prompt = constants.REDUCE_EDITS_PROMPT.format(
+            edit_brief=prompt,
+            candidates=prompt_json(candidates_for_prompt)
+        )
+        reduce_config = types.GenerateContentConfig(
+            response_mime_type="application/json",
+            response_schema=schema,
+            temperature=constants.GEMINI_TEMPERATURE
+        )
+
+        async def _sequence(model: str, is_primary: bool):
+            reduce_contents = [types.Part(text=reduce_prompt)]
+            if is_primary and on_edits and constants.STREAMING_ENABLED:
+                response = await _stream_generate_content(async_client, model, reduce_contents, reduce_config, on_edits)
+            else:
+                response = await _generate_content(
+                    async_client,
+                    model=model,
+                    contents=reduce_contents,
+                    config=reduce_config
+                )
+            call_usage = _add_usage(_new_usage(), response, raw_edit=True)
+            try:
+                return schema.model_validate_json(response.text).model_dump(), call_usage
+            except (ValidationError, json.JSONDecodeError):
+                return await _salvage_and_continue(
+                    async_client, model, reduce_contents, reduce_config, schema, response.text, call_usage, deadline
+                )
+
+        final_result, call_usage = await GEMINI_RETRY.run(
+            lambda: hedged_call("reduce", _sequence),
+            retry_on=MODEL_OUTPUT_ERRORS,
+            label="Reduce",
+            deadline=deadline
+        )
+        usage = {key: usage[key] + call_usage[key] for key in usage}
+
+        logger.info("Map-reduce generation completed successfully.")
+        return {
+            "data": final_result,
+            "active_files": uploaded_file_names,
+            "files_variables": saving_uris,
+            "usage": usage
+        }
+
+    finally:
+        if async_client:
+            try:
+                if hasattr(async_client, 'close'):
+                    await async_client.close()
+            except Exception as e:
+                logger.debug(f"Error closing async client: {e}")
+
+        if client:
+            try:
+                client.close()
+            except Exception as e:
+                logger.warning(f"Error closing sync client: {e}")
+
+        await asyncio.sleep(0.5)
     
 
 
+async def gemini_repair_edit_segments(
+    file_uris: List[str],
+    schema: Type[BaseModel],
+    prompt: str,
+    edits: List[Dict[str, Any]],
+    problems: List[Dict[str, Any]],
+    video_durations: List[float | None],
+    deadline: Deadline | None = None
+) -> dict[Any,Any]:
+    """
+    Re-asks the model for only the EDL segments the local validator could not repair.
+    Returns {"data": replacement edits in the order of `problems`, "usage": token usage}.
+    """
+    client = None
+    async_client = None
+
+    try:
+        client = genai.Client(api_key=get_config("GEMINI_API_KEY"))
+        async_client = client.aio
+
+        file_parts = [
+            types.Part(file_data=types.FileData(file_uri=uri, mime_type="video/mp4"))
+            for uri in file_uris
+        ]
+        edl_for_prompt = [
+            {
+                **edit,
+                "start_time": _seconds_to_hms(edit["start_time"].total_seconds()),
+                "end_time": _seconds_to_hms(edit["end_time"].total_seconds())
+            }
+            for edit in edits
+        ]
+        durations_for_prompt = {
+            f"Source Video {i + 1}": (_seconds_to_hms(d) if d else "unknown")
+            for i, d in enumerate(video_durations)
+        }
+        repair_prompt = constants.REPAIR_SEGMENTS_PROMPT.format(
+            edit_brief=prompt,
+            current_edl=prompt_json(edl_for_prompt),
+            video_durations=prompt_json(durations_for_prompt),
+            problems="\n".join(
+                f"    * sequence_index {problem['position'] + 1}: {problem['reason']}"
+                for problem in problems
+            ),
+            segment_count=len(problems)
+        )
+        config = types.GenerateContentConfig(
+            response_mime_type="application/json",
+            response_schema=schema,
+            temperature=constants.GEMINI_TEMPERATURE
+        )
+
+        logger.info(f"Re-asking the model for {len(problems)} unrepairable segments.")
+        response = await within(deadline, _generate_content(
+            async_client,
+            model=constants.EDL_REPAIR_MODEL,
+            contents=file_parts + [types.Part(text=repair_prompt)],
+            config=config
+        ))
+        usage = _add_usage({"input_tokens": 0, "output_tokens": 0}, response)
+        replacements = schema.model_validate_json(response.text).model_dump().get("all_edits", [])
+        return {"data": replacements, "usage": usage}
+
+    finally:
+        if async_client:
+            try:
+                if hasattr(async_client, 'close'):
+                    await async_client.close()
+            except Exception as e:
+                logger.debug(f"Error closing async client: {e}")
+
+        if client:
+            try:
+                client.close()
+            except Exception as e:
+                logger.warning(f"Error closing sync client: {e}")
+
+        await asyncio.sleep(0.25)
+
+
 async def cleanup_gemini_files(file_names: List[str]):
     """
     Deletes a list of files from Google Gemini storage asynchronously.
@@ -493,7 +1011,7 @@ async def cleanup_gemini_files(file_names: List[str]):
     async_client = None
 
     try:
-        client = genai.Client(api_key=constants.GEMINI_API_KEY)
+        client = genai.Client(api_key=get_config("GEMINI_API_KEY"))
         async_client = client.aio
 
         tasks = []
@@ -1,45 +1,295 @@
 import asyncio
 from typing import Dict,List,Any
-from gemini_helper import gemini_video_understanding_with_youtube_and_schema,gemini_raw_edits_direct_video
-from schemas import ReferenceVideoResponseSchema,RawVideoResponseSchema
+from gemini_helper import gemini_video_understanding_with_youtube_and_schema,gemini_raw_edits_direct_video,gemini_raw_edits_map_reduce,gemini_repair_edit_segments,gemini_files_active
+from edl_validator import validate_and_repair_edits, whole_seconds
+from video_probe import probe_video_durations
+from planner import GenerationPlan, choose_strategy
+from schemas import ReferenceVideoResponseSchema,RawVideoResponseSchema,EditSchema
+from pydantic import ValidationError
+from retry_policy import get_retry_policy
+from deadline import Deadline, stage_deadline
+from exceptions import DeadlineExceededError
+from checkpoint import JobCheckpoint
+from cancellation import raise_if_cancelled
 import constants
 import re
 import logging
 import datetime
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
-import json
 import aioboto3
 from urllib.parse import urlparse
 from pathlib import Path
 import os
-# [FIX] Import Decimal to handle type checking
-from decimal import Decimal 
+from json_codec import prompt_json
 
 def _format_timedelta(td: datetime.timedelta) -> str:
     """Formats a timedelta object into a zero-padded HH:MM:SS string."""
-    total_seconds = int(td.total_seconds())
+    total_seconds = whole_seconds(td)
     hours, remainder = divmod(total_seconds, 3600)
     minutes, seconds = divmod(remainder, 60)
     return f"{hours:02}:{minutes:02}:{seconds:02}"
 
-# [FIX] New Helper function to sanitize DynamoDB data
-def convert_decimals_to_native(obj):
-    """Recursively converts Decimal objects to int or float."""
-    if isinstance(obj, list):
-        return [convert_decimals_to_native(i) for i in obj]
-    elif isinstance(obj, dict):
-        return {k: convert_decimals_to_native(v) for k, v in obj.items()}
-    elif isinstance(obj, Decimal):
-        if obj % 1 == 0:
-            return int(obj)
-        return float(obj)
-    return obj
-
-async def generate_reference_video_summary(youtube_url:str)->Dict[str,Any]:
+def _format_edits(all_edits: List[Dict[str, Any]], start_index: int = 0) -> List[Dict[str, Any]]:
+    """Assigns edit ids and formats start/end timedeltas as HH:MM:SS strings."""
+    for index, timestamp in enumerate(all_edits, start=start_index):
+        timestamp["id"] = f"E{index + 1}"
+        timestamp["start_time"] = _format_timedelta(timestamp.get("start_time"))
+        timestamp["end_time"] = _format_timedelta(timestamp.get("end_time"))
+    return all_edits
+
+
+async def _validate_and_repair_edits(
+    all_edits: List[Dict[str, Any]],
+    video_path: List[str],
+    video_durations: List[float | None],
+    prompt: str,
+    file_uris: List[str],
+    usage: Dict[str, int] | None,
+    deadline: Deadline | None = None
+) -> tuple[List[Dict[str, Any]], Dict[str, int] | None]:
+    """Repairs the EDL locally and re-asks the model only for the segments that cannot be fixed."""
+    video_names = [Path(path).name for path in video_path]
+    edits, problems = validate_and_repair_edits(all_edits, video_names, video_durations)
+    if not problems:
+        return edits, usage
+
+    replacements = []
+    try:
+        repair_payload = await gemini_repair_edit_segments(
+            file_uris=file_uris,
+            schema=RawVideoResponseSchema,
+            prompt=prompt,
+            edits=edits,
+            problems=problems,
+            video_durations=video_durations,
+            deadline=stage_deadline(deadline, "repair")
+        )
+        replacements = repair_payload["data"]
+        if usage is not None:
+            usage = {key: usage.get(key, 0) + repair_payload["usage"].get(key, 0) for key in usage}
+    except Exception as e:
+        logger.warning(f"Segment regeneration failed, dropping {len(problems)} broken segments: {e}")
+
+    for problem, replacement in zip(problems, replacements):
+        replacement["sequence_index"] = problem["position"] + 1
+        edits[problem["position"]] = replacement
+    for problem in problems[len(replacements):]:
+        edits[problem["position"]] = None
+    edits = [edit for edit in edits if edit is not None]
+
+    edits, still_broken = validate_and_repair_edits(edits, video_names, video_durations)
+    if still_broken:
+        logger.warning(f"Dropping {len(still_broken)} segments that are still invalid after regeneration: {still_broken}")
+        broken_positions = {problem["position"] for problem in still_broken}
+        edits = [edit for i, edit in enumerate(edits) if i not in broken_positions]
+        for i, edit in enumerate(edits):
+            edit["sequence_index"] = i + 1
+    return edits, usage
+
+
+async def _generate_draft(
+    video_path: List[str],
+    prompt: str,
+    existing_file_names: List[str],
+    old_file_variables: list,
+    video_durations: List[float | None],
+    plan: GenerationPlan | None,
+    on_draft,
+    deadline: Deadline | None = None,
+    checkpoint: JobCheckpoint | None = None
+) -> Dict[str, Any] | None:
+    """Generates and publishes a fast-model draft EDL. Returns its payload, or None if the draft failed."""
+    try:
+        logger.info(f"Generating draft with {constants.DRAFT_MODEL}.")
+        draft_payload = await gemini_raw_edits_direct_video(
+            video_list=video_path,
+            schema=RawVideoResponseSchema,
+            prompt=prompt,
+            existing_file_names=existing_file_names,
+            old_file_variables=old_file_variables,
+            model_name=constants.DRAFT_MODEL,
+            media_resolution=plan.media_resolution if plan else None,
+            fps=plan.fps if plan else None,
+            route="draft",
+            deadline=stage_deadline(deadline, "draft"),
+            on_files_ready=checkpoint.on_files_ready if checkpoint else None
+        )
+        # Local repairs only; a draft never waits on a regeneration round trip
+        draft_edits, _ = validate_and_repair_edits(
+            draft_payload["data"].get("all_edits", []),
+            [Path(path).name for path in video_path],
+            video_durations
+        )
+        await on_draft(_format_edits(draft_edits), draft_payload["active_files"], draft_payload["files_variables"])
+        logger.info(f"Draft with {len(draft_edits)} edits published.")
+        return draft_payload
+    except Exception as e:
+        logger.warning(f"Draft generation failed, continuing with the full pass only: {e}")
+        return None
+
+
+async def _generate_raw_edits(
+    s3_urls: List[str],
+    raw_videos: List[tuple[str, str]] | None,
+    prompt: str,
+    existing_file_names: List[str],
+    old_file_variables: list,
+    plan: GenerationPlan | None = None,
+    on_partial_edits = None,
+    on_draft = None,
+    deadline: Deadline | None = None,
+    checkpoint: JobCheckpoint | None = None
+) -> Dict[str, Any]:
+    """
+    Runs raw-video edit generation and returns the formatted edits with the active Gemini files.
+    `raw_videos` are the (s3_url, local_path) pairs from _download_raw_videos(), or None when the checkpointed
+    Gemini uploads are reused and nothing was downloaded.
+    `deadline` bounds the whole step; the draft, generation and repair stages get their own budgets within it.
+    When `on_partial_edits(edits, replace)` is given, formatted edits are published while the model streams.
+    When `on_draft(edits, active_files, files_variables)` is given, a fast-model draft is published first and
+    the full-quality pass then reuses the draft's uploads.
+    With a `checkpoint`, the uploads and the finished edits are saved as they complete, and a job whose
+    checkpoint already holds generated edits returns them without calling Gemini.
+    """
+    if checkpoint and checkpoint.reached("generated"):
+        logger.info("Returning the checkpointed edits of an earlier attempt.")
+        return {
+            "data": checkpoint.get("all_edits"),
+            "active_files": checkpoint.get("existing_file_names", []),
+            "files_variables": checkpoint.get("files_variables", []),
+            "usage": checkpoint.get("usage")
+        }
+
+    raise_if_cancelled()
+    if raw_videos is None:
+        # Only the file names are used while the uploads are reused; there are no local copies
+        video_urls = s3_urls
+        video_path = [f"/tmp/{Path(urlparse(s3_url).path).name}" for s3_url in s3_urls]
+    else:
+        video_urls = [s3_url for s3_url, _ in raw_videos]
+        video_path = [local_path for _, local_path in raw_videos]
+
+    if plan is not None:
+        # Plan durations follow s3_urls, which may include clips that failed to download
+        durations_by_url = dict(zip(s3_urls, plan.raw_video_durations))
+        video_durations = [durations_by_url.get(s3_url) for s3_url in video_urls]
+        strategy = plan.strategy
+    else:
+        video_durations = await probe_video_durations(video_path) if raw_videos is not None else [None] * len(video_urls)
+        strategy = choose_strategy(video_durations)
+
+    draft_payload = None
+    if on_draft and constants.DRAFT_REFINE_ENABLED and strategy == "direct":
+        draft_payload = await _generate_draft(
+            video_path=video_path,
+            prompt=prompt,
+            existing_file_names=existing_file_names,
+            old_file_variables=old_file_variables,
+            video_durations=video_durations,
+            plan=plan,
+            on_draft=on_draft,
+            deadline=deadline,
+            checkpoint=checkpoint
+        )
+        if draft_payload:
+            # The refinement reuses the uploads; streaming it would clobber the draft with a partial list
+            existing_file_names = draft_payload["active_files"]
+            old_file_variables = draft_payload["files_variables"]
+            on_partial_edits = None
+        raise_if_cancelled()
+
+    on_edits = None
+    if on_partial_edits:
+        streamed_count = 0
+
+        async def on_edits(batch: List[Dict[str, Any]], replace: bool):
+            nonlocal streamed_count
+            if replace:
+                streamed_count = 0
+            valid_edits = []
+            for raw_edit in batch:
+                try:
+                    valid_edits.append(EditSchema.model_validate(raw_edit).model_dump())
+                except ValidationError as e:
+                    logger.warning(f"Dropping invalid streamed edit: {e}")
+            _format_edits(valid_edits, start_index=streamed_count)
+            streamed_count += len(valid_edits)
+            if valid_edits or replace:
+                await on_partial_edits(valid_edits, replace)
+
+    if strategy == "map_reduce":
+        logger.info(f"Using map-reduce generation for {len(video_path)} videos ({sum(d for d in video_durations if d):.0f}s total).")
+        response_payload = await gemini_raw_edits_map_reduce(
+            video_list=video_path,
+            schema=RawVideoResponseSchema,
+            prompt=prompt,
+            existing_file_names=existing_file_names,
+            old_file_variables=old_file_variables,
+            video_durations=video_durations,
+            media_resolution=plan.media_resolution if plan else None,
+            on_edits=on_edits,
+            deadline=stage_deadline(deadline, "generation"),
+            on_files_ready=checkpoint.on_files_ready if checkpoint else None
+        )
+    else:
+        response_payload = await gemini_raw_edits_direct_video(
+            video_list=video_path,
+            schema=RawVideoResponseSchema,
+            prompt=prompt,
+            existing_file_names=existing_file_names,
+            old_file_variables=old_file_variables,
+            model_name=plan.model if plan else None,
+            media_resolution=plan.media_resolution if plan else None,
+            fps=plan.fps if plan else None,
+            on_edits=on_edits,
+            deadline=stage_deadline(deadline, "generation"),
+            on_files_ready=checkpoint.on_files_ready if checkpoint else None
+        )
+
+    time_stamps = response_payload["data"]
+    all_edits = time_stamps.get("all_edits", [])
+    usage = response_payload.get("usage")
+    if usage is not None and draft_payload and draft_payload.get("usage"):
+        # The draft counts toward the job's totals, not toward the raw-edit call the planner estimates
+        usage = {
+            **usage,
+            "input_tokens": usage["input_tokens"] + draft_payload["usage"]["input_tokens"],
+            "output_tokens": usage["output_tokens"] + draft_payload["usage"]["output_tokens"]
+        }
+
+    if constants.EDL_REPAIR_ENABLED and all_edits:
+        all_edits, usage = await _validate_and_repair_edits(
+            all_edits=all_edits,
+            video_path=video_path,
+            video_durations=video_durations,
+            prompt=prompt,
+            file_uris=response_payload["files_variables"],
+            usage=usage,
+            deadline=deadline
+        )
+
+    result = {
+        "data": _format_edits(all_edits),
+        "active_files": response_payload["active_files"],
+        "files_variables": response_payload["files_variables"],
+        "usage": usage
+    }
+    if checkpoint:
+        await checkpoint.save(
+            "generated",
+            all_edits=result["data"],
+            existing_file_names=result["active_files"],
+            files_variables=result["files_variables"],
+            usage=usage
+        )
+    return result
+
+
+async def generate_reference_video_summary(youtube_url:str,split_video:bool|None=None,deadline:Deadline|None=None)->Dict[str,Any]:
     try:
         prompt=constants.REF_VID_SUMMARY_PROMPT
-        ref_vid_response=await gemini_video_understanding_with_youtube_and_schema(youtube_url=youtube_url, prompt=prompt,schema=ReferenceVideoResponseSchema)
+        ref_vid_response=await gemini_video_understanding_with_youtube_and_schema(youtube_url=youtube_url, prompt=prompt,schema=ReferenceVideoResponseSchema,split_video=split_video,deadline=deadline)
         print(ref_vid_response)
         print("\n\n\n")
         return ref_vid_response
@@ -48,11 +298,13 @@ async def generate_reference_video_summary(youtube_url:str)->Dict[str,Any]:
         raise
 
 
-async def download_videos_from_s3_async(s3_urls: List[str]) -> List[str]:
+async def download_videos_from_s3_async(s3_urls: List[str], deadline: Deadline | None = None) -> List[tuple[str, str]]:
     """
     Asynchronously downloads videos from S3 URLs to the /tmp directory.
+    Returns (s3_url, local_path) pairs of the successful downloads, in input order.
     """
     download_tasks = []
+    queued_urls = []
     session = aioboto3.Session() # Initialize session
 
     # FIX: Ensure session cleanup is handled gracefully
@@ -78,18 +330,27 @@ async def download_videos_from_s3_async(s3_urls: List[str]) -> List[str]:
                     logger.info(f"Queueing download: s3://{bucket_name}/{object_key} -> {local_path}")
                     
                     task = asyncio.create_task(
-                        s3_client.download_file(bucket_name, object_key, local_path),
+                        get_retry_policy("s3").run(
+                            lambda bucket=bucket_name, key=object_key, path=local_path: s3_client.download_file(bucket, key, path),
+                            label=f"S3 download {file_name}",
+                            deadline=deadline
+                        ),
                         name=local_path 
                     )
                     download_tasks.append(task)
+                    queued_urls.append(s3_url)
 
                 except Exception as e:
                     logger.error(f"Error parsing or queueing URL {s3_url}: {e}")
 
             logger.info(f"Starting concurrent download of {len(download_tasks)} files...")
             results = await asyncio.gather(*download_tasks, return_exceptions=True)
+            timed_out = next((result for result in results if isinstance(result, DeadlineExceededError)), None)
+            if timed_out:
+                # A partial set of clips would silently produce a worse edit
+                raise timed_out
 
-            successful_paths = []
+            downloaded = []
             for i, result in enumerate(results):
                 task = download_tasks[i]
                 local_path = task.get_name() 
@@ -97,27 +358,74 @@ async def download_videos_from_s3_async(s3_urls: List[str]) -> List[str]:
                     logger.error(f"Failed to download to {local_path}: {result}")
                 else:
                     logger.info(f"Successfully downloaded to {local_path}")
-                    successful_paths.append(local_path)
+                    downloaded.append((queued_urls[i], local_path))
     
     finally:
         # FIX: Yield control to the event loop briefly to allow aiohttp to close underlying sockets
         await asyncio.sleep(0.1)
 
-    logger.info(f"Finished downloads. {len(successful_paths)} files successful.")
-    return successful_paths
+    logger.info(f"Finished downloads. {len(downloaded)} files successful.")
+    return downloaded
 
 
 
 
 
+async def _download_raw_videos(
+    s3_urls: List[str],
+    existing_file_names: List[str],
+    checkpoint: JobCheckpoint | None = None,
+    deadline: Deadline | None = None
+) -> List[tuple[str, str]] | None:
+    """
+    Downloads the raw videos and returns (s3_url, local_path) pairs of the ones that arrived.
+    Returns None, downloading nothing, for a resumed job whose checkpointed Gemini uploads are all still ACTIVE.
+    """
+    raise_if_cancelled()
+    if (
+        checkpoint and checkpoint.reached("uploaded")
+        and existing_file_names and len(existing_file_names) == len(s3_urls)
+        and await gemini_files_active(existing_file_names)
+    ):
+        logger.info("Checkpointed Gemini uploads are still active, skipping the S3 download.")
+        return None
+    return await download_videos_from_s3_async(s3_urls=s3_urls, deadline=stage_deadline(deadline, "download"))
+
+
+async def _reference_summary(
+    reference_youtube_url: str,
+    plan: GenerationPlan | None,
+    checkpoint: JobCheckpoint | None = None,
+    deadline: Deadline | None = None
+):
+    """Reference video summary, reused from the checkpoint of an earlier attempt when there is one."""
+    if checkpoint and checkpoint.get("reference_summary"):
+        logger.info("Reusing the checkpointed reference video summary.")
+        return checkpoint.get("reference_summary")
+    summary = await generate_reference_video_summary(
+        youtube_url=reference_youtube_url,
+        split_video=plan.split_reference if plan else None,
+        deadline=stage_deadline(deadline, "reference_summary")
+    )
+    if checkpoint and summary not in (-1, -2):
+        await checkpoint.save("reference_summary", reference_summary=summary)
+    raise_if_cancelled()
+    return summary
+
+
 async def generate_edit_instructions_without_ref_ver1(
     s3_urls: list[str],
     channel_info_for_edit: dict,
     creator_notes: str,
     old_file_variables:list,
-    existing_file_names: List[str] = []
+    existing_file_names: List[str] = [],
+    plan: GenerationPlan | None = None,
+    on_partial_edits = None,
+    on_draft = None,
+    deadline: Deadline | None = None,
+    checkpoint: JobCheckpoint | None = None
 ):
-    video_path = [] # Init for cleanup
+    raw_videos = None # Init for cleanup
 
     try:
         # Format the "No Reference" Prompt
@@ -131,43 +439,28 @@ async def generate_edit_instructions_without_ref_ver1(
         )
 
         # 1. Always download from S3 (Safety Fallback)
-        video_path = await download_videos_from_s3_async(s3_urls=s3_urls)
+        raw_videos = await _download_raw_videos(s3_urls, existing_file_names, checkpoint=checkpoint, deadline=deadline)
 
-        # 2. Call Gemini Helper (It will skip upload if existing_file_names are valid)
-        response_payload = await gemini_raw_edits_direct_video(
-            video_list=video_path,
-            schema=RawVideoResponseSchema,
+        # 2. Generate + format (single request or map-reduce, depending on project size)
+        return await _generate_raw_edits(
+            s3_urls=s3_urls,
+            raw_videos=raw_videos,
             prompt=direct_prompt,
             existing_file_names=existing_file_names,
-            old_file_variables=old_file_variables
+            old_file_variables=old_file_variables,
+            plan=plan,
+            on_partial_edits=on_partial_edits,
+            on_draft=on_draft,
+            deadline=deadline,
+            checkpoint=checkpoint
         )
 
-        # 3. Unpack Data & Files
-        time_stamps = response_payload["data"]
-        active_files = response_payload["active_files"]
-        files_variables=response_payload["files_variables"]
-
-        # 4. Format Timestamps
-        for index, timestamp in enumerate(time_stamps.get("all_edits",{})):
-            timestamp["id"] = f"E{index + 1}"
-            start_time = timestamp.get("start_time")
-            timestamp["start_time"] = _format_timedelta(start_time)
-            end_time = timestamp.get("end_time")
-            timestamp["end_time"] = _format_timedelta(end_time)
-        
-        # 5. Return Result + Active Files
-        return {
-            "data": time_stamps.get("all_edits"),
-            "active_files": active_files,
-            "files_variables":files_variables
-        }
-
     except Exception as e:
         logger.error(f"Error in No-Ref Ver1 generation: {e}")
         raise
     finally:
         # 6. Cleanup Local Files
-        cleanup_local_files(video_path)
+        cleanup_local_files([path for _, path in raw_videos or []])
 
 
 
@@ -179,14 +472,18 @@ async def generate_edit_instructions_without_ref_other_ver(
     creator_notes: str,
     old_edits: Dict[Any,Any],
     old_file_variables:list,
-    existing_file_names: List[str] = []
+    existing_file_names: List[str] = [],
+    plan: GenerationPlan | None = None,
+    on_partial_edits = None,
+    on_draft = None,
+    deadline: Deadline | None = None,
+    checkpoint: JobCheckpoint | None = None
 ):
-    video_path = [] # Init for cleanup
+    raw_videos = None # Init for cleanup
 
     try:
-        # [FIX] Sanitize Decimal objects before serialization
-        clean_old_edits = convert_decimals_to_native(old_edits)
-        old_edits_str = json.dumps(clean_old_edits, indent=2)
+        # Compact JSON (Decimals included) keeps the previous EDL cheap in prompt tokens
+        old_edits_str = prompt_json(old_edits)
 
         # Format the "Revision No Reference" Prompt
         direct_prompt = constants.REVISION_VIDEO_PROMPT_NO_REF.format(
@@ -200,49 +497,33 @@ async def generate_edit_instructions_without_ref_other_ver(
         )
 
         # 1. Always download
-        video_path = await download_videos_from_s3_async(s3_urls=s3_urls)
+        raw_videos = await _download_raw_videos(s3_urls, existing_file_names, checkpoint=checkpoint, deadline=deadline)
 
-        # 2. Call Gemini Helper
-        response_payload = await gemini_raw_edits_direct_video(
-            video_list=video_path,
-            schema=RawVideoResponseSchema,
+        # 2. Generate + format (single request or map-reduce, depending on project size)
+        return await _generate_raw_edits(
+            s3_urls=s3_urls,
+            raw_videos=raw_videos,
             prompt=direct_prompt,
             existing_file_names=existing_file_names,
-            old_file_variables=old_file_variables
+            old_file_variables=old_file_variables,
+            plan=plan,
+            on_partial_edits=on_partial_edits,
+            on_draft=on_draft,
+            deadline=deadline,
+            checkpoint=checkpoint
         )
 
-        # 3. Unpack
-        time_stamps = response_payload["data"]
-        active_files = response_payload["active_files"]
-        files_variables=response_payload["files_variables"]
-
-        # 4. Format
-        for index, timestamp in enumerate(time_stamps.get("all_edits",{})):
-            timestamp["id"] = f"E{index + 1}"
-            start_time = timestamp.get("start_time")
-            timestamp["start_time"] = _format_timedelta(start_time)
-            end_time = timestamp.get("end_time")
-            timestamp["end_time"] = _format_timedelta(end_time)
-        
-        # 5. Return
-        return {
-            "data": time_stamps.get("all_edits"),
-            "active_files": active_files,
-            "files_variables":files_variables
-        }
-
     except Exception as e:
         logger.error(f"Error in No-Ref Revision generation: {e}")
         raise
     finally:
         # 6. Cleanup Local Files
-        cleanup_local_files(video_path)
+        cleanup_local_files([path for _, path in raw_videos or []])
 
 
 
 
 
-import json # Ensure this is imported at the top of helper.py
 
 async def generate_edit_instructions_with_ref_ver1(
     reference_youtube_url: str,
@@ -250,13 +531,23 @@ async def generate_edit_instructions_with_ref_ver1(
     channel_info_for_edit: dict,
     creator_notes: str,
     old_file_variables:list,
-    existing_file_names: List[str] = []
+    existing_file_names: List[str] = [],
+    plan: GenerationPlan | None = None,
+    on_partial_edits = None,
+    on_draft = None,
+    deadline: Deadline | None = None,
+    checkpoint: JobCheckpoint | None = None
 ):
     # Initialize variable for cleanup in finally block
-    video_path = []
+    raw_videos = None
     
     try:
-        reference_video_edit_summary = await generate_reference_video_summary(youtube_url=reference_youtube_url)
+        reference_video_edit_summary = await _reference_summary(
+            reference_youtube_url=reference_youtube_url,
+            plan=plan,
+            checkpoint=checkpoint,
+            deadline=deadline
+        )
         
         if reference_video_edit_summary == -1:
             logger.info(f"invalid reference video is passed from the user:{reference_youtube_url}")
@@ -277,45 +568,28 @@ async def generate_edit_instructions_with_ref_ver1(
             )
             
             # 1. Always download to ensure we have fallback if Gemini files expired
-            video_path = await download_videos_from_s3_async(s3_urls=s3_urls)
+            raw_videos = await _download_raw_videos(s3_urls, existing_file_names, checkpoint=checkpoint, deadline=deadline)
             
-            # 2. Call Gemini Helper (Direct Video)
-            response_payload = await gemini_raw_edits_direct_video(
-                video_list=video_path,
-                schema=RawVideoResponseSchema,
+            # 2. Generate + format (single request or map-reduce, depending on project size)
+            return await _generate_raw_edits(
+                s3_urls=s3_urls,
+                raw_videos=raw_videos,
                 prompt=raw_prompt,
                 existing_file_names=existing_file_names,
-                old_file_variables=old_file_variables
+                old_file_variables=old_file_variables,
+                plan=plan,
+                on_partial_edits=on_partial_edits,
+                on_draft=on_draft,
+                deadline=deadline,
+                checkpoint=checkpoint
             )
 
-            # 3. UNPACK response (Data + Files)
-            time_stamps = response_payload["data"]
-            active_files = response_payload["active_files"]
-            files_variables=response_payload["files_variables"]
-
-            # 4. Process the data (Format timestamps)
-            for index, timestamp in enumerate(time_stamps.get("all_edits", {})):
-                timestamp["id"] = f"E{index + 1}"
-                # Handle start_time
-                start_time = timestamp.get("start_time")
-                timestamp["start_time"] = _format_timedelta(start_time)
-                # Handle end_time
-                end_time = timestamp.get("end_time")
-                timestamp["end_time"] = _format_timedelta(end_time)
-
-            # 5. Return BOTH data and files
-            return {
-                "data": time_stamps.get("all_edits"),
-                "active_files": active_files,
-                "files_variables":files_variables
-            }
-
     except Exception as e:
         logger.error(f"Error in Ver1 generation: {e}")
         raise
     finally:
         # 6. CRITICAL: Clean up local /tmp files
-        cleanup_local_files(video_path)
+        cleanup_local_files([path for _, path in raw_videos or []])
 
 
 async def generate_edit_instructions_with_ref_other_ver(
@@ -325,12 +599,22 @@ async def generate_edit_instructions_with_ref_other_ver(
     creator_notes: str,
     old_edits: Dict[Any,Any],
     old_file_variables:list,
-    existing_file_names: List[str] = []
+    existing_file_names: List[str] = [],
+    plan: GenerationPlan | None = None,
+    on_partial_edits = None,
+    on_draft = None,
+    deadline: Deadline | None = None,
+    checkpoint: JobCheckpoint | None = None
 ):
-    video_path = []  # Init for cleanup
+    raw_videos = None # Init for cleanup
     
     try:
-        reference_video_edit_summary = await generate_reference_video_summary(youtube_url=reference_youtube_url)
+        reference_video_edit_summary = await _reference_summary(
+            reference_youtube_url=reference_youtube_url,
+            plan=plan,
+            checkpoint=checkpoint,
+            deadline=deadline
+        )
         
         if reference_video_edit_summary == -1:
             logger.info(f"invalid reference video is passed from the user:{reference_youtube_url}")
@@ -339,9 +623,8 @@ async def generate_edit_instructions_with_ref_other_ver(
             logger.info(f"The reference video does not exist in the youtube database:{reference_youtube_url}")
             return -2
         else:
-            # [FIX] Sanitize Decimal objects before serialization
-            clean_old_edits = convert_decimals_to_native(old_edits)
-            old_edits_str = json.dumps(clean_old_edits, indent=2)
+            # Compact JSON (Decimals included) keeps the previous EDL cheap in prompt tokens
+            old_edits_str = prompt_json(old_edits)
 
             # REVISION PROMPT (Correction Mode)
             raw_prompt = constants.REVISION_VIDEO_PROMPT.format(
@@ -356,42 +639,27 @@ async def generate_edit_instructions_with_ref_other_ver(
             )
             
             # 1. Download (Always, for safety)
-            video_path = await download_videos_from_s3_async(s3_urls=s3_urls)
+            raw_videos = await _download_raw_videos(s3_urls, existing_file_names, checkpoint=checkpoint, deadline=deadline)
             
-            # 2. Generate
-            response_payload = await gemini_raw_edits_direct_video(
-                video_list=video_path,
-                schema=RawVideoResponseSchema,
+            # 2. Generate + format (single request or map-reduce, depending on project size)
+            return await _generate_raw_edits(
+                s3_urls=s3_urls,
+                raw_videos=raw_videos,
                 prompt=raw_prompt,
                 existing_file_names=existing_file_names,
-                old_file_variables=old_file_variables
+                old_file_variables=old_file_variables,
+                plan=plan,
+                on_partial_edits=on_partial_edits,
+                on_draft=on_draft,
+                deadline=deadline,
+                checkpoint=checkpoint
             )
 
-            # 3. Unpack
-            time_stamps = response_payload["data"]
-            active_files = response_payload["active_files"]
-            files_variables=response_payload["files_variables"]
-
-            # 4. Format
-            for index, timestamp in enumerate(time_stamps.get("all_edits", {})):
-                timestamp["id"] = f"E{index + 1}"
-                start_time = timestamp.get("start_time")
-                timestamp["start_time"] = _format_timedelta(start_time)
-                end_time = timestamp.get("end_time")
-                timestamp["end_time"] = _format_timedelta(end_time)
-
-            # 5. Return
-            return {
-                "data": time_stamps.get("all_edits"),
-                "active_files": active_files,
-                "files_variables":files_variables
-            }
-
     except Exception as e:
         logger.error(f"Error in Revision generation: {e}")
         raise
     finally:
-        cleanup_local_files(video_path)
+        cleanup_local_files([path for _, path in raw_videos or []])
 
 
 # Keep your cleanup function as is
@@ -0,0 +1,143 @@
+import asyncio
+import logging
+import os
+import socket
+import time
+import uuid
+from typing import Any, Callable, Dict
+
+import constants
+from async_dynamodb import is_conditional_check_failed
+from version_store import VersionStore
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Version statuses after which a waiting duplicate has nothing left to attach to
+FINISHED_STATUSES = ("DONE", "FAILED", "CANCELLED")
+
+
+def _owner_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+class JobLease:
+    """
+    Lease on one version of a project, stored as the version's lease: {"owner", "expires_at", "heartbeat_at"}.
+
+    Only the task holding an unexpired lease generates the version. The lease is taken with a conditional
+    update (free, expired or already ours), renewed by keep_alive() every JOB_LEASE_HEARTBEAT_SECONDS and
+    released on exit. A task that dies without releasing it leaves a lease that expires after
+    JOB_LEASE_SECONDS and is then reclaimed by the next invocation.
+    """
+
+    def __init__(self, version_store: VersionStore, version: str, owner: str | None = None):
+        self.version_store = version_store
+        self.version = version
+        self.owner = owner or _owner_id()
+        self.held = False
+
+    async def _write_lease(self, condition: str) -> bool:
+        now = int(time.time())
+        store = self.version_store
+        stamp_parts, stamp_names, stamp_values = store.stamp()
+        try:
+            await store.db.update_item(
+                store.table_name,
+                store.key,
+                f"SET {store.path('#lease')} = :lease, " + ", ".join(stamp_parts),
+                condition=condition,
+                names=store.names({
+                    '#version': 'version',
+                    '#lease': 'lease',
+                    '#owner': 'owner',
+                    '#expires_at': 'expires_at',
+                    **stamp_names
+                }),
+                values={
+                    **stamp_values,
+                    ':lease': {
+                        'owner': self.owner,
+                        'expires_at': now + int(constants.JOB_LEASE_SECONDS),
+                        'heartbeat_at': now
+                    },
+                    ':version': self.version,
+                    ':owner': self.owner,
+                    ':now': now
+                }
+            )
+            return True
+        except Exception as e:
+            if not is_conditional_check_failed(e):
+                raise
+            return False
+
+    async def acquire(self) -> bool:
+        """Takes the lease if it is free, expired or already ours. Returns False when another task holds it."""
+        path = self.version_store.path
+        self.held = await self._write_lease(
+            f"{path('#version')} = :version AND (attribute_not_exists({path('#lease')}) "
+            f"OR {path('#lease')}.#expires_at < :now OR {path('#lease')}.#owner = :owner)"
+        )
+        if self.held:
+            logger.info(f"Acquired job lease {self.owner} for version {self.version}.")
+        return self.held
+
+    async def renew(self) -> bool:
+        """Extends our lease. Returns False (and drops it) if another task has taken it over."""
+        path = self.version_store.path
+        self.held = await self._write_lease(
+            f"{path('#version')} = :version AND {path('#lease')}.#owner = :owner"
+        )
+        return self.held
+
+    async def keep_alive(self, on_lost: Callable[[], Any]) -> None:
+        """Heartbeat loop; calls `on_lost()` once the lease can no longer be renewed."""
+        while True:
+            await asyncio.sleep(constants.JOB_LEASE_HEARTBEAT_SECONDS)
+            try:
+                if await self.renew():
+                    continue
+                logger.error(f"Job lease {self.owner} was taken over by another task.")
+            except Exception as e:
+                # A missed heartbeat is fine while the lease is still valid; retry on the next beat
+                logger.warning(f"Job lease heartbeat failed: {e}")
+                continue
+            on_lost()
+            return
+
+    async def release(self) -> None:
+        if not self.held:
+            return
+        store = self.version_store
+        stamp_parts, stamp_names, stamp_values = store.stamp()
+        try:
+            await store.db.update_item(
+                store.table_name,
+                store.key,
+                f"REMOVE {store.path('#lease')} SET " + ", ".join(stamp_parts),
+                condition=f"{store.path('#lease')}.#owner = :owner",
+                names=store.names({'#lease': 'lease', '#owner': 'owner', **stamp_names}),
+                values={':owner': self.owner, **stamp_values}
+            )
+            logger.info(f"Released job lease {self.owner}.")
+        except Exception as e:
+            # An unreleased lease only delays a rerun until it expires
+            if not is_conditional_check_failed(e):
+                logger.warning(f"Failed to release job lease {self.owner}: {e}")
+        self.held = False
+
+    async def wait_for_holder(self) -> Dict[str, Any]:
+        """
+        Attaches to the task holding the lease: polls the version until it finishes (DONE / FAILED / CANCELLED) or its
+        lease goes stale, and returns the latest version entry.
+        """
+        while True:
+            version_item = await self.version_store.get_version(["status", "lease"])
+            lease = version_item.get("lease") or {}
+            if version_item.get("status") in FINISHED_STATUSES:
+                return version_item
+            if not lease or int(lease.get("expires_at", 0)) < time.time():
+                logger.info("Job lease holder went away, trying to reclaim the lease.")
+                return version_item
+            await asyncio.sleep(constants.JOB_LEASE_ATTACH_POLL_SECONDS)
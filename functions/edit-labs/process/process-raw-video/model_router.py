@@ -0,0 +1,83 @@
+import asyncio
+import json
+import logging
+import time
+from typing import Any, Awaitable, Callable
+
+import constants
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+def route_config(route: str) -> dict:
+    """Returns {"primary", "hedge", "hedge_after_seconds"} for a generation path."""
+    if route not in constants.MODEL_ROUTES:
+        raise ValueError(f"Unknown model route: {route}")
+    return constants.MODEL_ROUTES[route]
+
+
+async def hedged_call(
+    route: str,
+    call: Callable[[str, bool], Awaitable[Any]],
+    model_name: str | None = None
+) -> Any:
+    """
+    Runs `call(model, is_primary)` on the route's primary model. If it has not produced a
+    schema-valid result after the route's latency threshold (its p95 SLO), the same call is fired
+    on the hedge model; the first successful result wins and the other request is cancelled.
+
+    `call` must raise on invalid output so that only schema-valid answers can win.
+    A hedge_after_seconds of 0 disables hedging for the route.
+    """
+    config = route_config(route)
+    primary_model = model_name or config["primary"]
+    hedge_model = config["hedge"]
+    hedge_after = config["hedge_after_seconds"]
+    started = time.monotonic()
+
+    tasks = []
+    try:
+        primary = asyncio.create_task(call(primary_model, True), name=f"{route}:primary:{primary_model}")
+        tasks.append(primary)
+        if not hedge_after or not hedge_model:
+            return await primary
+
+        done, _ = await asyncio.wait({primary}, timeout=hedge_after)
+        if done:
+            return primary.result()
+
+        logger.warning(f"{route}: {primary_model} exceeded {hedge_after}s, hedging on {hedge_model}.")
+        hedge = asyncio.create_task(call(hedge_model, False), name=f"{route}:hedge:{hedge_model}")
+        tasks.append(hedge)
+        pending = {primary, hedge}
+        first_error = None
+
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is not None:
+                    logger.warning(f"{task.get_name()} failed: {task.exception()}")
+                    if first_error is None or task is primary:
+                        first_error = task.exception()
+                    continue
+
+                winner = "primary" if task is primary else "hedge"
+                logger.info("HEDGE_RESULT " + json.dumps({
+                    "route": route,
+                    "winner": winner,
+                    "model": primary_model if task is primary else hedge_model,
+                    "hedge_after_seconds": hedge_after,
+                    "latency_seconds": round(time.monotonic() - started, 2)
+                }))
+                return task.result()
+
+        logger.info("HEDGE_RESULT " + json.dumps({"route": route, "winner": None, "hedge_after_seconds": hedge_after}))
+        raise first_error
+    finally:
+        # Also reached when the caller is cancelled (deadline, job cancellation): no request may outlive the call
+        unfinished = [task for task in tasks if not task.done()]
+        for task in unfinished:
+            task.cancel()
+        if unfinished:
+            await asyncio.gather(*unfinished, return_exceptions=True)
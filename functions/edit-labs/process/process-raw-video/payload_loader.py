@@ -0,0 +1,52 @@
+import json
+import logging
+import os
+from typing import Any, Dict
+from urllib.parse import urlparse
+
+import aioboto3
+
+import json_codec
+from retry_policy import get_retry_policy
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+def parse_payload(event: Any) -> Any:
+    body = event
+    if isinstance(body, dict):
+        return body
+    if isinstance(body, str):
+        try:
+            return json.loads(body)
+        except json.JSONDecodeError:
+            return body
+    return {}
+
+
+async def _read_s3_payload(uri: str) -> Dict[str, Any]:
+    parsed = urlparse(uri)
+    if parsed.scheme != "s3" or not parsed.netloc or not parsed.path.lstrip("/"):
+        raise ValueError(f"PAYLOAD_URI must be an s3://bucket/key URI, got '{uri}'")
+
+    session = aioboto3.Session()
+    async with session.client("s3") as s3_client:
+        async def read() -> bytes:
+            response = await s3_client.get_object(Bucket=parsed.netloc, Key=parsed.path.lstrip("/"))
+            return await response["Body"].read()
+        body = await get_retry_policy("s3").run(read, label="S3 get_object payload")
+    logger.info(f"Loaded a {len(body)} byte job payload from {uri}")
+    return json_codec.loads(body)
+
+
+async def load_payload() -> Dict[str, Any]:
+    """
+    The job payload. The state machine stores it in S3 and passes only PAYLOAD_URI, so its size is not bound
+    by the ECS container override limit; tasks started with the payload inline (PAYLOAD_JSON) still work.
+    """
+    uri = os.environ.get("PAYLOAD_URI")
+    payload = await _read_s3_payload(uri) if uri else parse_payload(os.environ.get("PAYLOAD_JSON"))
+    if not isinstance(payload, dict):
+        raise ValueError("Job payload must be a JSON object")
+    return payload
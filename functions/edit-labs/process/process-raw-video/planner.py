@@ -0,0 +1,231 @@
+import asyncio
+import json
+import logging
+import math
+from typing import Any, Dict, List
+from urllib.parse import urlparse
+
+import boto3
+from pydantic import BaseModel
+
+import constants
+from gemini_helper import _get_video_id, _get_youtube_video_duration, _plan_map_windows
+from json_codec import prompt_json
+from video_probe import probe_video_durations
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+class GenerationPlan(BaseModel):
+    """Pre-flight sizing of one generation job, computed before any Gemini call."""
+    raw_video_count: int
+    raw_video_seconds: float
+    raw_video_durations: List[float | None]
+    reference_video_seconds: int | None = None
+    estimated_prompt_tokens: int
+    estimated_raw_video_tokens: int
+    estimated_reference_tokens: int
+    estimated_raw_edit_input_tokens: int
+    estimated_input_tokens: int
+    estimated_output_tokens: int
+    estimated_cost_usd: float
+    model: str
+    media_resolution: str
+    fps: float | None = None
+    strategy: str
+    split_reference: bool | None = None
+
+
+def estimate_video_tokens(seconds: float, media_resolution: str = "default", fps: float | None = None) -> int:
+    """Estimates Gemini input tokens for `seconds` of video (frames + audio)."""
+    frame_tokens = constants.VIDEO_FRAME_TOKENS_LOW if media_resolution == "low" else constants.VIDEO_FRAME_TOKENS_DEFAULT
+    per_second = frame_tokens * (fps or 1.0) + constants.AUDIO_TOKENS_PER_SECOND
+    return int(math.ceil(seconds * per_second))
+
+
+def estimate_text_tokens(text: str) -> int:
+    """Estimates Gemini input tokens for a piece of text."""
+    return int(math.ceil(len(text or "") / constants.TEXT_CHARS_PER_TOKEN))
+
+
+def estimate_cost_usd(model: str, input_tokens: int, output_tokens: int) -> float:
+    """Estimates the USD cost of one request from the per-model price table."""
+    pricing = constants.GEMINI_PRICING_PER_MILLION.get(model)
+    if not pricing:
+        return 0.0
+    long_context = input_tokens > pricing.get("long_context_threshold", math.inf)
+    input_rate = pricing["input_long"] if long_context else pricing["input"]
+    output_rate = pricing["output_long"] if long_context else pricing["output"]
+    return (input_tokens * input_rate + output_tokens * output_rate) / 1_000_000
+
+
+def choose_strategy(video_durations: List[float | None], estimated_tokens: int | None = None) -> str:
+    """Picks "direct" or "map_reduce" for raw-edit generation (constants.GENERATION_MODE)."""
+    if constants.GENERATION_MODE == "map_reduce":
+        return "map_reduce"
+    if constants.GENERATION_MODE != "auto":
+        return "direct"
+    total_seconds = sum(d for d in video_durations if d)
+    if len(video_durations) >= constants.MAP_REDUCE_MIN_VIDEOS or total_seconds >= constants.MAP_REDUCE_MIN_TOTAL_SECONDS:
+        return "map_reduce"
+    if estimated_tokens is not None and estimated_tokens > constants.PLANNER_INPUT_TOKEN_BUDGET:
+        return "map_reduce"
+    return "direct"
+
+
+def _prompt_template(has_reference: bool, version: str) -> str:
+    if has_reference:
+        return constants.RAW_VIDEO_PROMPT if version == "v1" else constants.REVISION_VIDEO_PROMPT
+    return constants.RAW_VIDEO_PROMPT_NO_REF if version == "v1" else constants.REVISION_VIDEO_PROMPT_NO_REF
+
+
+def _presigned_urls(s3_urls: List[str]) -> List[str]:
+    """Presigns the raw video URLs so ffprobe can read their headers without a full download."""
+    s3_client = boto3.client("s3")
+    presigned = []
+    for s3_url in s3_urls:
+        parsed_url = urlparse(s3_url)
+        presigned.append(s3_client.generate_presigned_url(
+            "get_object",
+            Params={"Bucket": parsed_url.netloc, "Key": parsed_url.path.lstrip("/")},
+            ExpiresIn=900
+        ))
+    return presigned
+
+
+async def _reference_video_seconds(reference_url: str | None) -> int | None:
+    if not reference_url:
+        return None
+    video_id = _get_video_id(reference_url)
+    if not video_id:
+        return None
+    try:
+        return await _get_youtube_video_duration(video_id=video_id)
+    except Exception as e:
+        logger.warning(f"Could not read reference video duration for planning: {e}")
+        return None
+
+
+async def plan_generation_job(
+    raw_video_urls: List[str],
+    reference_url: str | None,
+    version: str,
+    creator_notes: str,
+    channel_info: Dict[str, Any],
+    old_edits: Any = None
+) -> GenerationPlan:
+    """
+    Estimates the input tokens and cost of a job from ffprobe clip durations, the YouTube reference
+    duration and the prompt length, then picks the model, media resolution / fps and split strategy.
+    """
+    presigned = await asyncio.to_thread(_presigned_urls, raw_video_urls)
+    raw_durations, reference_seconds = await asyncio.gather(
+        probe_video_durations(presigned),
+        _reference_video_seconds(reference_url)
+    )
+
+    # 1. Prompt size (template + notes + channel info + old edits + reference summary)
+    prompt_text = "".join([
+        _prompt_template(bool(reference_url), version),
+        creator_notes or "",
+        json.dumps(channel_info or {}, default=str),
+        prompt_json(old_edits or {})
+    ])
+    prompt_tokens = estimate_text_tokens(prompt_text)
+    if reference_url:
+        prompt_tokens += constants.REF_SUMMARY_TOKENS_ESTIMATE
+
+    # 2. Raw video size at the default sampling
+    sized_durations = [d if d else constants.PLANNER_UNKNOWN_CLIP_SECONDS for d in raw_durations]
+    total_seconds = float(sum(sized_durations))
+    media_resolution = "default"
+    fps = None
+    raw_tokens = estimate_video_tokens(total_seconds)
+    strategy = choose_strategy(sized_durations, raw_tokens + prompt_tokens)
+
+    # 3. Direct requests that do not fit: lower the resolution, then the frame rate
+    budget = constants.PLANNER_INPUT_TOKEN_BUDGET
+    if strategy == "direct" and raw_tokens + prompt_tokens > budget:
+        media_resolution = "low"
+        raw_tokens = estimate_video_tokens(total_seconds, "low")
+        if raw_tokens + prompt_tokens > budget:
+            per_second_budget = (budget - prompt_tokens) / max(total_seconds, 1.0)
+            fitted_fps = math.floor((per_second_budget - constants.AUDIO_TOKENS_PER_SECOND) / constants.VIDEO_FRAME_TOKENS_LOW * 100) / 100
+            if fitted_fps >= constants.PLANNER_MIN_FPS:
+                fps = fitted_fps
+                raw_tokens = estimate_video_tokens(total_seconds, "low", fps)
+            else:
+                logger.warning(f"Raw videos do not fit a single request even at {constants.PLANNER_MIN_FPS} fps.")
+
+    # 4. Model, call shape and cost
+    if strategy == "map_reduce":
+        units = len(_plan_map_windows(len(sized_durations), sized_durations))
+        candidate_tokens = units * constants.MAP_CANDIDATES_OUTPUT_TOKENS_ESTIMATE
+        raw_edit_input = raw_tokens + units * prompt_tokens + (prompt_tokens + candidate_tokens)
+        raw_edit_output = candidate_tokens + constants.EDL_OUTPUT_TOKENS_ESTIMATE
+        model = constants.MAP_MODEL
+        raw_edit_cost = (
+            units * estimate_cost_usd(constants.MAP_MODEL, raw_tokens // units + prompt_tokens, constants.MAP_CANDIDATES_OUTPUT_TOKENS_ESTIMATE)
+            + estimate_cost_usd(constants.REDUCE_MODEL, prompt_tokens + candidate_tokens, constants.EDL_OUTPUT_TOKENS_ESTIMATE)
+        )
+    else:
+        raw_edit_input = raw_tokens + prompt_tokens
+        raw_edit_output = constants.EDL_OUTPUT_TOKENS_ESTIMATE
+        model = constants.MODEL_ROUTES["raw_edits"]["primary"]
+        if constants.PLANNER_FAST_MODEL_MAX_TOKENS and raw_edit_input <= constants.PLANNER_FAST_MODEL_MAX_TOKENS:
+            model = constants.PLANNER_FAST_MODEL
+        raw_edit_cost = estimate_cost_usd(model, raw_edit_input, raw_edit_output)
+
+    reference_tokens = 0
+    split_reference = None
+    reference_cost = 0.0
+    if reference_seconds:
+        reference_tokens = estimate_video_tokens(reference_seconds)
+        split_reference = reference_tokens >= constants.REF_SINGLE_CALL_TOKEN_LIMIT
+        reference_cost = estimate_cost_usd("gemini-2.5-pro", reference_tokens, constants.REF_SUMMARY_TOKENS_ESTIMATE)
+
+    plan = GenerationPlan(
+        raw_video_count=len(raw_video_urls),
+        raw_video_seconds=round(total_seconds, 2),
+        raw_video_durations=raw_durations,
+        reference_video_seconds=reference_seconds,
+        estimated_prompt_tokens=prompt_tokens,
+        estimated_raw_video_tokens=raw_tokens,
+        estimated_reference_tokens=reference_tokens,
+        estimated_raw_edit_input_tokens=raw_edit_input,
+        estimated_input_tokens=raw_edit_input + reference_tokens,
+        estimated_output_tokens=raw_edit_output + (constants.REF_SUMMARY_TOKENS_ESTIMATE if reference_seconds else 0),
+        estimated_cost_usd=round(raw_edit_cost + reference_cost, 4),
+        model=model,
+        media_resolution=media_resolution,
+        fps=fps,
+        strategy=strategy,
+        split_reference=split_reference
+    )
+    logger.info(f"Generation plan: {plan.model_dump_json()}")
+    return plan
+
+
+def token_usage_record(plan: GenerationPlan | None, usage: Dict[str, int] | None) -> Dict[str, Any]:
+    """
+    Builds the estimated-vs-actual record stored on the version and logs it for tuning. The estimate covers
+    the raw-edit call only (map and reduce calls for map_reduce), so it is compared with that call's usage;
+    the totals also count the draft, continuations and repairs.
+    """
+    usage = usage or {}
+    record = {
+        "estimated_input_tokens": plan.estimated_raw_edit_input_tokens if plan else None,
+        "actual_input_tokens": usage.get("raw_edit_input_tokens"),
+        "actual_output_tokens": usage.get("raw_edit_output_tokens"),
+        "total_input_tokens": usage.get("input_tokens"),
+        "total_output_tokens": usage.get("output_tokens"),
+        "model": plan.model if plan else None,
+        "strategy": plan.strategy if plan else None,
+        "media_resolution": plan.media_resolution if plan else None,
+        "fps": plan.fps if plan else None
+    }
+    if plan and usage.get("raw_edit_input_tokens"):
+        record["estimate_ratio"] = round(usage["raw_edit_input_tokens"] / max(plan.estimated_raw_edit_input_tokens, 1), 3)
+    logger.info(f"TOKEN_ESTIMATE_ACCURACY {json.dumps(record)}")
+    return record
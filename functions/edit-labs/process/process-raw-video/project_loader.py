@@ -0,0 +1,170 @@
+import asyncio
+import logging
+from typing import Any, Callable, Dict, List
+
+from boto3.dynamodb.conditions import Key
+
+from async_dynamodb import AsyncDynamoDB
+from dynamodb_helper import VERSIONS_LAYOUT_ITEMS, version_item_key
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Top-level project fields a generation job reads; every version's all_edits stays on the server
+PROJECT_FIELDS = ["channel_id", "raw_videos_url", "reference_video_link", "existing_file_names", "files_variables"]
+# ... plus the layout marker set by the versions migration
+HEAD_FIELDS = PROJECT_FIELDS + ["versions_layout"]
+
+
+def _version_number(version: str) -> int | None:
+    try:
+        return int(version[1:]) if version and version.startswith("v") else None
+    except ValueError:
+        return None
+
+
+def _projection(fields: List[str], version_indexes: List[int] | None = None) -> Dict[str, Any]:
+    names = {f"#f{i}": field for i, field in enumerate(fields)}
+    parts = list(names)
+    names['#versions'] = 'versions'
+    if version_indexes is None:
+        parts.append("#versions")
+    else:
+        parts.extend(f"#versions[{i}]" for i in version_indexes)
+    return {'projection': ", ".join(parts), 'names': names}
+
+
+def _find_version(versions: List[Dict[str, Any]], version: str) -> int | None:
+    return next((i for i, v in enumerate(versions) if v.get("version") == version), None)
+
+
+def _get_version_item_sync(editlabs_table, org_id: str, project_id: str, version: str) -> Dict[str, Any] | None:
+    return editlabs_table.get_item(Key=version_item_key(org_id, project_id, version)).get("Item")
+
+
+async def _read_project(db: AsyncDynamoDB, table_name: str, org_id: str, project_id: str, version: str) -> tuple[Dict[str, Any], int | None, List[Dict[str, Any]]]:
+    """
+    One lean read of the project item: the job's fields, `versions_layout` and the slots of the legacy versions
+    list where the target and previous versions are expected (vN at index N-1). Only a project the head marks
+    as migrated then reads its target / previous version items (concurrently); a legacy project needs no
+    other read unless the guessed slots miss, when the versions list is read whole.
+    Returns (project, version index, versions read); the index is None for version items and set only
+    for a project still on the legacy versions list.
+    """
+    key = {'org_id': org_id, 'project_id': project_id}
+    number = _version_number(version)
+    guessed_index = number - 1 if number else None
+    indexes = None
+    if guessed_index is not None:
+        indexes = [guessed_index - 1, guessed_index] if guessed_index > 0 else [guessed_index]
+
+    project = await db.get_item(table_name, key, **_projection(HEAD_FIELDS, indexes))
+    if project is None:
+        raise ValueError(f"Project '{project_id}' not found for org '{org_id}'")
+
+    version_items = []
+    if project.get("versions_layout") == VERSIONS_LAYOUT_ITEMS:
+        wanted = [version] + ([f"v{number - 1}"] if number and number > 1 else [])
+        version_items = await asyncio.gather(*[db.get_item(table_name, version_item_key(org_id, project_id, v)) for v in wanted])
+        if version_items[0]:
+            return project, None, [item for item in version_items if item]
+        # Migrated, but the version was appended to the list by a writer still on the legacy layout
+        logger.info(f"Version {version} of project {project_id} is not a version item, reading the legacy versions list.")
+
+    def with_previous_item(versions: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        listed = {v.get("version") for v in versions}
+        return versions + [item for item in version_items[1:] if item and item.get("version") not in listed]
+
+    versions = project.get("versions", [])
+    if indexes is not None:
+        read_indexes = indexes[:len(versions)]
+        position = _find_version(versions, version)
+        if position is not None and read_indexes[position] == guessed_index:
+            return project, guessed_index, with_previous_item(versions)
+        logger.info(f"Version {version} is not at index {guessed_index}, reading the whole versions list.")
+
+    project = await db.get_item(table_name, key, **_projection(HEAD_FIELDS))
+    if project is None:
+        raise ValueError(f"Project '{project_id}' not found for org '{org_id}'")
+    versions = project.get("versions", [])
+    version_index = _find_version(versions, version)
+    if version_index is None:
+        raise ValueError(f"Version '{version}' not found in project '{project_id}'")
+    return project, version_index, with_previous_item(versions)
+
+
+def version_loader(editlabs_table, org_id: str, project_id: str, legacy: bool) -> Callable[[str], Dict[str, Any] | None]:
+    """
+    Blocking reader of other versions of the project (the bases of delta-encoded EDLs). Looks in the layout the
+    job runs on first, then in the other one, since a project can hold versions in both.
+    """
+    def load_listed(version: str) -> Dict[str, Any] | None:
+        item = editlabs_table.get_item(
+            Key={'org_id': org_id, 'project_id': project_id},
+            ProjectionExpression="#versions",
+            ExpressionAttributeNames={'#versions': 'versions'}
+        ).get("Item") or {}
+        return next((v for v in item.get("versions", []) if v.get("version") == version), None)
+
+    def load_item(version: str) -> Dict[str, Any] | None:
+        return _get_version_item_sync(editlabs_table, org_id, project_id, version)
+
+    def load(version: str) -> Dict[str, Any] | None:
+        first, second = (load_listed, load_item) if legacy else (load_item, load_listed)
+        return first(version) or second(version)
+    return load
+
+
+async def _read_channel_context(db: AsyncDynamoDB, table_name: str, org_id: str, channel_id: str) -> Dict[str, Any]:
+    """Latest CHANNEL_CONTEXT#<channel_id># item: one descending query with Limit 1."""
+    context_items = await db.query_all(
+        table_name,
+        Key('org_id').eq(org_id) & Key('id').begins_with(f"CHANNEL_CONTEXT#{channel_id}#"),
+        projection="id, channel_info_for_thumbnails",
+        limit=1,
+        scan_forward=False
+    )
+    if not context_items:
+        raise ValueError(f"No context data found for org_id={org_id} and channel_id={channel_id}")
+    return context_items[0]
+
+
+async def load_project_context(
+    db: AsyncDynamoDB,
+    editlabs_table_name: str,
+    recc_table_name: str,
+    org_id: str,
+    project_id: str,
+    version: str,
+    channel_id: str | None = None
+) -> Dict[str, Any]:
+    """
+    Startup reads of a generation job: the project head, the target and previous versions (lean reads) and
+    the channel context. When the payload names the channel, all of them run concurrently.
+    Returns {"project", "version_index", "version_data", "old_version_data", "channel_info"}; version_index is
+    None unless the project is still on the legacy versions list.
+    """
+    project_read = _read_project(db, editlabs_table_name, org_id, project_id, version)
+    if channel_id:
+        (project, version_index, versions), context_item = await asyncio.gather(
+            project_read,
+            _read_channel_context(db, recc_table_name, org_id, channel_id)
+        )
+        if project.get("channel_id") and project["channel_id"] != channel_id:
+            raise ValueError(f"Payload channel_id {channel_id} does not match project '{project_id}'")
+    else:
+        project, version_index, versions = await project_read
+        channel_id = project.get("channel_id")
+        if not channel_id:
+            raise ValueError(f"Job {project_id} is missing 'channel_id'.")
+        context_item = await _read_channel_context(db, recc_table_name, org_id, channel_id)
+
+    by_version = {v.get("version"): v for v in versions}
+    number = _version_number(version)
+    return {
+        "project": project,
+        "version_index": version_index,
+        "version_data": by_version.get(version),
+        "old_version_data": by_version.get(f"v{number - 1}") if number and number > 1 else None,
+        "channel_info": context_item.get("channel_info_for_thumbnails", {})
+    }
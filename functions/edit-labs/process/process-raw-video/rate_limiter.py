@@ -0,0 +1,274 @@
+import asyncio
+import contextvars
+import logging
+import math
+import random
+import time
+from contextlib import asynccontextmanager
+from typing import Any, Dict
+
+import constants
+from async_dynamodb import get_async_dynamodb, is_conditional_check_failed
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Set once per job in main(); tasks and threads started afterwards inherit it
+current_org_id: contextvars.ContextVar[str] = contextvars.ContextVar("current_org_id", default="")
+
+WINDOW_SECONDS = 60
+
+
+def _org_weight(org_id: str) -> float:
+    return float(constants.RATE_LIMIT_ORG_WEIGHTS.get(org_id, constants.RATE_LIMIT_DEFAULT_ORG_WEIGHT))
+
+
+def _seconds_to_next_window() -> float:
+    return WINDOW_SECONDS - (time.time() % WINDOW_SECONDS)
+
+
+class _LocalBucket:
+    """In-process token bucket for one Gemini quota (requests and tokens per minute)."""
+
+    def __init__(self, rpm: int, tpm: int | None):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.requests = float(rpm)
+        self.tokens = float(tpm) if tpm else 0.0
+        self.updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        elapsed = now - self.updated
+        self.updated = now
+        self.requests = min(self.rpm, self.requests + elapsed * self.rpm / WINDOW_SECONDS)
+        if self.tpm:
+            self.tokens = min(self.tpm, self.tokens + elapsed * self.tpm / WINDOW_SECONDS)
+
+    def try_acquire(self, tokens: int) -> float:
+        """Takes one request (and `tokens`) from the bucket. Returns 0, or the seconds to wait before retrying."""
+        self._refill()
+        tokens = min(tokens, self.tpm) if self.tpm else 0
+        if self.requests < 1:
+            return (1 - self.requests) * WINDOW_SECONDS / self.rpm
+        if self.tpm and self.tokens < tokens:
+            return (tokens - self.tokens) * WINDOW_SECONDS / self.tpm
+        self.requests -= 1
+        self.tokens -= tokens
+        return 0.0
+
+    def consume_tokens(self, tokens: int) -> None:
+        # May go negative: later requests then wait until the overdraft has refilled. A negative `tokens`
+        # refunds an over-reservation
+        self._refill()
+        if self.tpm:
+            self.tokens = min(self.tpm, self.tokens - tokens)
+
+
+class GeminiRateLimiter:
+    """
+    Shared request/token-per-minute limiter for Gemini quotas (constants.GEMINI_RATE_LIMITS).
+
+    Every ECS task counts against the same per-minute window items in the rate-limit DynamoDB table.
+    A single conditional UpdateItem takes a slot only if the global window, and this org's weighted share
+    of it, still have room. An org's share is its weight over the summed weights of the orgs active in the
+    window, so one busy org cannot starve the others while a lone org still gets the whole quota.
+
+    A slot reserves the tokens its call is expected to use (the running average of this process's real
+    usage for the model, or its "reserve_tokens" before any) and is settled with the real usage afterwards,
+    so concurrent jobs cannot all pass the TPM check on an empty reservation.
+    Without a table the limiter uses an in-process token bucket; after a DynamoDB error it does so for
+    RATE_LIMIT_FALLBACK_SECONDS and then goes back to the shared table. Window updates go through the pooled
+    AsyncDynamoDB client.
+    """
+
+    def __init__(self):
+        self._configured = bool(constants.RATE_LIMIT_TABLE_NAME)
+        self._fallback_until = 0.0
+        self._local: Dict[str, _LocalBucket] = {}
+        self._active_orgs: Dict[str, set] = {}
+        self._usage_estimates: Dict[str, float] = {}
+
+    @property
+    def _distributed(self) -> bool:
+        return self._configured and time.monotonic() >= self._fallback_until
+
+    def _local_bucket(self, bucket: str, limits: Dict[str, Any]) -> _LocalBucket:
+        if bucket not in self._local:
+            self._local[bucket] = _LocalBucket(limits["rpm"], limits.get("tpm"))
+        return self._local[bucket]
+
+    def _fall_back(self, error: Exception) -> None:
+        logger.warning(
+            f"Distributed rate limiter unavailable, using the in-process limiter for "
+            f"{constants.RATE_LIMIT_FALLBACK_SECONDS:.0f}s: {error}"
+        )
+        self._fallback_until = time.monotonic() + constants.RATE_LIMIT_FALLBACK_SECONDS
+
+    def expected_tokens(self, bucket: str) -> int:
+        """Tokens a call on `bucket` reserves up front."""
+        limits = constants.GEMINI_RATE_LIMITS.get(bucket) or {}
+        if not limits.get("tpm"):
+            return 0
+        return int(self._usage_estimates.get(bucket, limits.get("reserve_tokens", 0)))
+
+    def observe_usage(self, bucket: str, tokens: int) -> None:
+        """Folds a call's real usage into the bucket's running estimate (exponential moving average)."""
+        previous = self._usage_estimates.get(bucket)
+        self._usage_estimates[bucket] = tokens if previous is None else 0.7 * previous + 0.3 * tokens
+
+    async def _try_acquire_distributed(self, bucket: str, limits: Dict[str, Any], tokens: int, window: int) -> float:
+        """One conditional UpdateItem on `window`. Returns 0, or the seconds to wait."""
+        org_id = current_org_id.get() or "default"
+        active = self._active_orgs.setdefault(bucket, set()) | {org_id}
+        org_share = _org_weight(org_id) / sum(_org_weight(org) for org in active)
+        org_rpm = max(1, math.floor(limits["rpm"] * org_share))
+        tpm = limits.get("tpm")
+        tokens = min(tokens, tpm) if tpm else tokens
+
+        condition = "(attribute_not_exists(#requests) OR #requests < :rpm) AND (attribute_not_exists(#org_requests) OR #org_requests < :org_rpm)"
+        values = {
+            ':one': 1,
+            ':tokens': tokens,
+            ':orgs': {org_id},
+            ':rpm': limits["rpm"],
+            ':org_rpm': org_rpm,
+            ':expires_at': (window + 2) * WINDOW_SECONDS
+        }
+        if tpm:
+            condition += " AND (attribute_not_exists(#tokens) OR #tokens <= :token_room)"
+            values[':token_room'] = tpm - tokens
+
+        db = get_async_dynamodb()
+        table_name = constants.RATE_LIMIT_TABLE_NAME
+        key = {'pk': f"RATE#{bucket}#{window}"}
+        names = {
+            '#requests': 'requests',
+            '#tokens': 'tokens',
+            '#orgs': 'orgs',
+            '#org_requests': f"requests#{org_id}",
+            '#expires_at': 'expires_at'
+        }
+        try:
+            attributes = await db.update_item(
+                table_name,
+                key,
+                "ADD #requests :one, #tokens :tokens, #org_requests :one, #orgs :orgs SET #expires_at = :expires_at",
+                names=names,
+                values=values,
+                condition=condition,
+                return_values="ALL_NEW"
+            )
+            self._active_orgs[bucket] = set(attributes.get("orgs", set()))
+            return 0.0
+        except Exception as e:
+            if not is_conditional_check_failed(e):
+                raise
+
+        # Window is full for us: still register the org so the others shrink to their share
+        attributes = await db.update_item(
+            table_name,
+            key,
+            "ADD #orgs :orgs SET #expires_at = :expires_at",
+            names={'#orgs': 'orgs', '#expires_at': 'expires_at'},
+            values={':orgs': {org_id}, ':expires_at': values[':expires_at']},
+            return_values="ALL_NEW"
+        )
+        self._active_orgs[bucket] = set(attributes.get("orgs", set()))
+        return _seconds_to_next_window()
+
+    async def acquire(self, bucket: str, tokens: int = 0) -> int | None:
+        """
+        Waits until `bucket` has room for one request of ~`tokens` tokens and reserves them. Returns the shared
+        window the reservation was charged to, or None for the in-process bucket.
+        """
+        limits = constants.GEMINI_RATE_LIMITS.get(bucket)
+        if not limits:
+            return None
+
+        waited = 0.0
+        while True:
+            wait = None
+            window = None
+            if self._distributed:
+                window = int(time.time() // WINDOW_SECONDS)
+                try:
+                    wait = await self._try_acquire_distributed(bucket, limits, tokens, window)
+                except Exception as e:
+                    self._fall_back(e)
+                    window = None
+            if wait is None:
+                wait = self._local_bucket(bucket, limits).try_acquire(tokens)
+            if wait == 0:
+                if waited:
+                    logger.info(f"Rate limiter: {bucket} slot acquired after waiting {waited:.1f}s.")
+                return window
+            # Jitter spreads the tasks that were all waiting on the same window boundary
+            wait += random.uniform(0, 1)
+            waited += wait
+            await asyncio.sleep(wait)
+
+    async def consume_tokens(self, bucket: str, tokens: int, window: int | None = None) -> None:
+        """
+        Settles a reservation with the real usage: charges the `tokens` used beyond it, or refunds them when
+        negative. A refund only goes back to the shared window the reservation was charged to, if still current.
+        """
+        limits = constants.GEMINI_RATE_LIMITS.get(bucket)
+        if not limits or not limits.get("tpm") or not tokens:
+            return
+        current_window = int(time.time() // WINDOW_SECONDS)
+        if tokens < 0:
+            # Refund to wherever the reservation was charged
+            if window is None:
+                self._local_bucket(bucket, limits).consume_tokens(tokens)
+                return
+            if window != current_window or not self._distributed:
+                return
+        if self._distributed:
+            try:
+                await get_async_dynamodb().update_item(
+                    constants.RATE_LIMIT_TABLE_NAME,
+                    {'pk': f"RATE#{bucket}#{current_window}"},
+                    "ADD #tokens :tokens",
+                    names={'#tokens': 'tokens'},
+                    values={':tokens': tokens}
+                )
+                return
+            except Exception as e:
+                self._fall_back(e)
+        self._local_bucket(bucket, limits).consume_tokens(tokens)
+
+
+class _Slot:
+    def __init__(self, reserved_tokens: int, window: int | None):
+        self.reserved_tokens = reserved_tokens
+        self.window = window
+        self.used_tokens = None
+
+    def record(self, response: Any) -> None:
+        """Records the real token usage from a Gemini response's usage_metadata."""
+        usage = getattr(response, "usage_metadata", None)
+        if usage is not None:
+            self.used_tokens = (usage.prompt_token_count or 0) + (usage.candidates_token_count or 0)
+
+
+rate_limiter = GeminiRateLimiter()
+
+
+@asynccontextmanager
+async def gemini_slot(bucket: str, tokens: int | None = None):
+    """
+    Waits for a slot on `bucket` (a model name, or "files" for uploads) and yields it. The slot reserves
+    `tokens`, by default rate_limiter.expected_tokens(bucket). Call slot.record(response) so the reservation
+    is settled with the real token usage; without it the reservation stays charged.
+    """
+    if tokens is None:
+        tokens = rate_limiter.expected_tokens(bucket)
+    window = await rate_limiter.acquire(bucket, tokens)
+    slot = _Slot(tokens, window)
+    try:
+        yield slot
+    finally:
+        if slot.used_tokens is not None:
+            rate_limiter.observe_usage(bucket, slot.used_tokens)
+            await rate_limiter.consume_tokens(bucket, slot.used_tokens - slot.reserved_tokens, slot.window)
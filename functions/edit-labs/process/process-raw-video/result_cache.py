@@ -0,0 +1,201 @@
+import asyncio
+import gzip
+import hashlib
+import json
+import logging
+import time
+from pathlib import PurePosixPath
+from typing import Any, Dict, List
+from urllib.parse import urlparse
+
+import boto3
+
+import constants
+import json_codec
+from async_dynamodb import get_async_dynamodb
+from gemini_helper import _get_video_id
+from planner import GenerationPlan, _prompt_template
+from retry_policy import get_retry_policy
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+def _sha256(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _raw_video_etag(s3_client, s3_url: str) -> str:
+    """Content identity of a raw video: its S3 ETag, read with a HEAD request."""
+    parsed_url = urlparse(s3_url)
+    head = get_retry_policy("s3").run_sync(
+        lambda: s3_client.head_object(Bucket=parsed_url.netloc, Key=parsed_url.path.lstrip("/")),
+        label=f"S3 HEAD {s3_url}"
+    )
+    return head["ETag"].strip('"')
+
+
+async def result_cache_key(
+    org_id: str,
+    raw_video_urls: List[str],
+    reference_url: str | None,
+    channel_info: Dict[str, Any],
+    creator_notes: str,
+    old_edits: Any,
+    version: str,
+    plan: GenerationPlan | None
+) -> str:
+    """
+    Hash of every input that shapes the generated edits; identical inputs give identical keys. The raw videos
+    count by file name as well as content (edits name their source video) and keys never match across orgs.
+    """
+    s3_client = boto3.client("s3")
+    etags = await asyncio.gather(*[asyncio.to_thread(_raw_video_etag, s3_client, url) for url in raw_video_urls])
+    names = [PurePosixPath(urlparse(url).path).name for url in raw_video_urls]
+    inputs = {
+        "cache_version": constants.RESULT_CACHE_VERSION,
+        "org_id": org_id,
+        "raw_videos": [[name, etag] for name, etag in zip(names, etags)],
+        "reference": _get_video_id(reference_url) or reference_url,
+        "channel_info": channel_info,
+        "creator_notes": creator_notes,
+        "old_edits": old_edits,
+        "prompt_template": _sha256(_prompt_template(bool(reference_url), version)),
+        "model": plan.model if plan else constants.MODEL_ROUTES["raw_edits"]["primary"],
+        "strategy": plan.strategy if plan else None,
+        "media_resolution": plan.media_resolution if plan else None,
+        "fps": plan.fps if plan else None,
+        "temperature": constants.GEMINI_TEMPERATURE
+    }
+    return _sha256(json.dumps(inputs, sort_keys=True, default=str))
+
+
+class ResultCache:
+    """
+    Finished generation results in RESULT_CACHE_TABLE_NAME, one item per input hash:
+    {"pk": "RESULT#<key>", "org_id", "edits" (gzipped JSON), "size_bytes", "usage", "created_at", "expires_at"}.
+
+    Every org also has an "INDEX#<org_id>" item listing its entries oldest first with their sizes; when the
+    total passes RESULT_CACHE_MAX_ORG_BYTES, or the list passes RESULT_CACHE_MAX_ORG_ENTRIES (which keeps the
+    index item far below DynamoDB's 400 KB item limit), the oldest entries are deleted. The DynamoDB TTL on expires_at
+    removes entries after RESULT_CACHE_TTL_SECONDS. Cache failures are logged and never fail a job.
+    Reads and writes go through the pooled AsyncDynamoDB client.
+    """
+
+    @property
+    def enabled(self) -> bool:
+        return bool(constants.RESULT_CACHE_TABLE_NAME)
+
+    @property
+    def table_name(self) -> str:
+        return constants.RESULT_CACHE_TABLE_NAME
+
+    async def _get(self, key: str) -> Dict[str, Any] | None:
+        item = await get_async_dynamodb().get_item(self.table_name, {'pk': f"RESULT#{key}"})
+        # TTL deletion lags behind expiry, so check it here too
+        if not item or int(item.get("expires_at", 0)) < time.time():
+            return None
+        return {
+            "all_edits": json.loads(gzip.decompress(bytes(item["edits"]))),
+            "usage": item.get("usage"),
+            "created_at": item.get("created_at")
+        }
+
+    async def get(self, key: str) -> Dict[str, Any] | None:
+        """Returns {"all_edits", "usage", "created_at"} for a cached result, or None on a miss."""
+        if not self.enabled:
+            return None
+        try:
+            return await self._get(key)
+        except Exception as e:
+            logger.warning(f"Result cache lookup failed, generating instead: {e}")
+            return None
+
+    async def _put(self, key: str, org_id: str, all_edits: List[Dict[str, Any]], usage: Dict[str, Any] | None) -> None:
+        edits = gzip.compress(json_codec.dumps(all_edits))
+        if len(edits) > constants.RESULT_CACHE_MAX_ENTRY_BYTES:
+            logger.info(f"Result of {len(edits)} bytes is over the cache entry limit, not caching it.")
+            return
+
+        now = int(time.time())
+        expires_at = now + constants.RESULT_CACHE_TTL_SECONDS
+        db = get_async_dynamodb()
+        await db.put_item(self.table_name, {
+            'pk': f"RESULT#{key}",
+            'org_id': org_id,
+            'edits': edits,
+            'size_bytes': len(edits),
+            'usage': usage or {},
+            'created_at': now,
+            'expires_at': expires_at
+        })
+        try:
+            index = await self._append_to_index(org_id, key, len(edits), expires_at)
+        except Exception as e:
+            if "item size" not in str(e).lower():
+                raise
+            # An index that outgrew the item limit before RESULT_CACHE_MAX_ORG_ENTRIES existed can never be
+            # appended to; start it over (its entries still expire through the TTL)
+            logger.error(f"Result cache index of org {org_id} is over the item size limit, resetting it.")
+            await db.delete_item(self.table_name, {'pk': f"INDEX#{org_id}"})
+            index = await self._append_to_index(org_id, key, len(edits), expires_at)
+        await self._evict(org_id, index.get("entries", []), int(index.get("total_bytes", 0)), now)
+
+    async def _append_to_index(self, org_id: str, key: str, size_bytes: int, expires_at: int) -> Dict[str, Any]:
+        return await get_async_dynamodb().update_item(
+            self.table_name,
+            {'pk': f"INDEX#{org_id}"},
+            "SET #entries = list_append(if_not_exists(#entries, :empty), :entry), #expires_at = :expires_at ADD #total_bytes :size",
+            names={'#entries': 'entries', '#expires_at': 'expires_at', '#total_bytes': 'total_bytes'},
+            values={
+                ':empty': [],
+                ':entry': [{'key': key, 'size_bytes': size_bytes, 'expires_at': expires_at}],
+                ':expires_at': expires_at,
+                ':size': size_bytes
+            },
+            return_values="ALL_NEW"
+        )
+
+    async def _evict(self, org_id: str, entries: List[Dict[str, Any]], total_bytes: int, now: int) -> None:
+        """Drops expired entries and then the oldest ones until the org is back under its byte and entry budgets."""
+        evict_count = 0
+        freed = 0
+        for entry in entries[:-1]:
+            expired = int(entry.get("expires_at", 0)) < now
+            over_bytes = total_bytes - freed > constants.RESULT_CACHE_MAX_ORG_BYTES
+            over_entries = len(entries) - evict_count > constants.RESULT_CACHE_MAX_ORG_ENTRIES
+            if not (expired or over_bytes or over_entries):
+                break
+            evict_count += 1
+            freed += int(entry.get("size_bytes", 0))
+        if not evict_count:
+            return
+
+        db = get_async_dynamodb()
+        latest_key = entries[-1].get("key")
+        # An older index row for a key that was just re-cached is skipped; its item now holds the new result
+        await asyncio.gather(*[
+            db.delete_item(self.table_name, {'pk': f"RESULT#{entry['key']}"})
+            for entry in entries[:evict_count]
+            if entry.get("key") != latest_key
+        ])
+        # Positional removes assume no concurrent eviction for this org; a race only leaves stale index rows
+        await db.update_item(
+            self.table_name,
+            {'pk': f"INDEX#{org_id}"},
+            "REMOVE " + ", ".join(f"#entries[{i}]" for i in range(evict_count)) + " ADD #total_bytes :freed",
+            names={'#entries': 'entries', '#total_bytes': 'total_bytes'},
+            values={':freed': -freed}
+        )
+        logger.info(f"Evicted {evict_count} cached results ({freed} bytes) for org {org_id}.")
+
+    async def put(self, key: str, org_id: str, all_edits: List[Dict[str, Any]], usage: Dict[str, Any] | None = None) -> None:
+        if not self.enabled:
+            return
+        try:
+            await self._put(key, org_id, all_edits, usage)
+        except Exception as e:
+            logger.error(f"Failed to cache the generated result for org {org_id}: {e}")
+
+
+result_cache = ResultCache()
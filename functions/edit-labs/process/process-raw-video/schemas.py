@@ -1,4 +1,4 @@
-from pydantic import BaseModel,Field
+from pydantic import BaseModel,Field,TypeAdapter
 from typing import List
 from datetime import timedelta
 
@@ -23,3 +23,22 @@ class EditSchema(BaseModel):
 
 class RawVideoResponseSchema(BaseModel):
     all_edits:List[EditSchema]=Field(description="list of all the edit jsons each containing start_time,end_time,duration_seconds,shot_description,music_description,colour_description,notes")
+
+
+# Built once at import; used to validate salvaged / streamed edits without a wrapping model
+EDIT_LIST_ADAPTER = TypeAdapter(List[EditSchema])
+EDIT_ADAPTER = TypeAdapter(EditSchema)
+
+
+class CandidateMomentSchema(BaseModel):
+    source_video_index: int = Field(..., description="The index(1,2,3,4,....) of the raw input video file this moment comes from.")
+    start_time:timedelta=Field(description="the time stamp in the full source video where the moment begins.")
+    end_time:timedelta=Field(description="the time stamp in the full source video where the moment ends.")
+    moment_description:str=Field(description="What happens on screen and in the audio during this moment.")
+    why_it_matters:str=Field(description="Why this moment is worth using, with reference to the creator notes and channel identity.")
+    suggested_role:str=Field(description="The role this moment could play in the final short like hook, setup, payoff, b-roll or call to action.")
+    strength:int=Field(description="How strong this moment is for the final short on a scale of 1 (weak) to 10 (must use).")
+
+
+class CandidateMomentsSchema(BaseModel):
+    candidates:List[CandidateMomentSchema]=Field(description="list of the candidate moments found in the analysed video or video window")
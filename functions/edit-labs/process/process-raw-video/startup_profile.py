@@ -0,0 +1,47 @@
+import time
+
+# Imported first by app.py, so this is (close to) the start of the job's own imports
+_START = time.perf_counter()
+
+import json
+import logging
+from contextlib import contextmanager
+
+import constants
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+_phases: dict[str, float] = {}
+_reported = False
+
+
+def mark(phase: str) -> None:
+    """Records the seconds from startup until now as `phase`."""
+    _phases[phase] = round(time.perf_counter() - _START, 3)
+
+
+@contextmanager
+def timed(phase: str):
+    """Records how long the block took as `phase` (e.g. a branch's deferred imports)."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        _phases[phase] = round(time.perf_counter() - started, 3)
+
+
+def report(branch: str) -> dict:
+    """
+    Logs one STARTUP_PROFILE line (phases, total seconds to `branch` being ready) once per run, and a warning
+    when the total is over STARTUP_TARGET_SECONDS. Per-module timings come from PYTHONPROFILEIMPORTTIME=1.
+    """
+    global _reported
+    mark("ready")
+    profile = {"branch": branch, "phases": dict(_phases), "target_seconds": constants.STARTUP_TARGET_SECONDS}
+    if not _reported:
+        _reported = True
+        logger.info("STARTUP_PROFILE " + json.dumps(profile))
+        if _phases["ready"] > constants.STARTUP_TARGET_SECONDS:
+            logger.warning(f"Startup took {_phases['ready']}s, over the {constants.STARTUP_TARGET_SECONDS}s target.")
+    return profile
@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# The pipeline's modules are imported flat, as in the container's working directory
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
@@ -0,0 +1,102 @@
+import logging
+from datetime import timedelta
+
+from edl_validator import validate_and_repair_edits, whole_seconds
+
+NAMES = ["intro.mp4", "main.mp4"]
+DURATIONS = [60.0, 120.0]
+
+
+def edit(sequence_index, start, end, source=1, name="intro.mp4", duration=None):
+    return {
+        "sequence_index": sequence_index,
+        "source_video_index": source,
+        "source_video_name": name,
+        "start_time": timedelta(seconds=start),
+        "end_time": timedelta(seconds=end),
+        "duration_seconds": end - start if duration is None else duration
+    }
+
+
+def spans(edits):
+    return [(e["source_video_index"], whole_seconds(e["start_time"]), whole_seconds(e["end_time"])) for e in edits]
+
+
+def test_valid_edl_is_unchanged(caplog):
+    caplog.set_level(logging.INFO)
+    edits, problems = validate_and_repair_edits([edit(1, 0, 10), edit(2, 5, 20, 2, "main.mp4")], NAMES, DURATIONS)
+    assert problems == []
+    assert spans(edits) == [(1, 0, 10), (2, 5, 20)]
+    assert "fixes={'source': 0, 'swapped': 0, 'clamped': 0, 'overlap': 0, 'duration': 0, 'order': 0}" in caplog.text
+
+
+def test_name_wins_over_index():
+    edits, problems = validate_and_repair_edits([edit(1, 0, 10, source=1, name="MAIN.mp4")], NAMES, DURATIONS)
+    assert problems == []
+    assert edits[0]["source_video_index"] == 2
+    assert edits[0]["source_video_name"] == "main.mp4"
+
+
+def test_unknown_name_falls_back_to_index():
+    edits, problems = validate_and_repair_edits([edit(1, 0, 10, source=2, name="clip (1).mp4")], NAMES, DURATIONS)
+    assert problems == []
+    assert edits[0]["source_video_name"] == "main.mp4"
+
+
+def test_unknown_source_is_a_problem():
+    _, problems = validate_and_repair_edits([edit(1, 0, 10, source=7, name="other.mp4")], NAMES, DURATIONS)
+    assert [p["position"] for p in problems] == [0]
+
+
+def test_swapped_bounds_and_clamping():
+    edits, problems = validate_and_repair_edits([edit(1, 30, 10), edit(2, 50, 90)], NAMES, DURATIONS)
+    assert problems == []
+    assert spans(edits) == [(1, 10, 30), (1, 50, 60)]
+    assert edits[1]["duration_seconds"] == 10
+
+
+def test_start_past_clip_end_is_a_problem():
+    _, problems = validate_and_repair_edits([edit(1, 70, 80)], NAMES, DURATIONS)
+    assert [p["position"] for p in problems] == [0]
+
+
+def test_overlap_is_trimmed_against_all_earlier_segments():
+    # The third segment overlaps both earlier ones; only the gap between them is left
+    edits, problems = validate_and_repair_edits([edit(1, 0, 10), edit(2, 20, 30), edit(3, 5, 25)], NAMES, DURATIONS)
+    assert problems == []
+    assert spans(edits) == [(1, 0, 10), (1, 20, 30), (1, 10, 20)]
+
+
+def test_trimming_does_not_reopen_an_earlier_overlap():
+    edits, problems = validate_and_repair_edits([edit(1, 10, 20), edit(2, 0, 8), edit(3, 5, 30)], NAMES, DURATIONS)
+    assert problems == []
+    assert spans(edits)[2] == (1, 20, 30)
+
+
+def test_fully_covered_segment_is_a_problem():
+    _, problems = validate_and_repair_edits([edit(1, 0, 10), edit(2, 10, 20), edit(3, 2, 18)], NAMES, DURATIONS)
+    assert [p["position"] for p in problems] == [2]
+
+
+def test_same_span_of_another_clip_is_not_an_overlap():
+    edits, problems = validate_and_repair_edits([edit(1, 0, 10), edit(2, 0, 10, 2, "main.mp4")], NAMES, DURATIONS)
+    assert problems == []
+    assert spans(edits) == [(1, 0, 10), (2, 0, 10)]
+
+
+def test_sequence_is_renumbered_in_order():
+    edits, _ = validate_and_repair_edits([edit(5, 20, 30), edit(2, 0, 10)], NAMES, DURATIONS)
+    assert [e["sequence_index"] for e in edits] == [1, 2]
+    assert spans(edits) == [(1, 0, 10), (1, 20, 30)]
+
+
+def test_duration_matches_the_rounded_bounds():
+    edits, _ = validate_and_repair_edits([edit(1, 0.6, 10.4, duration=10)], NAMES, DURATIONS)
+    assert spans(edits) == [(1, 1, 10)]
+    assert edits[0]["duration_seconds"] == 9
+
+
+def test_unknown_durations_skip_clamping():
+    edits, problems = validate_and_repair_edits([edit(1, 0, 500)], NAMES, [None, None])
+    assert problems == []
+    assert spans(edits) == [(1, 0, 500)]
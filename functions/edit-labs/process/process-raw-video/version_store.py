@@ -0,0 +1,206 @@
+import asyncio
+from datetime import datetime, timezone
+from typing import Any, Dict, List
+
+import constants
+from async_dynamodb import AsyncDynamoDB, get_async_dynamodb
+from dynamodb_helper import version_item_key
+from edl_codec import CODEC_DELTA, encode_edits, offload_record, snapshot_uri, write_snapshot
+from json_codec import to_dynamodb
+
+
+class VersionStore:
+    """
+    Writes to one version of an edit-labs project.
+
+    Migrated projects keep each version in its own item ("<project_id>#VERSION#vN"); legacy projects still
+    hold them in the project item's `versions` list, addressed by `version_index`. path() and names() build
+    the matching attribute paths, so callers write the same expressions for both layouts.
+    Every write also stamps the version's and the project's `updated_at`.
+
+    Reads and writes go through the pooled AsyncDynamoDB client; `table` (a boto3 Table) is kept for the
+    blocking writes of the SIGTERM handler.
+    """
+
+    def __init__(
+        self,
+        table,
+        org_id: str,
+        project_id: str,
+        version: str,
+        version_index: int | None = None,
+        db: AsyncDynamoDB | None = None
+    ):
+        self.table = table
+        self.table_name = table.name
+        self.db = db or get_async_dynamodb()
+        self.org_id = org_id
+        self.project_id = project_id
+        self.version = version
+        # None for version items, the list position for the legacy layout
+        self.version_index = version_index
+
+    @property
+    def legacy_layout(self) -> bool:
+        return self.version_index is not None
+
+    @property
+    def project_key(self) -> Dict[str, str]:
+        return {'org_id': self.org_id, 'project_id': self.project_id}
+
+    @property
+    def key(self) -> Dict[str, str]:
+        """Key of the item that holds the version's attributes."""
+        if self.legacy_layout:
+            return self.project_key
+        return version_item_key(self.org_id, self.project_id, self.version)
+
+    def path(self, attribute: str) -> str:
+        """Expression path of a version attribute placeholder (e.g. "#status")."""
+        if self.legacy_layout:
+            return f"#versions[{self.version_index}].{attribute}"
+        return attribute
+
+    def names(self, names: Dict[str, str]) -> Dict[str, str]:
+        """ExpressionAttributeNames for expressions built with path()."""
+        return {**names, '#versions': 'versions'} if self.legacy_layout else dict(names)
+
+    def stamp(self, time_now: str | None = None) -> tuple[List[str], Dict[str, str], Dict[str, Any]]:
+        """
+        (SET parts, names, values) that stamp the version's `updated_at`, plus the project item's in the legacy
+        layout, for writes built outside update(); the versions migration relies on every write moving them.
+        """
+        values = {':updated_at': time_now or datetime.now(timezone.utc).isoformat()}
+        parts = [f"{self.path('#updated_at')} = :updated_at"]
+        names = {'#updated_at': 'updated_at'}
+        if self.legacy_layout:
+            parts.append("#out_updated_at = :updated_at")
+            names['#out_updated_at'] = 'updated_at'
+        return parts, names, values
+
+    async def get_version(self, attributes: List[str] | None = None) -> Dict[str, Any]:
+        """Reads the version's current attributes (only `attributes` when given)."""
+        projection, names = None, None
+        if attributes:
+            placeholders = {f"#a{i}": attribute for i, attribute in enumerate(attributes)}
+            projection = ", ".join(self.path(placeholder) for placeholder in placeholders)
+            names = self.names(placeholders)
+        elif self.legacy_layout:
+            projection = f"#versions[{self.version_index}]"
+            names = {'#versions': 'versions'}
+        item = await self.db.get_item(self.table_name, self.key, projection=projection, names=names) or {}
+        if self.legacy_layout:
+            return (item.get("versions") or [{}])[0]
+        return item
+
+    async def update(
+        self,
+        fields: Dict[str, Any],
+        project_fields: Dict[str, Any] | None = None,
+        remove_fields: List[str] | None = None
+    ) -> None:
+        """SETs `fields` on the version and `project_fields` on the project item; REMOVEs `remove_fields` from the version."""
+        time_now = datetime.now(timezone.utc).isoformat()
+
+        set_parts = [f"{self.path('#updated_at')} = :updated_at"]
+        names = {'#updated_at': 'updated_at'}
+        values = {':updated_at': time_now}
+        for i, (field, value) in enumerate(fields.items()):
+            set_parts.append(f"{self.path(f'#v{i}')} = :v{i}")
+            names[f"#v{i}"] = field
+            values[f":v{i}"] = to_dynamodb(value)
+        remove_parts = []
+        for i, field in enumerate(remove_fields or []):
+            remove_parts.append(self.path(f"#r{i}"))
+            names[f"#r{i}"] = field
+        remove_clause = (" REMOVE " + ", ".join(remove_parts)) if remove_parts else ""
+
+        project_parts = ["#out_updated_at = :updated_at"]
+        project_names = {'#out_updated_at': 'updated_at'}
+        project_values = {':updated_at': time_now}
+        for i, (field, value) in enumerate((project_fields or {}).items()):
+            project_parts.append(f"#p{i} = :p{i}")
+            project_names[f"#p{i}"] = field
+            project_values[f":p{i}"] = to_dynamodb(value)
+
+        if self.legacy_layout:
+            # One item holds both, so a single update
+            await self.db.update_item(
+                self.table_name,
+                self.key,
+                "SET " + ", ".join(set_parts + project_parts) + remove_clause,
+                names=self.names({**names, **project_names}),
+                values={**values, **project_values}
+            )
+            return
+
+        await asyncio.gather(
+            self.db.update_item(
+                self.table_name,
+                self.key,
+                "SET " + ", ".join(set_parts) + remove_clause,
+                names=names,
+                values=values
+            ),
+            self.db.update_item(
+                self.table_name,
+                self.project_key,
+                "SET " + ", ".join(project_parts),
+                names=project_names,
+                values=project_values
+            )
+        )
+
+    async def edits_fields(
+        self,
+        edits: List[Dict[str, Any]],
+        base_edits: List[Dict[str, Any]] | None = None
+    ) -> tuple[Dict[str, Any], List[str]]:
+        """
+        (fields to SET, fields to REMOVE) that store the final `edits` on the version: an `edl` record
+        (compressed, or a delta against an S3 snapshot of the previous version's edits) that spills to S3
+        when large. Deltas need EDL_OFFLOAD_BUCKET; without it every record is a full one.
+        """
+        if not constants.EDL_CODEC_ENABLED:
+            return {'all_edits': edits}, ['edl']
+
+        bucket = constants.EDL_OFFLOAD_BUCKET
+        prefix = f"edl/{self.org_id}/{self.project_id}"
+        base_uri = snapshot_uri(bucket, f"{prefix}/base", base_edits) if bucket and base_edits else None
+        record = encode_edits(edits, base_edits, base_uri)
+
+        def store() -> Dict[str, Any]:
+            # The snapshot goes first, so no reader ever sees a delta whose base is missing
+            if record["codec"] == CODEC_DELTA:
+                write_snapshot(base_edits, base_uri)
+            return offload_record(record, bucket, prefix, constants.EDL_OFFLOAD_THRESHOLD_BYTES)
+        return {'edl': await asyncio.to_thread(store)}, ['all_edits']
+
+    async def set_status(self, status: str, **fields: Any) -> None:
+        await self.update({'status': status, **fields})
+
+    async def append_edits(self, edits: List[Dict[str, Any]], replace: bool = False) -> None:
+        """Appends streamed edits to the version's all_edits (or replaces them) and marks it STREAMING."""
+        time_now = datetime.now(timezone.utc).isoformat()
+        all_edits_path = self.path("#all_edits")
+        edits_value = (
+            ":edits" if replace
+            else f"list_append(if_not_exists({all_edits_path}, :empty), :edits)"
+        )
+        values = {
+            ':edits': to_dynamodb(edits),
+            ':status': 'STREAMING'
+        }
+        if not replace:
+            values[':empty'] = []
+
+        stamp_parts, stamp_names, stamp_values = self.stamp(time_now)
+        update_expression = (
+            f"SET {all_edits_path} = {edits_value}, "
+            f"{self.path('#status')} = :status, " + ", ".join(stamp_parts)
+        )
+        names = {'#all_edits': 'all_edits', '#status': 'status', **stamp_names}
+        values.update(stamp_values)
+
+        # With version items, streaming writes touch only the version; the final write stamps the project
+        await self.db.update_item(self.table_name, self.key, update_expression, names=self.names(names), values=values)
@@ -0,0 +1,35 @@
+import asyncio
+import logging
+from typing import List
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+async def probe_video_duration(path: str) -> float | None:
+    """Returns the duration of a local video in seconds using ffprobe, or None if it cannot be measured."""
+    try:
+        process = await asyncio.create_subprocess_exec(
+            "ffprobe", "-v", "error",
+            "-show_entries", "format=duration",
+            "-of", "default=noprint_wrappers=1:nokey=1",
+            path,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE
+        )
+        stdout, stderr = await process.communicate()
+        if process.returncode != 0:
+            logger.warning(f"ffprobe failed for {path}: {stderr.decode(errors='ignore').strip()}")
+            return None
+        return float(stdout.decode().strip())
+    except FileNotFoundError:
+        logger.warning("ffprobe is not installed; video durations are unknown.")
+        return None
+    except (ValueError, OSError) as e:
+        logger.warning(f"Could not read duration for {path}: {e}")
+        return None
+
+
+async def probe_video_durations(paths: List[str]) -> List[float | None]:
+    """Probes every local video concurrently, keeping the input order."""
+    return list(await asyncio.gather(*[probe_video_duration(path) for path in paths]))
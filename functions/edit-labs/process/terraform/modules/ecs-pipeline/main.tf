@@ -113,6 +113,141 @@ resource "aws_iam_policy" "s3_read_policy" {
   })
 }
 
+# --- S3 Bucket for large EDL blobs (all_edits records over EDL_OFFLOAD_THRESHOLD_BYTES) ---
+resource "aws_s3_bucket" "edl_blobs" {
+  bucket = "${var.project_name}-${var.environment}-edl-blobs"
+}
+
+resource "aws_s3_bucket_public_access_block" "edl_blobs" {
+  bucket                  = aws_s3_bucket.edl_blobs.id
+  block_public_acls       = true
+  block_public_policy     = true
+  ignore_public_acls      = true
+  restrict_public_buckets = true
+}
+
+resource "aws_iam_policy" "edl_blobs_policy" {
+  name        = "${var.project_name}-${var.environment}-edl-blobs-policy"
+  description = "Allows writing and reading offloaded EDL blobs"
+
+  policy = jsonencode({
+    Version = "2012-10-17"
+    Statement = [
+      {
+        Action = [
+          "s3:PutObject",
+          "s3:GetObject"
+        ]
+        Effect   = "Allow"
+        Resource = "${aws_s3_bucket.edl_blobs.arn}/*"
+      }
+    ]
+  })
+}
+
+resource "aws_iam_role_policy_attachment" "task_edl_blobs_policy" {
+  role       = aws_iam_role.ecs_task_role.name
+  policy_arn = aws_iam_policy.edl_blobs_policy.arn
+}
+
+# --- S3 Bucket for job payloads (the state machine writes them, the task reads PAYLOAD_URI) ---
+resource "aws_s3_bucket" "job_payloads" {
+  bucket = "${var.project_name}-${var.environment}-job-payloads"
+}
+
+resource "aws_s3_bucket_public_access_block" "job_payloads" {
+  bucket                  = aws_s3_bucket.job_payloads.id
+  block_public_acls       = true
+  block_public_policy     = true
+  ignore_public_acls      = true
+  restrict_public_buckets = true
+}
+
+resource "aws_s3_bucket_lifecycle_configuration" "job_payloads" {
+  bucket = aws_s3_bucket.job_payloads.id
+
+  rule {
+    id     = "expire-payloads"
+    status = "Enabled"
+
+    filter {
+      prefix = "payloads/"
+    }
+
+    expiration {
+      days = 7
+    }
+  }
+}
+
+# --- DynamoDB Rate Limit Table (Gemini quota windows shared by all tasks) ---
+resource "aws_dynamodb_table" "rate_limits" {
+  name         = "${var.project_name}-${var.environment}-rate-limits"
+  billing_mode = "PAY_PER_REQUEST"
+  hash_key     = "pk"
+
+  attribute {
+    name = "pk"
+    type = "S"
+  }
+
+  # Window items expire a minute after their window closes
+  ttl {
+    attribute_name = "expires_at"
+    enabled        = true
+  }
+}
+
+# --- DynamoDB Result Cache Table (finished edits keyed by a hash of the generation inputs) ---
+resource "aws_dynamodb_table" "result_cache" {
+  name         = "${var.project_name}-${var.environment}-result-cache"
+  billing_mode = "PAY_PER_REQUEST"
+  hash_key     = "pk"
+
+  attribute {
+    name = "pk"
+    type = "S"
+  }
+
+  # Cached results expire after RESULT_CACHE_TTL_SECONDS
+  ttl {
+    attribute_name = "expires_at"
+    enabled        = true
+  }
+}
+
+# --- API keys, read by the task itself in one batched GetParameters call ---
+locals {
+  gemini_api_key_ssm_path  = "/${var.environment}/keys/gemini_api"
+  youtube_api_key_ssm_path = "/${var.environment}/keys/youtube_api"
+}
+
+resource "aws_iam_policy" "ssm_api_keys_policy" {
+  name        = "${var.project_name}-${var.environment}-ssm-api-keys-policy"
+  description = "Allows reading the Gemini and YouTube API keys from SSM"
+
+  policy = jsonencode({
+    Version = "2012-10-17"
+    Statement = [
+      {
+        Action = [
+          "ssm:GetParameters"
+        ]
+        Effect = "Allow"
+        Resource = [
+          "arn:aws:ssm:${var.aws_region}:${data.aws_caller_identity.current.account_id}:parameter${local.gemini_api_key_ssm_path}",
+          "arn:aws:ssm:${var.aws_region}:${data.aws_caller_identity.current.account_id}:parameter${local.youtube_api_key_ssm_path}"
+        ]
+      }
+    ]
+  })
+}
+
+resource "aws_iam_role_policy_attachment" "task_ssm_api_keys_policy" {
+  role       = aws_iam_role.ecs_task_role.name
+  policy_arn = aws_iam_policy.ssm_api_keys_policy.arn
+}
+
 # --- DynamoDB Policy - USES VARIABLES FOR TABLE NAMES ---
 resource "aws_iam_policy" "dynamodb_policy" {
   name        = "${var.project_name}-${var.environment}-dynamodb-policy"
@@ -126,12 +261,15 @@ resource "aws_iam_policy" "dynamodb_policy" {
           "dynamodb:GetItem", 
           "dynamodb:UpdateItem", 
           "dynamodb:PutItem", 
+          "dynamodb:DeleteItem",
           "dynamodb:Query" 
         ]
         Effect = "Allow"
         Resource = [
           "arn:aws:dynamodb:${var.aws_region}:${data.aws_caller_identity.current.account_id}:table/${var.editlabs_table_name}",
-          "arn:aws:dynamodb:${var.aws_region}:${data.aws_caller_identity.current.account_id}:table/${var.recc_table_name}"
+          "arn:aws:dynamodb:${var.aws_region}:${data.aws_caller_identity.current.account_id}:table/${var.recc_table_name}",
+          aws_dynamodb_table.rate_limits.arn,
+          aws_dynamodb_table.result_cache.arn
         ]
       }
     ]
@@ -180,6 +318,11 @@ resource "aws_ecs_task_definition" "my_task" {
       { name = "PAYLOAD_JSON", value = "{}" },
       { name = "EDITLABS_TABLE_NAME", value = var.editlabs_table_name },
       { name = "RECC_TABLE_NAME", value = var.recc_table_name },
+      { name = "RATE_LIMIT_TABLE_NAME", value = aws_dynamodb_table.rate_limits.name },
+      { name = "RESULT_CACHE_TABLE_NAME", value = aws_dynamodb_table.result_cache.name },
+      { name = "EDL_OFFLOAD_BUCKET", value = aws_s3_bucket.edl_blobs.bucket },
+      { name = "GEMINI_API_KEY_SSM_PATH", value = local.gemini_api_key_ssm_path },
+      { name = "YOUTUBE_API_KEY_SSM_PATH", value = local.youtube_api_key_ssm_path },
       { name = "SERVICE_NAME", value = "process-raw-video-${var.environment}" }
     ]
 
@@ -239,4 +382,10 @@ resource "aws_ssm_parameter" "ecs_task_role_arn" {
   name  = "/${var.project_name}/${var.environment}/ecs/task-role-arn"
   type  = "String"
   value = aws_iam_role.ecs_task_role.arn
-}
\ No newline at end of file
+}
+
+resource "aws_ssm_parameter" "ecs_payload_bucket" {
+  name  = "/${var.project_name}/${var.environment}/ecs/payload-bucket"
+  type  = "String"
+  value = aws_s3_bucket.job_payloads.bucket
+}
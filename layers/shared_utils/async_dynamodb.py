@@ -0,0 +1,198 @@
+import asyncio
+import logging
+from contextlib import AsyncExitStack
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+import aioboto3
+from aiobotocore.config import AioConfig
+from botocore.exceptions import ClientError
+
+from retry_policy import get_retry_policy
+
+logger = logging.getLogger(__name__)
+
+
+def is_conditional_check_failed(error: BaseException) -> bool:
+    return isinstance(error, ClientError) and error.response.get("Error", {}).get("Code") == "ConditionalCheckFailedException"
+
+
+def _expression_kwargs(
+    names: Optional[Dict[str, str]] = None,
+    values: Optional[Dict[str, Any]] = None,
+    condition: Optional[str] = None,
+    projection: Optional[str] = None
+) -> Dict[str, Any]:
+    kwargs = {}
+    if names:
+        kwargs['ExpressionAttributeNames'] = names
+    if values:
+        kwargs['ExpressionAttributeValues'] = values
+    if condition:
+        kwargs['ConditionExpression'] = condition
+    if projection:
+        kwargs['ProjectionExpression'] = projection
+    return kwargs
+
+
+class AsyncDynamoDB:
+    """
+    Async DynamoDB access on one pooled aioboto3 resource per process.
+
+    The resource (and its connection pool) is opened on first use and reused by every call until close(),
+    so concurrent jobs share keep-alive connections instead of hopping to executor threads. Throttling and
+    5xx errors are retried by the "dynamodb" retry policy with asyncio.sleep, never blocking the loop.
+    Conditional-check failures are raised as ClientError; test them with is_conditional_check_failed().
+    """
+
+    def __init__(self, region: Optional[str] = None, max_pool_connections: int = 50):
+        self.region = region
+        self.max_pool_connections = max_pool_connections
+        self.retry_policy = get_retry_policy("dynamodb")
+        self._stack = None
+        self._resource = None
+        self._tables: Dict[str, Any] = {}
+        self._lock = asyncio.Lock()
+
+    async def _table(self, table_name: str):
+        if table_name in self._tables:
+            return self._tables[table_name]
+        async with self._lock:
+            if self._resource is None:
+                self._stack = AsyncExitStack()
+                self._resource = await self._stack.enter_async_context(
+                    aioboto3.Session().resource(
+                        "dynamodb",
+                        region_name=self.region,
+                        config=AioConfig(max_pool_connections=self.max_pool_connections)
+                    )
+                )
+            if table_name not in self._tables:
+                self._tables[table_name] = await self._resource.Table(table_name)
+        return self._tables[table_name]
+
+    async def _run(self, fn, label: str) -> Any:
+        async def attempt():
+            try:
+                return await fn()
+            except Exception as e:
+                # A failed condition is an answer, not a fault: skip the policy's retry / error logging
+                if is_conditional_check_failed(e):
+                    return e
+                raise
+        result = await self.retry_policy.run(attempt, label=label)
+        if isinstance(result, BaseException):
+            raise result
+        return result
+
+    async def get_item(
+        self,
+        table_name: str,
+        key: Dict[str, Any],
+        projection: Optional[str] = None,
+        names: Optional[Dict[str, str]] = None,
+        consistent: bool = False
+    ) -> Optional[Dict[str, Any]]:
+        table = await self._table(table_name)
+        response = await self._run(
+            lambda: table.get_item(Key=key, ConsistentRead=consistent, **_expression_kwargs(names, projection=projection)),
+            label=f"DynamoDB get_item {table_name}"
+        )
+        return response.get("Item")
+
+    async def put_item(
+        self,
+        table_name: str,
+        item: Dict[str, Any],
+        condition: Optional[str] = None,
+        names: Optional[Dict[str, str]] = None,
+        values: Optional[Dict[str, Any]] = None
+    ) -> None:
+        table = await self._table(table_name)
+        await self._run(
+            lambda: table.put_item(Item=item, **_expression_kwargs(names, values, condition)),
+            label=f"DynamoDB put_item {table_name}"
+        )
+
+    async def update_item(
+        self,
+        table_name: str,
+        key: Dict[str, Any],
+        update_expression: str,
+        names: Optional[Dict[str, str]] = None,
+        values: Optional[Dict[str, Any]] = None,
+        condition: Optional[str] = None,
+        return_values: str = "NONE"
+    ) -> Dict[str, Any]:
+        """Returns the item attributes selected by `return_values` (empty for "NONE")."""
+        table = await self._table(table_name)
+        response = await self._run(
+            lambda: table.update_item(
+                Key=key,
+                UpdateExpression=update_expression,
+                ReturnValues=return_values,
+                **_expression_kwargs(names, values, condition)
+            ),
+            label=f"DynamoDB update_item {table_name}"
+        )
+        return response.get("Attributes", {})
+
+    async def delete_item(
+        self,
+        table_name: str,
+        key: Dict[str, Any],
+        condition: Optional[str] = None,
+        names: Optional[Dict[str, str]] = None,
+        values: Optional[Dict[str, Any]] = None
+    ) -> None:
+        table = await self._table(table_name)
+        await self._run(
+            lambda: table.delete_item(Key=key, **_expression_kwargs(names, values, condition)),
+            label=f"DynamoDB delete_item {table_name}"
+        )
+
+    async def query(
+        self,
+        table_name: str,
+        key_condition: Any,
+        projection: Optional[str] = None,
+        names: Optional[Dict[str, str]] = None,
+        limit: Optional[int] = None,
+        scan_forward: bool = True
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """Yields matching items page by page until `limit` items (or all of them) were returned."""
+        table = await self._table(table_name)
+        kwargs = {'KeyConditionExpression': key_condition, 'ScanIndexForward': scan_forward, **_expression_kwargs(names, projection=projection)}
+        if limit:
+            kwargs['Limit'] = limit
+        returned = 0
+        while True:
+            response = await self._run(lambda: table.query(**kwargs), label=f"DynamoDB query {table_name}")
+            for item in response.get("Items", []):
+                yield item
+                returned += 1
+                if limit and returned >= limit:
+                    return
+            if "LastEvaluatedKey" not in response:
+                return
+            kwargs['ExclusiveStartKey'] = response["LastEvaluatedKey"]
+
+    async def query_all(self, table_name: str, key_condition: Any, **kwargs: Any) -> List[Dict[str, Any]]:
+        return [item async for item in self.query(table_name, key_condition, **kwargs)]
+
+    async def close(self) -> None:
+        if self._stack is not None:
+            await self._stack.aclose()
+        self._stack = None
+        self._resource = None
+        self._tables = {}
+
+
+_default_client: Optional[AsyncDynamoDB] = None
+
+
+def get_async_dynamodb() -> AsyncDynamoDB:
+    """The process-wide AsyncDynamoDB (one connection pool per process)."""
+    global _default_client
+    if _default_client is None:
+        _default_client = AsyncDynamoDB()
+    return _default_client
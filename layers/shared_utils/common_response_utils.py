@@ -1,10 +1,20 @@
 
+import base64
+import gzip
+import hashlib
 import json
 import logging
 import os
 import traceback
 from decimal import Decimal
 
+from json_codec import dumps
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
 # Set up structured logger
 logger = logging.getLogger()
 if not logger.handlers:
@@ -18,6 +28,16 @@ if not logger.handlers:
 
 # Environment flag (set this in Lambda env vars)
 ENV = os.getenv("ENVIRONMENT", "dev").lower()
+
+# Bodies at least this large are compressed when the client accepts gzip / br
+RESPONSE_COMPRESSION_MIN_BYTES = int(os.getenv("RESPONSE_COMPRESSION_MIN_BYTES", "1024"))
+# Responses whose payload would still exceed this (Lambda caps responses at 6 MB) are served from S3 instead
+RESPONSE_OFFLOAD_BUCKET = os.getenv("RESPONSE_OFFLOAD_BUCKET", "")
+RESPONSE_OFFLOAD_THRESHOLD_BYTES = int(os.getenv("RESPONSE_OFFLOAD_THRESHOLD_BYTES", str(4 * 1024 * 1024)))
+RESPONSE_OFFLOAD_URL_TTL_SECONDS = int(os.getenv("RESPONSE_OFFLOAD_URL_TTL_SECONDS", "300"))
+
+_s3_client = None
+
 class DecimalEncoder(json.JSONEncoder):
     def default(self, obj):
         if isinstance(obj, Decimal):
@@ -64,24 +84,116 @@ def get_cors_headers(origin=None):
         "Access-Control-Max-Age": "86400"  # Cache preflight for 24 hours
     }
 
-def api_response(status_code, message, data=None, error=None, origin=None):
-    """Base response wrapper with CORS headers"""
+def _get_header(event, name):
+    """Case-insensitive request header lookup."""
+    headers = (event or {}).get('headers') or {}
+    name = name.lower()
+    return next((value for key, value in headers.items() if key.lower() == name), None)
+
+
+def _accepted_encoding(event):
+    """Best encoding the client accepts: "br" (when brotli is installed), "gzip" or None."""
+    accepted = {
+        part.split(";")[0].strip().lower()
+        for part in (_get_header(event, 'Accept-Encoding') or "").split(",")
+        if not part.strip().lower().endswith(";q=0")
+    }
+    if brotli is not None and "br" in accepted:
+        return "br"
+    if "gzip" in accepted or "*" in accepted:
+        return "gzip"
+    return None
+
+
+def _offload_body(body, etag):
+    """Stores the JSON body in S3 and returns a presigned GET URL for it."""
+    global _s3_client
+    if _s3_client is None:
+        import boto3
+        _s3_client = boto3.client("s3")
+    key = "responses/" + etag.strip('"') + ".json"
+    _s3_client.put_object(Bucket=RESPONSE_OFFLOAD_BUCKET, Key=key, Body=body, ContentType="application/json")
+    return _s3_client.generate_presigned_url(
+        "get_object",
+        Params={'Bucket': RESPONSE_OFFLOAD_BUCKET, 'Key': key},
+        ExpiresIn=RESPONSE_OFFLOAD_URL_TTL_SECONDS
+    )
+
+
+def api_response(status_code, message, data=None, error=None, origin=None, event=None):
+    """
+    Base response wrapper with CORS headers.
+
+    Given the request `event`, a 200 response also gets:
+    - an ETag, and a bodiless 304 when it matches the request's If-None-Match;
+    - br / gzip compression (base64 body) when the client accepts it and the body is large enough;
+    - when the payload would still exceed RESPONSE_OFFLOAD_THRESHOLD_BYTES and RESPONSE_OFFLOAD_BUCKET is
+      set, the body is written to S3 and the response carries {"data_url": <presigned URL>} instead of data.
+    """
     response_body = {
         "status": status_code,
         "message": message,
         "data": data,
         "error": error if ENV != "prod" else None
     }
+    headers = get_cors_headers(origin)
+    body = dumps(response_body)
+    if event is None or status_code != 200:
+        return {
+            "statusCode": status_code,
+            "headers": headers,
+            "body": body.decode("utf-8")
+        }
 
+    etag = '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+    headers["ETag"] = etag
+    headers["Vary"] = "Accept-Encoding"
+    if_none_match = _get_header(event, 'If-None-Match') or ""
+    if etag in [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")] or if_none_match.strip() == "*":
+        return {"statusCode": 304, "headers": headers, "body": ""}
+
+    payload, encoding = body, None
+    if len(body) >= RESPONSE_COMPRESSION_MIN_BYTES:
+        encoding = _accepted_encoding(event)
+        if encoding == "br":
+            payload = brotli.compress(body, quality=5)
+        elif encoding == "gzip":
+            payload = gzip.compress(body, compresslevel=6)
+
+    # A base64 body is 4/3 of the compressed size
+    payload_size = len(payload) * 4 // 3 if encoding else len(payload)
+    if RESPONSE_OFFLOAD_BUCKET and payload_size > RESPONSE_OFFLOAD_THRESHOLD_BYTES:
+        try:
+            data_url = _offload_body(body, etag)
+            logger.info(f"Response body of {len(body)} bytes offloaded to S3")
+            return {
+                "statusCode": status_code,
+                "headers": headers,
+                "body": dumps({
+                    "status": status_code,
+                    "message": message,
+                    "data": None,
+                    "data_url": data_url,
+                    "error": None
+                }).decode("utf-8")
+            }
+        except Exception as e:
+            logger.error(f"Response offload failed, returning the body inline: {e}")
+
+    if encoding is None:
+        return {"statusCode": status_code, "headers": headers, "body": body.decode("utf-8")}
+    headers["Content-Encoding"] = encoding
     return {
         "statusCode": status_code,
-        "headers": get_cors_headers(origin),
-        "body": json.dumps(response_body, cls=DecimalEncoder)
+        "headers": headers,
+        "body": base64.b64encode(payload).decode("ascii"),
+        "isBase64Encoded": True
     }
 
-def success_response(data=None, message="Request completed successfully", origin=None):
+def success_response(data=None, message="Request completed successfully", origin=None, event=None):
+    """Pass the request `event` to get ETag / 304, compression and S3 offload of large bodies."""
     logger.info(f"API Success: {message}")
-    return api_response(200, message, data=data, origin=origin)
+    return api_response(200, message, data=data, origin=origin, event=event)
 
 def bad_request_response(user_message="Invalid request", dev_message=None, origin=None):
     logger.warning(f"Bad Request: {user_message} | Details: {dev_message}")
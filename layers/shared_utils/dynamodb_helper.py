@@ -1,25 +1,116 @@
+import base64
 import boto3
+import json
 import logging
-import time
+import os
+import queue
 import random
-from typing import Dict, Optional, Any
+import threading
+import time
+from typing import Dict, Iterator, List, Optional, Any, Tuple
+from boto3.dynamodb.conditions import Key
 from botocore.exceptions import ClientError
 from decimal import Decimal
 from exceptions import DynamoDBError, ValidationError
+import json_codec
+from retry_policy import SYNC_MAX_DELAY_SECONDS, get_retry_policy
+from ttl_cache import TTLCache
 
 logger = logging.getLogger(__name__)
 
+# Edit-labs versions live in their own items next to the project (head) item:
+#   head:    {org_id, project_id, ..., latest_version, version_count, versions_layout: "items"}
+#   version: {org_id, project_id: "<project_id>#VERSION#vN", item_type: "VERSION", base_project_id, version, ...}
+VERSION_KEY_SEPARATOR = "#VERSION#"
+VERSIONS_LAYOUT_ITEMS = "items"
+
+# Moving legacy `versions` lists into version items is off until every writer uses put_version()
+VERSION_ITEMS_MIGRATION_ENABLED = os.getenv("VERSION_ITEMS_MIGRATION_ENABLED", "false").lower() == "true"
+# Copy-and-trim rounds per project when the head keeps changing under the migration
+MIGRATION_MAX_ATTEMPTS = 5
+
+
+def version_item_key(org_id: str, project_id: str, version: str) -> Dict[str, str]:
+    """Primary key of one version item of an edit-labs project."""
+    return {'org_id': org_id, 'project_id': f"{project_id}{VERSION_KEY_SEPARATOR}{version}"}
+
+
+def version_sort_number(version: str) -> int:
+    """"v12" -> 12, so versions sort numerically (sort keys compare "v10" before "v2")."""
+    try:
+        return int(str(version).lstrip("v"))
+    except ValueError:
+        return 0
+
+
+# Request-size limits of BatchGetItem / BatchWriteItem
+BATCH_GET_LIMIT = 100
+BATCH_WRITE_LIMIT = 25
+# Rounds of resending UnprocessedKeys / UnprocessedItems before giving up
+MAX_UNPROCESSED_ROUNDS = 8
+
+
+def encode_cursor(last_evaluated_key: Optional[Dict[str, Any]]) -> Optional[str]:
+    """Opaque, URL-safe page token for a LastEvaluatedKey (None when there are no more pages)."""
+    if not last_evaluated_key:
+        return None
+    raw = json_codec.dumps(last_evaluated_key)
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: Optional[str]) -> Optional[Dict[str, Any]]:
+    """ExclusiveStartKey of a token made by encode_cursor()."""
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        key = json_codec.loads(raw, use_decimal=True)
+    except (ValueError, TypeError) as e:
+        raise ValidationError(f"Invalid page cursor: {e}")
+    if not isinstance(key, dict):
+        raise ValidationError("Invalid page cursor")
+    return key
+
+
+def _unprocessed_backoff(round_number: int) -> None:
+    # Same cap as the retry policy's blocking backoff
+    time.sleep(random.uniform(0, min(SYNC_MAX_DELAY_SECONDS, 0.05 * 2 ** round_number)))
+
+def _cache_key(key: Dict[str, Any]) -> str:
+    return json.dumps(key, sort_keys=True, default=str)
+
+
 class DynamoDBHelper:
-    """A streamlined DynamoDB helper for basic CRUD operations."""
+    """
+    A streamlined DynamoDB helper for basic CRUD operations.
+
+    The blocking counterpart of async_dynamodb.AsyncDynamoDB, for the synchronous Lambda handlers; both retry
+    through the same "dynamodb" RetryPolicy (run_sync() here, run() there). Async code uses AsyncDynamoDB.
 
-    def __init__(self, table_name: str, region: str = None):
+    With a `cache`, get_item() reads through it (stamped with the item's updated_at) and this helper's own
+    writes invalidate the keys they touch; writes from other processes are only seen once the TTL runs out,
+    or when the caller passes a newer `min_updated_at`. A cache needs the table's `key_names` (partition key,
+    then sort key), so invalidation never has to describe the table.
+    """
+
+    def __init__(
+        self,
+        table_name: str,
+        region: str = None,
+        cache: Optional[TTLCache] = None,
+        key_names: Optional[List[str]] = None
+    ):
         if not table_name:
             raise ValidationError("Table name cannot be empty")
+        if cache is not None and not key_names:
+            raise ValidationError("key_names are required with a cache")
 
         self.table_name = table_name
         self.region = region or 'us-east-1'
-        self.max_retries = 3
-        self.base_delay = 1.0
+        # Throttling and 5xx are retried with jittered backoff; other errors fail at once
+        self.retry_policy = get_retry_policy("dynamodb")
+        self.cache = cache
+        self.key_names = list(key_names or [])
         
         try:
             self.dynamodb = boto3.resource('dynamodb', region_name=self.region)
@@ -27,19 +118,6 @@ class DynamoDBHelper:
         except Exception as e:
             raise DynamoDBError(f"Failed to initialize DynamoDB helper: {e}")
     
-    def _calculate_backoff_delay(self, attempt: int) -> float:
-        """Calculate exponential backoff delay with jitter."""
-        delay = self.base_delay * (2 ** attempt)
-        return delay + random.uniform(0.1, 0.3) * delay
-    
-    def _should_retry(self, error: ClientError, attempt: int) -> bool:
-        """Determine if an error should be retried."""
-        if attempt >= self.max_retries:
-            return False
-        
-        retriable_errors = ['ProvisionedThroughputExceededException', 'ThrottlingException']
-        return error.response['Error']['Code'] in retriable_errors
-    
     def _sanitize_item(self, item: Dict[str, Any]) -> Dict[str, Any]:
         """Sanitize item data for DynamoDB with proper type conversion."""
         # Converts floats to Decimals and handles empty strings
@@ -58,31 +136,317 @@ class DynamoDBHelper:
             raise ValidationError("Item cannot be empty")
         
         sanitized_item = self._sanitize_item(item)
-        for attempt in range(self.max_retries + 1):
-            try:
-                self.table.put_item(Item=sanitized_item)
-                return True
-            except ClientError as e:
-                if self._should_retry(e, attempt):
-                    time.sleep(self._calculate_backoff_delay(attempt))
-                    continue
-                logger.error(f"DynamoDB put_item failed: {e.response['Error']}")
-                raise DynamoDBError(f"Could not save item: {e}")
-        return False
+        try:
+            self.retry_policy.run_sync(lambda: self.table.put_item(Item=sanitized_item), label="DynamoDB put_item")
+            self._invalidate(item)
+            return True
+        except ClientError as e:
+            logger.error(f"DynamoDB put_item failed: {e.response['Error']}")
+            raise DynamoDBError(f"Could not save item: {e}")
     
-    def get_item(self, key: Dict[str, Any]) -> Optional[Dict[str, Any]]:
-        """Get an item from the table with retry logic."""
+    def _invalidate(self, item_or_key: Dict[str, Any]) -> None:
+        if self.cache is None:
+            return
+        self.cache.invalidate(_cache_key({name: item_or_key.get(name) for name in self.key_names}))
+
+    def get_item(self, key: Dict[str, Any], min_updated_at: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """
+        Get an item from the table with retry logic. With a cache, a cached copy older than `min_updated_at`
+        (an ISO timestamp the caller knows the item has reached) is read again.
+        """
         if not key:
             raise ValidationError("Key cannot be empty")
-        
-        for attempt in range(self.max_retries + 1):
+
+        if self.cache is not None:
+            cached = self.cache.get(_cache_key(key), min_stamp=min_updated_at)
+            if cached is not None:
+                return cached
+        try:
+            response = self.retry_policy.run_sync(lambda: self.table.get_item(Key=key), label="DynamoDB get_item")
+            item = response.get('Item')
+            if self.cache is not None and item is not None:
+                self.cache.put(_cache_key(key), item, stamp=item.get('updated_at'))
+            return item
+        except ClientError as e:
+            logger.error(f"DynamoDB get_item failed: {e.response['Error']}")
+            raise DynamoDBError(f"Could not retrieve item: {e}")
+
+    def update_item(self, key: Dict[str, Any], **kwargs: Any) -> Dict[str, Any]:
+        """update_item with retry logic; kwargs are passed through (UpdateExpression, ConditionExpression, ...)."""
+        if not key:
+            raise ValidationError("Key cannot be empty")
+
+        self._invalidate(key)
+        try:
+            return self.retry_policy.run_sync(lambda: self.table.update_item(Key=key, **kwargs), label="DynamoDB update_item")
+        except ClientError as e:
+            logger.error(f"DynamoDB update_item failed: {e.response['Error']}")
+            raise DynamoDBError(f"Could not update item: {e}")
+
+    def batch_get(self, keys: List[Dict[str, Any]], projection: Optional[str] = None, consistent: bool = False) -> List[Dict[str, Any]]:
+        """
+        Items for `keys` in BatchGetItem requests of up to 100 keys; UnprocessedKeys are resent with backoff.
+        Missing items are left out and the order of the result is not the order of `keys`.
+        """
+        unique_keys = list({json.dumps(k, sort_keys=True, default=str): k for k in keys if k}.values())
+        items = []
+        for start in range(0, len(unique_keys), BATCH_GET_LIMIT):
+            request = {'Keys': unique_keys[start:start + BATCH_GET_LIMIT], 'ConsistentRead': consistent}
+            if projection:
+                request['ProjectionExpression'] = projection
+            pending = {self.table_name: request}
+            for round_number in range(MAX_UNPROCESSED_ROUNDS + 1):
+                try:
+                    response = self.retry_policy.run_sync(
+                        lambda: self.dynamodb.batch_get_item(RequestItems=pending),
+                        label="DynamoDB batch_get_item"
+                    )
+                except ClientError as e:
+                    logger.error(f"DynamoDB batch_get_item failed: {e.response['Error']}")
+                    raise DynamoDBError(f"Could not batch get items: {e}")
+                items.extend(response.get('Responses', {}).get(self.table_name, []))
+                pending = response.get('UnprocessedKeys') or {}
+                if not pending:
+                    break
+                _unprocessed_backoff(round_number)
+            else:
+                raise DynamoDBError(f"Could not batch get items: keys still unprocessed after {MAX_UNPROCESSED_ROUNDS} retries")
+        return items
+
+    def batch_write(
+        self,
+        put_items: Optional[List[Dict[str, Any]]] = None,
+        delete_keys: Optional[List[Dict[str, Any]]] = None
+    ) -> int:
+        """
+        Puts and deletes in BatchWriteItem requests of up to 25 writes; UnprocessedItems are resent with backoff.
+        Items are sanitized like put_item(). Returns the number of writes.
+        """
+        writes = [{'PutRequest': {'Item': self._sanitize_item(item)}} for item in (put_items or [])]
+        writes += [{'DeleteRequest': {'Key': key}} for key in (delete_keys or [])]
+        for item in (put_items or []) + (delete_keys or []):
+            self._invalidate(item)
+        for start in range(0, len(writes), BATCH_WRITE_LIMIT):
+            pending = {self.table_name: writes[start:start + BATCH_WRITE_LIMIT]}
+            for round_number in range(MAX_UNPROCESSED_ROUNDS + 1):
+                try:
+                    response = self.retry_policy.run_sync(
+                        lambda: self.dynamodb.batch_write_item(RequestItems=pending),
+                        label="DynamoDB batch_write_item"
+                    )
+                except ClientError as e:
+                    logger.error(f"DynamoDB batch_write_item failed: {e.response['Error']}")
+                    raise DynamoDBError(f"Could not batch write items: {e}")
+                pending = response.get('UnprocessedItems') or {}
+                if not pending:
+                    break
+                _unprocessed_backoff(round_number)
+            else:
+                raise DynamoDBError(f"Could not batch write items: writes still unprocessed after {MAX_UNPROCESSED_ROUNDS} retries")
+        return len(writes)
+
+    def _pages(self, read, operation: str, kwargs: Dict[str, Any], cursor: Optional[str], page_size: Optional[int]) -> Iterator[Tuple[List[Dict[str, Any]], Optional[str]]]:
+        kwargs = dict(kwargs)
+        start_key = decode_cursor(cursor)
+        if start_key:
+            kwargs['ExclusiveStartKey'] = start_key
+        if page_size:
+            kwargs['Limit'] = page_size
+        while True:
             try:
-                response = self.table.get_item(Key=key)
-                return response.get('Item')
+                response = self.retry_policy.run_sync(lambda: read(**kwargs), label=f"DynamoDB {operation}")
             except ClientError as e:
-                if self._should_retry(e, attempt):
-                    time.sleep(self._calculate_backoff_delay(attempt))
-                    continue
-                logger.error(f"DynamoDB get_item failed: {e.response['Error']}")
-                raise DynamoDBError(f"Could not retrieve item: {e}")
-        return None
+                logger.error(f"DynamoDB {operation} failed: {e.response['Error']}")
+                raise DynamoDBError(f"Could not {operation} items: {e}")
+            next_cursor = encode_cursor(response.get('LastEvaluatedKey'))
+            yield response.get('Items', []), next_cursor
+            if next_cursor is None:
+                return
+            kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+    def query_pages(self, key_condition: Any, cursor: Optional[str] = None, page_size: Optional[int] = None, **kwargs: Any) -> Iterator[Tuple[List[Dict[str, Any]], Optional[str]]]:
+        """
+        Streams a query page by page as (items, cursor). The cursor is an opaque token that resumes right after
+        that page (None after the last one), so an API can hand it to its client; stop iterating to stop reading.
+        kwargs are passed through (IndexName, FilterExpression, ProjectionExpression, ScanIndexForward, ...).
+        """
+        return self._pages(self.table.query, "query", {'KeyConditionExpression': key_condition, **kwargs}, cursor, page_size)
+
+    def scan_pages(self, cursor: Optional[str] = None, page_size: Optional[int] = None, **kwargs: Any) -> Iterator[Tuple[List[Dict[str, Any]], Optional[str]]]:
+        """query_pages() for a table scan."""
+        return self._pages(self.table.scan, "scan", kwargs, cursor, page_size)
+
+    def parallel_scan(self, total_segments: int = 4, page_size: Optional[int] = None, **kwargs: Any) -> Iterator[Dict[str, Any]]:
+        """
+        Scans the table in `total_segments` segments on as many threads and yields the items as pages arrive
+        (in no particular order). Meant for backfills; each thread uses its own boto3 resource.
+        """
+        if total_segments <= 1:
+            for page, _ in self.scan_pages(page_size=page_size, **kwargs):
+                yield from page
+            return
+
+        pages: queue.Queue = queue.Queue(maxsize=total_segments * 2)
+        done = object()
+        stop = threading.Event()
+
+        def scan_segment(segment: int) -> None:
+            try:
+                table = boto3.session.Session().resource('dynamodb', region_name=self.region).Table(self.table_name)
+                segment_kwargs = {**kwargs, 'Segment': segment, 'TotalSegments': total_segments}
+                for page, _ in self._pages(table.scan, "scan", segment_kwargs, None, page_size):
+                    if stop.is_set():
+                        return
+                    pages.put(page)
+            except Exception as e:
+                pages.put(e)
+            finally:
+                pages.put(done)
+
+        threads = [threading.Thread(target=scan_segment, args=(segment,), daemon=True) for segment in range(total_segments)]
+        for thread in threads:
+            thread.start()
+        try:
+            finished = 0
+            while finished < total_segments:
+                page = pages.get()
+                if page is done:
+                    finished += 1
+                elif isinstance(page, Exception):
+                    raise page
+                else:
+                    yield from page
+        finally:
+            stop.set()
+            # Unblock workers waiting on a full queue so they can see the stop flag
+            while any(thread.is_alive() for thread in threads):
+                try:
+                    pages.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+
+    def get_version(self, org_id: str, project_id: str, version: str) -> Optional[Dict[str, Any]]:
+        """Get one version item of an edit-labs project."""
+        return self.get_item(version_item_key(org_id, project_id, version))
+
+    def put_version(self, org_id: str, project_id: str, version_data: Dict[str, Any]) -> bool:
+        """Write one version item and advance the head item's latest_version / version_count."""
+        version = version_data.get("version")
+        if not version:
+            raise ValidationError("Version data must contain 'version'")
+
+        self.put_item({
+            **version_data,
+            **version_item_key(org_id, project_id, version),
+            'item_type': 'VERSION',
+            'base_project_id': project_id
+        })
+        self.update_item(
+            {'org_id': org_id, 'project_id': project_id},
+            UpdateExpression="SET #latest = :version, #layout = :layout ADD #count :one",
+            ConditionExpression="attribute_exists(project_id)",
+            ExpressionAttributeNames={'#latest': 'latest_version', '#layout': 'versions_layout', '#count': 'version_count'},
+            ExpressionAttributeValues={':version': version, ':layout': VERSIONS_LAYOUT_ITEMS, ':one': 1}
+        )
+        return True
+
+    def list_versions(self, org_id: str, project_id: str, projection: Optional[str] = None) -> list:
+        """All version items of a project in version order (one query, following pagination)."""
+        kwargs = {'ProjectionExpression': projection} if projection else {}
+        items = []
+        key_condition = Key('org_id').eq(org_id) & Key('project_id').begins_with(f"{project_id}{VERSION_KEY_SEPARATOR}")
+        for page, _ in self.query_pages(key_condition, **kwargs):
+            items.extend(page)
+        return sorted(items, key=lambda item: version_sort_number(item.get("version")))
+
+    def get_versions(self, org_id: str, project_id: str, versions: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Several version items of a project in batched reads, by version name (missing versions are left out)."""
+        items = self.batch_get([version_item_key(org_id, project_id, version) for version in versions])
+        return {item.get("version"): item for item in items}
+
+    def _read_head_consistent(self, org_id: str, project_id: str) -> Optional[Dict[str, Any]]:
+        key = {'org_id': org_id, 'project_id': project_id}
+        try:
+            response = self.retry_policy.run_sync(
+                lambda: self.table.get_item(Key=key, ConsistentRead=True),
+                label="DynamoDB get_item"
+            )
+        except ClientError as e:
+            logger.error(f"DynamoDB get_item failed: {e.response['Error']}")
+            raise DynamoDBError(f"Could not retrieve item: {e}")
+        return response.get('Item')
+
+    def migrate_project_versions(self, org_id: str, project_id: str) -> int:
+        """
+        Moves a project's legacy `versions` list into version items and trims the head item.
+
+        Version items are written from a consistent read of the head, and the trim is conditional on the
+        head being unchanged since: same list length, same `updated_at` on the head and on the last entry
+        (VersionStore stamps both on every write). When a write lands in between, the head is read again
+        and the copy is redone, up to MIGRATION_MAX_ATTEMPTS times.
+
+        Disabled (returns 0) unless VERSION_ITEMS_MIGRATION_ENABLED is set: writers that still append to
+        `versions` would otherwise split a project across both layouts.
+        Returns the number of versions moved (0 when already migrated).
+        """
+        if not VERSION_ITEMS_MIGRATION_ENABLED:
+            logger.warning("Version item migration is disabled (VERSION_ITEMS_MIGRATION_ENABLED is not set).")
+            return 0
+
+        for attempt in range(1, MIGRATION_MAX_ATTEMPTS + 1):
+            head = self._read_head_consistent(org_id, project_id)
+            if not head or 'versions' not in head:
+                return 0
+
+            versions = head.get('versions') or []
+            self.batch_write(put_items=[
+                {
+                    **version_data,
+                    **version_item_key(org_id, project_id, version_data.get("version")),
+                    'item_type': 'VERSION',
+                    'base_project_id': project_id
+                }
+                for version_data in versions
+            ])
+
+            latest = max((v.get("version") for v in versions), key=version_sort_number, default=None)
+            names = {
+                '#versions': 'versions',
+                '#layout': 'versions_layout',
+                '#count': 'version_count',
+                '#latest': 'latest_version',
+                '#updated_at': 'updated_at'
+            }
+            values = {':layout': VERSIONS_LAYOUT_ITEMS, ':count': len(versions), ':latest': latest}
+            conditions = ["size(#versions) = :count"]
+            if head.get('updated_at') is not None:
+                conditions.append("#updated_at = :head_updated_at")
+                values[':head_updated_at'] = head['updated_at']
+            else:
+                conditions.append("attribute_not_exists(#updated_at)")
+            if versions:
+                last_path = f"#versions[{len(versions) - 1}].#updated_at"
+                if versions[-1].get('updated_at') is not None:
+                    conditions.append(f"{last_path} = :last_updated_at")
+                    values[':last_updated_at'] = versions[-1]['updated_at']
+                else:
+                    conditions.append(f"attribute_not_exists({last_path})")
+
+            try:
+                self.update_item(
+                    {'org_id': org_id, 'project_id': project_id},
+                    UpdateExpression="REMOVE #versions SET #layout = :layout, #count = :count, #latest = :latest",
+                    ConditionExpression=" AND ".join(conditions),
+                    ExpressionAttributeNames=names,
+                    ExpressionAttributeValues=values
+                )
+            except DynamoDBError as e:
+                if 'ConditionalCheckFailed' not in str(e):
+                    raise
+                logger.info(f"Project {project_id} changed during migration (attempt {attempt}), copying again.")
+                continue
+            logger.info(f"Migrated {len(versions)} versions of project {project_id} to version items.")
+            return len(versions)
+
+        logger.warning(f"Project {project_id} kept changing during migration; left on the legacy layout.")
+        return 0
@@ -0,0 +1,187 @@
+"""
+Storage codec for a version's all_edits (EDL).
+
+A finished version stores an `edl` record instead of the plain `all_edits` list:
+    {"codec": "zlib-json",  "data": <zlib(JSON list)>, "count": N}
+    {"codec": "zlib-delta", "data": <zlib(JSON ops)>,  "count": N, "base_uri": "s3://.../<checksum>.bin",
+     "base_count": M, "base_checksum": <sha256 of the base edits>}
+A delta lists the runs copied from the base edits and the edits that are new. Its base is not another
+version (a rerun rewrites a version's edl) but an immutable snapshot of the base edits, stored in S3 under
+their checksum by write_snapshot(), so a delta stays readable whatever happens to the version it came from.
+Records whose blob is over the offload threshold keep only "s3_uri" (also content-addressed) in place of
+"data".
+decode_edits() rebuilds the full list from any of these (or returns a legacy plain `all_edits`). Deltas
+written against a version slot ("base_version") are still read, and fail with EdlBaseMismatchError once
+that version has been regenerated.
+"""
+import difflib
+import hashlib
+import logging
+import zlib
+from typing import Any, Callable, Dict, List, Optional
+from urllib.parse import urlparse
+
+import json_codec
+
+logger = logging.getLogger(__name__)
+
+_s3_client = None
+
+CODEC_FULL = "zlib-json"
+CODEC_DELTA = "zlib-delta"
+
+
+def _canonical(obj: Any) -> bytes:
+    return json_codec.dumps(obj, sort_keys=True)
+
+
+def _pack(obj: Any) -> bytes:
+    return zlib.compress(_canonical(obj), 9)
+
+
+def _unpack(data: bytes) -> Any:
+    return json_codec.loads(zlib.decompress(data))
+
+
+def edits_checksum(edits: List[Dict[str, Any]]) -> str:
+    """Order-sensitive checksum of an EDL (canonical JSON, so key order and Decimal vs float do not matter)."""
+    return hashlib.sha256(_canonical(edits)).hexdigest()
+
+
+class EdlBaseMismatchError(ValueError):
+    """Raised when a delta's base does not hold the edits the delta was made against."""
+    pass
+
+
+def snapshot_uri(bucket: str, prefix: str, edits: List[Dict[str, Any]]) -> str:
+    """Content-addressed S3 location of the base snapshot of `edits`."""
+    return f"s3://{bucket}/{prefix}/{edits_checksum(edits)}.bin"
+
+
+def delta_ops(base: List[Dict[str, Any]], edits: List[Dict[str, Any]]) -> List[list]:
+    """Ops rebuilding `edits` from `base`: ["c", start, end] copies base[start:end], ["n", [...]] adds new edits."""
+    matcher = difflib.SequenceMatcher(None, [_canonical(e) for e in base], [_canonical(e) for e in edits], autojunk=False)
+    ops = []
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            ops.append(["c", i1, i2])
+        elif j2 > j1:
+            ops.append(["n", edits[j1:j2]])
+    return ops
+
+
+def apply_delta(base: List[Dict[str, Any]], ops: List[list]) -> List[Dict[str, Any]]:
+    edits = []
+    for op in ops:
+        if op[0] == "c":
+            edits.extend(base[op[1]:op[2]])
+        else:
+            edits.extend(op[1])
+    return edits
+
+
+def encode_edits(
+    edits: List[Dict[str, Any]],
+    base_edits: Optional[List[Dict[str, Any]]] = None,
+    base_uri: Optional[str] = None
+) -> Dict[str, Any]:
+    """
+    Encodes an EDL as a compressed blob, or as a delta against `base_edits` when that is smaller.
+    A delta refers to the snapshot at `base_uri` (see snapshot_uri()), which the caller must write with
+    write_snapshot() before storing the record. Bases are always full lists, so a read never walks a chain.
+    """
+    record = {"codec": CODEC_FULL, "data": _pack(edits), "count": len(edits)}
+    if base_edits and base_uri:
+        delta = _pack(delta_ops(base_edits, edits))
+        if len(delta) < len(record["data"]):
+            record = {
+                "codec": CODEC_DELTA,
+                "data": delta,
+                "count": len(edits),
+                "base_uri": base_uri,
+                "base_count": len(base_edits),
+                "base_checksum": edits_checksum(base_edits)
+            }
+    return record
+
+
+def _default_s3_client():
+    """Shared S3 client, created on first use: only offloaded records need boto3."""
+    global _s3_client
+    if _s3_client is None:
+        import boto3
+        _s3_client = boto3.client("s3")
+    return _s3_client
+
+
+def _read_uri(uri: str, s3_client=None) -> bytes:
+    parsed = urlparse(uri)
+    s3_client = s3_client or _default_s3_client()
+    return s3_client.get_object(Bucket=parsed.netloc, Key=parsed.path.lstrip("/"))["Body"].read()
+
+
+def write_snapshot(edits: List[Dict[str, Any]], uri: str, s3_client=None) -> None:
+    """Stores `edits` at their snapshot_uri(). The key is the checksum, so rewriting it is harmless."""
+    parsed = urlparse(uri)
+    s3_client = s3_client or _default_s3_client()
+    s3_client.put_object(Bucket=parsed.netloc, Key=parsed.path.lstrip("/"), Body=_pack(edits), ContentType="application/octet-stream")
+
+
+def offload_record(record: Dict[str, Any], bucket: str, prefix: str, threshold_bytes: int, s3_client=None) -> Dict[str, Any]:
+    """
+    Moves the blob of a record larger than `threshold_bytes` to s3://bucket/prefix/<sha256 of the blob>.bin
+    and keeps a pointer. The key never names a version, so a rerun cannot overwrite a blob still in use.
+    """
+    if not bucket or len(record["data"]) <= threshold_bytes:
+        return record
+    s3_client = s3_client or _default_s3_client()
+    key = f"{prefix}/{hashlib.sha256(record['data']).hexdigest()}.bin"
+    s3_client.put_object(Bucket=bucket, Key=key, Body=record["data"], ContentType="application/octet-stream")
+    offloaded = {k: v for k, v in record.items() if k != "data"}
+    offloaded["s3_uri"] = f"s3://{bucket}/{key}"
+    offloaded["size_bytes"] = len(record["data"])
+    return offloaded
+
+
+def _record_data(record: Dict[str, Any], s3_client=None) -> bytes:
+    if record.get("data") is not None:
+        return bytes(record["data"])
+    return _read_uri(record["s3_uri"], s3_client)
+
+
+def decode_edits(
+    version_item: Optional[Dict[str, Any]],
+    load_version: Optional[Callable[[str], Optional[Dict[str, Any]]]] = None,
+    s3_client=None
+) -> List[Dict[str, Any]]:
+    """
+    Full all_edits of a version item. `load_version(version)` returns another version of the same project
+    and is only needed for legacy deltas against a version ("base_version").
+    """
+    if not version_item:
+        return []
+    record = version_item.get("edl")
+    if not record:
+        return version_item.get("all_edits") or []
+
+    payload = _unpack(_record_data(record, s3_client))
+    if record.get("codec") == CODEC_FULL:
+        return payload
+    if record.get("base_uri"):
+        base = _unpack(_read_uri(record["base_uri"], s3_client))
+        if edits_checksum(base) != record["base_checksum"]:
+            raise EdlBaseMismatchError(f"Base snapshot {record['base_uri']} of version {version_item.get('version')} is corrupt")
+        return apply_delta(base, payload)
+
+    if load_version is None:
+        raise ValueError(f"EDL of version {version_item.get('version')} is a delta and no version loader was given")
+    base = decode_edits(load_version(record["base_version"]), load_version, s3_client)
+    # Deltas written before the base check was added carry neither field
+    if "base_checksum" in record and (
+        len(base) != int(record.get("base_count", len(base))) or edits_checksum(base) != record["base_checksum"]
+    ):
+        raise EdlBaseMismatchError(
+            f"EDL of version {version_item.get('version')} is a delta against {record['base_version']}, "
+            f"whose edits have changed since"
+        )
+    return apply_delta(base, payload)
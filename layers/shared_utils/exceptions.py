@@ -7,3 +7,18 @@ class ValidationError(Exception):
 class DynamoDBError(Exception):
     """Raised when DynamoDB operations fail."""
     pass
+
+class CircuitOpenError(Exception):
+    """Raised when a dependency's circuit breaker is open and calls are rejected."""
+    pass
+
+class DeadlineExceededError(Exception):
+    """Raised when a job stage runs out of its time budget."""
+
+    def __init__(self, stage: str, message: str = None):
+        self.stage = stage
+        super().__init__(message or f"Stage '{stage}' ran out of time")
+
+class JobCancelledError(Exception):
+    """Raised when a running job's version was cancelled (CANCEL_REQUESTED)."""
+    pass
@@ -0,0 +1,92 @@
+"""
+JSON codec for DynamoDB items, shared by the pipeline and the API handlers.
+
+Decimals are encoded in the same pass as the rest of the document (integral ones as ints), so items go
+from DynamoDB to compact JSON without a separate conversion walk. orjson is used when it is installed,
+the standard library otherwise; both produce the same compact output.
+
+    dumps(item)        -> compact JSON bytes (Decimal -> int/float, set -> list)
+    dumps_str(item)    -> the same as str, e.g. for a Lambda response body
+    prompt_json(obj)   -> compact JSON for prompts (no indentation or spaces)
+    loads(data)        -> Python objects; with use_decimal=True floats come back as Decimal
+    to_native(item)    -> DynamoDB item with Decimals as int/float
+    to_dynamodb(obj)   -> object with floats as Decimal, ready for boto3
+"""
+import json
+from decimal import Decimal
+from typing import Any
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _decimal_to_number(value: Decimal) -> int | float:
+    return int(value) if value == value.to_integral_value() else float(value)
+
+
+def _default(obj: Any) -> Any:
+    if isinstance(obj, Decimal):
+        return _decimal_to_number(obj)
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def _strict_default(obj: Any) -> Any:
+    # Sets and binary values have no JSON form that round-trips to the same DynamoDB type
+    if isinstance(obj, Decimal):
+        return _decimal_to_number(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def dumps(obj: Any, sort_keys: bool = False, default=_default) -> bytes:
+    """Compact JSON bytes of `obj`, Decimals included."""
+    if orjson is not None:
+        return orjson.dumps(obj, default=default, option=orjson.OPT_SORT_KEYS if sort_keys else 0)
+    return json.dumps(obj, default=default, sort_keys=sort_keys, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+def dumps_str(obj: Any, sort_keys: bool = False) -> str:
+    return dumps(obj, sort_keys=sort_keys).decode("utf-8")
+
+
+def prompt_json(obj: Any) -> str:
+    """Whitespace-free JSON of `obj` for prompt text (fewer tokens than an indented dump)."""
+    return dumps_str(obj)
+
+
+def loads(data: bytes | str, use_decimal: bool = False) -> Any:
+    """Parses JSON; with `use_decimal` every float becomes a Decimal (as boto3 expects)."""
+    if use_decimal:
+        return json.loads(data, parse_float=Decimal)
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def to_native(obj: Any) -> Any:
+    """`obj` with every Decimal turned into an int or float (sets become lists)."""
+    return loads(dumps(obj))
+
+
+def _floats_to_decimals(obj: Any) -> Any:
+    if isinstance(obj, list):
+        return [_floats_to_decimals(i) for i in obj]
+    if isinstance(obj, dict):
+        return {k: _floats_to_decimals(v) for k, v in obj.items()}
+    if isinstance(obj, float):
+        return Decimal(str(obj))
+    return obj
+
+
+def to_dynamodb(obj: Any) -> Any:
+    """
+    `obj` with every float turned into a Decimal. Plain JSON documents take one encode/parse round trip in
+    C; values JSON cannot carry (bytes, sets) fall back to a recursive walk that leaves them untouched.
+    """
+    try:
+        return loads(dumps(obj, default=_strict_default), use_decimal=True)
+    except TypeError:
+        return _floats_to_decimals(obj)
@@ -0,0 +1,62 @@
+"""
+Backfill: moves every edit-labs project's legacy `versions` list into per-version items.
+
+    VERSION_ITEMS_MIGRATION_ENABLED=true \
+    python migrate_versions.py --table edit-labs [--org-id ORG] [--region us-east-1] [--segments 8] [--dry-run]
+
+Safe to re-run; projects that are already migrated are skipped. Only run it (with the flag set) once every
+writer of versions uses DynamoDBHelper.put_version(); --dry-run works without the flag.
+"""
+import argparse
+import logging
+
+from boto3.dynamodb.conditions import Attr, Key
+
+import dynamodb_helper
+from dynamodb_helper import DynamoDBHelper
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+def _legacy_projects(helper: DynamoDBHelper, org_id: str | None, segments: int = 1):
+    """Yields (org_id, project_id) of head items that still carry a `versions` list."""
+    kwargs = {
+        'FilterExpression': Attr('versions').exists(),
+        'ProjectionExpression': 'org_id, project_id'
+    }
+    if org_id:
+        items = (item for page, _ in helper.query_pages(Key('org_id').eq(org_id), **kwargs) for item in page)
+    else:
+        items = helper.parallel_scan(total_segments=segments, **kwargs)
+    for item in items:
+        yield item['org_id'], item['project_id']
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Move edit-labs versions lists into per-version items.")
+    parser.add_argument("--table", default="edit-labs")
+    parser.add_argument("--region", default=None)
+    parser.add_argument("--org-id", default=None, help="Only migrate this org's projects")
+    parser.add_argument("--segments", type=int, default=1, help="Parallel scan segments for a whole-table run")
+    parser.add_argument("--dry-run", action="store_true", help="List the projects that would be migrated")
+    args = parser.parse_args()
+
+    if not args.dry_run and not dynamodb_helper.VERSION_ITEMS_MIGRATION_ENABLED:
+        parser.error("the migration is disabled; set VERSION_ITEMS_MIGRATION_ENABLED=true once every writer uses put_version()")
+
+    helper = DynamoDBHelper(args.table, region=args.region)
+    projects = 0
+    versions = 0
+    for org_id, project_id in _legacy_projects(helper, args.org_id, args.segments):
+        projects += 1
+        if args.dry_run:
+            logger.info(f"Would migrate {org_id}/{project_id}")
+            continue
+        versions += helper.migrate_project_versions(org_id, project_id)
+
+    logger.info(f"{'Found' if args.dry_run else 'Migrated'} {projects} projects ({versions} versions moved).")
+
+
+if __name__ == '__main__':
+    main()
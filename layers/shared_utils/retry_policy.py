@@ -0,0 +1,349 @@
+import asyncio
+import json
+import logging
+import random
+import re
+import threading
+import time
+from collections import deque
+from email.utils import parsedate_to_datetime
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple, Type
+
+from exceptions import CircuitOpenError, DeadlineExceededError
+
+logger = logging.getLogger(__name__)
+
+RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+# Longest single backoff of run_sync(): blocking callers are Lambda handlers behind API Gateway's 29s limit
+SYNC_MAX_DELAY_SECONDS = 2.0
+RETRYABLE_AWS_ERROR_CODES = {
+    'ProvisionedThroughputExceededException',
+    'ThrottlingException',
+    'Throttling',
+    'RequestLimitExceeded',
+    'TransactionConflictException',
+    'InternalServerError',
+    'ServiceUnavailable',
+    'SlowDown',
+    'RequestTimeout',
+}
+# Transport failures from httpx / aiohttp / urllib3 / botocore, matched by class name so no client library is imported here
+RETRYABLE_ERROR_NAME = re.compile(r"Timeout|Connect|RemoteProtocol|ReadError|WriteError|EndpointConnection|IncompleteRead")
+
+
+def _status_code(error: BaseException) -> Optional[int]:
+    """Best-effort HTTP status of an SDK error (google-genai, api_core, googleapiclient, botocore, httpx)."""
+    for attr in ('code', 'status_code'):
+        value = getattr(error, attr, None)
+        if isinstance(value, int) and 100 <= value < 600:
+            return value
+    resp = getattr(error, 'resp', None)
+    if resp is not None and getattr(resp, 'status', None):
+        return int(resp.status)
+    response = getattr(error, 'response', None)
+    if isinstance(response, dict):
+        return response.get('ResponseMetadata', {}).get('HTTPStatusCode')
+    if response is not None and isinstance(getattr(response, 'status_code', None), int):
+        return response.status_code
+    return None
+
+
+def is_retryable(error: BaseException) -> bool:
+    """Classifies an error as transient (worth retrying) or fatal."""
+    if isinstance(error, (CircuitOpenError, DeadlineExceededError)):
+        return False
+    if isinstance(error, (asyncio.TimeoutError, TimeoutError, ConnectionError)):
+        return True
+    response = getattr(error, 'response', None)
+    if isinstance(response, dict) and 'Error' in response:
+        if response['Error'].get('Code') in RETRYABLE_AWS_ERROR_CODES:
+            return True
+    status = _status_code(error)
+    if status is not None:
+        return status in RETRYABLE_STATUS_CODES
+    return any(RETRYABLE_ERROR_NAME.search(cls.__name__) for cls in type(error).__mro__)
+
+
+def _header(headers: Any, name: str) -> Optional[str]:
+    if not headers:
+        return None
+    try:
+        return headers.get(name) or headers.get(name.title())
+    except AttributeError:
+        return None
+
+
+def retry_after_seconds(error: BaseException) -> Optional[float]:
+    """Reads a server-requested delay from a Retry-After header or a google.rpc.RetryInfo detail."""
+    candidates = []
+    response = getattr(error, 'response', None)
+    if isinstance(response, dict):
+        candidates.append(response.get('ResponseMetadata', {}).get('HTTPHeaders'))
+    elif response is not None:
+        candidates.append(getattr(response, 'headers', None))
+    candidates.append(getattr(error, 'resp', None))
+
+    for headers in candidates:
+        value = _header(headers, 'retry-after')
+        if not value:
+            continue
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            pass
+        try:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            pass
+
+    # Gemini puts the delay in the error details: {"@type": ".../google.rpc.RetryInfo", "retryDelay": "31s"}
+    details = getattr(error, 'details', None)
+    match = re.search(r'"retryDelay"\s*:\s*"([\d.]+)s"', json.dumps(details, default=str)) if details else None
+    if match:
+        return float(match.group(1))
+    return None
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive failed calls and rejects calls for `reset_seconds`.
+    After that one trial call is let through (half-open); its outcome closes or re-opens the circuit.
+    """
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_seconds: float = 60.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.consecutive_failures = 0
+        self.opened_at = None
+
+    def check(self) -> None:
+        if self.opened_at is None:
+            return
+        if time.monotonic() - self.opened_at < self.reset_seconds:
+            raise CircuitOpenError(f"Circuit for '{self.name}' is open after {self.consecutive_failures} consecutive failures")
+        logger.info(f"Circuit for '{self.name}' half-open, letting a trial call through.")
+
+    def record_success(self) -> None:
+        if self.opened_at is not None:
+            logger.info(f"Circuit for '{self.name}' closed.")
+        self.consecutive_failures = 0
+        self.opened_at = None
+
+    def record_failure(self) -> None:
+        self.consecutive_failures += 1
+        if self.consecutive_failures >= self.failure_threshold:
+            if self.opened_at is None:
+                logger.warning(f"Circuit for '{self.name}' opened after {self.consecutive_failures} consecutive failures.")
+            self.opened_at = time.monotonic()
+
+
+class RetryPolicy:
+    """
+    Retry policy for one dependency (Gemini, YouTube, S3, DynamoDB).
+
+    - Only transient errors (is_retryable, or `retry_on` types) are retried; fatal errors are raised at once.
+    - Delays use decorrelated jitter between `base_delay` and `max_delay`; a server Retry-After wins when present.
+    - `budget_seconds` caps the time spent waiting on retries for the dependency within one job (see
+      reset_retry_budgets()) and within the last `budget_window_seconds`, so a degraded dependency makes jobs
+      fail fast instead of sleeping through every call's retries, while a warm Lambda container or long-lived
+      worker gets its budget back as old waits leave the window.
+    - run_sync() never sleeps longer than SYNC_MAX_DELAY_SECONDS per retry.
+    - Retry counts and waited time are kept in `metrics` and logged by log_retry_metrics().
+    - With a `deadline` (any object with a time.monotonic() `at` and a `stage` name), every attempt is cut
+      off at the deadline and a retry is skipped when it could not get `min_attempt_seconds` before it.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        max_attempts: int = 3,
+        base_delay: float = 1.0,
+        max_delay: float = 30.0,
+        budget_seconds: float | None = None,
+        breaker: CircuitBreaker | None = None,
+        min_attempt_seconds: float = 1.0,
+        budget_window_seconds: float = 600.0
+    ):
+        self.name = name
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.budget_seconds = budget_seconds
+        self.breaker = breaker
+        self.min_attempt_seconds = min_attempt_seconds
+        self.budget_window_seconds = budget_window_seconds
+        self.metrics = {"calls": 0, "retries": 0, "fatal": 0, "exhausted": 0, "waited_seconds": 0.0}
+        # (time.monotonic() of the retry, delay) of the waits that count against the budget
+        self._budget_waits = deque()
+        self._budget_lock = threading.Lock()
+
+    def reset_budget(self) -> None:
+        """Gives the retry budget back in full (called at the start of each job or invocation)."""
+        with self._budget_lock:
+            self._budget_waits.clear()
+
+    def _take_budget(self, delay: float) -> bool:
+        """Charges `delay` to the budget; False (nothing charged) when it would overdraw it."""
+        with self._budget_lock:
+            now = time.monotonic()
+            while self._budget_waits and now - self._budget_waits[0][0] > self.budget_window_seconds:
+                self._budget_waits.popleft()
+            if self.budget_seconds is not None:
+                if sum(wait for _, wait in self._budget_waits) + delay > self.budget_seconds:
+                    return False
+            self._budget_waits.append((now, delay))
+            return True
+
+    def _next_delay(self, previous: float, error: BaseException) -> float:
+        server_delay = retry_after_seconds(error)
+        if server_delay is not None:
+            return min(server_delay, self.max_delay * 4)
+        return min(self.max_delay, random.uniform(self.base_delay, max(previous, self.base_delay) * 3))
+
+    def _plan_retry(
+        self,
+        attempt: int,
+        max_attempts: int,
+        previous_delay: float,
+        error: BaseException,
+        retry_on: Tuple[Type[BaseException], ...],
+        label: str,
+        deadline: Any = None,
+        max_delay: float | None = None
+    ) -> Optional[float]:
+        """Returns the delay before the next attempt, or None when the error must be raised."""
+        transient = is_retryable(error)
+        if self.breaker and transient:
+            # Only dependency trouble counts towards opening the circuit, not bad requests or bad model output
+            self.breaker.record_failure()
+        if not (transient or isinstance(error, retry_on)):
+            self.metrics["fatal"] += 1
+            logger.error(f"{label}: fatal {type(error).__name__}, not retrying: {error}")
+            return None
+        if attempt >= max_attempts:
+            self.metrics["exhausted"] += 1
+            logger.error(f"{label}: failed after {attempt} attempts: {error}")
+            return None
+
+        delay = self._next_delay(previous_delay, error)
+        if max_delay is not None:
+            delay = min(delay, max_delay)
+
+        if deadline is not None and time.monotonic() + delay + self.min_attempt_seconds > deadline.at:
+            self.metrics["exhausted"] += 1
+            logger.error(f"{label}: not enough time left in stage '{deadline.stage}' for another attempt: {error}")
+            return None
+
+        if not self._take_budget(delay):
+            self.metrics["exhausted"] += 1
+            logger.error(f"{label}: retry budget of {self.budget_seconds}s for '{self.name}' is spent, not retrying: {error}")
+            return None
+
+        self.metrics["retries"] += 1
+        self.metrics["waited_seconds"] += delay
+        logger.warning(f"{label}: attempt {attempt}/{max_attempts} failed ({type(error).__name__}: {error}), retrying in {delay:.1f}s")
+        return delay
+
+    async def run(
+        self,
+        fn: Callable[[], Awaitable[Any]],
+        retry_on: Tuple[Type[BaseException], ...] = (),
+        max_attempts: int | None = None,
+        label: str | None = None,
+        deadline: Any = None
+    ) -> Any:
+        """Awaits `fn()` under the policy. `retry_on` adds error types that are transient for this call."""
+        max_attempts = max_attempts or self.max_attempts
+        label = label or self.name
+        delay = self.base_delay
+        self.metrics["calls"] += 1
+
+        for attempt in range(1, max_attempts + 1):
+            if self.breaker:
+                self.breaker.check()
+            try:
+                if deadline is None:
+                    result = await fn()
+                else:
+                    remaining = deadline.at - time.monotonic()
+                    if remaining <= 0:
+                        raise DeadlineExceededError(deadline.stage, f"{label}: stage '{deadline.stage}' ran out of time")
+                    try:
+                        result = await asyncio.wait_for(fn(), remaining)
+                    except asyncio.TimeoutError:
+                        if time.monotonic() < deadline.at:
+                            raise
+                        raise DeadlineExceededError(deadline.stage, f"{label}: stage '{deadline.stage}' ran out of time") from None
+                if self.breaker:
+                    self.breaker.record_success()
+                return result
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                delay = self._plan_retry(attempt, max_attempts, delay, e, retry_on, label, deadline)
+                if delay is None:
+                    raise
+            await asyncio.sleep(delay)
+
+    def run_sync(
+        self,
+        fn: Callable[[], Any],
+        retry_on: Tuple[Type[BaseException], ...] = (),
+        max_attempts: int | None = None,
+        label: str | None = None
+    ) -> Any:
+        """
+        run() for synchronous callers (Lambda handlers) that have no event loop to yield to. Each backoff is
+        capped at SYNC_MAX_DELAY_SECONDS, so a request spends seconds, not minutes, in retries.
+        """
+        max_attempts = max_attempts or self.max_attempts
+        label = label or self.name
+        delay = self.base_delay
+        self.metrics["calls"] += 1
+
+        for attempt in range(1, max_attempts + 1):
+            if self.breaker:
+                self.breaker.check()
+            try:
+                result = fn()
+                if self.breaker:
+                    self.breaker.record_success()
+                return result
+            except Exception as e:
+                delay = self._plan_retry(attempt, max_attempts, delay, e, retry_on, label, max_delay=SYNC_MAX_DELAY_SECONDS)
+                if delay is None:
+                    raise
+            time.sleep(delay)
+
+
+# One policy per dependency, shared by every call site in the process
+RETRY_POLICIES: Dict[str, RetryPolicy] = {
+    "gemini": RetryPolicy("gemini", max_attempts=3, base_delay=3.0, max_delay=60.0, budget_seconds=900,
+                          breaker=CircuitBreaker("gemini", failure_threshold=8, reset_seconds=60), min_attempt_seconds=60,
+                          budget_window_seconds=3600),
+    "gemini_upload": RetryPolicy("gemini_upload", max_attempts=3, base_delay=2.0, max_delay=20.0, budget_seconds=120,
+                                 min_attempt_seconds=30),
+    "youtube": RetryPolicy("youtube", max_attempts=3, base_delay=0.5, max_delay=5.0, budget_seconds=20),
+    "s3": RetryPolicy("s3", max_attempts=4, base_delay=0.5, max_delay=10.0, budget_seconds=60, min_attempt_seconds=10),
+    "dynamodb": RetryPolicy("dynamodb", max_attempts=4, base_delay=0.1, max_delay=5.0, budget_seconds=30,
+                            min_attempt_seconds=0.5),
+    "ssm": RetryPolicy("ssm", max_attempts=4, base_delay=0.2, max_delay=5.0, budget_seconds=20),
+}
+
+
+def get_retry_policy(name: str) -> RetryPolicy:
+    return RETRY_POLICIES[name]
+
+
+def reset_retry_budgets() -> None:
+    """Starts a new retry budget for every dependency; call it at the start of each job or Lambda invocation."""
+    for policy in RETRY_POLICIES.values():
+        policy.reset_budget()
+
+
+def log_retry_metrics() -> Dict[str, Dict[str, Any]]:
+    """Logs the retry counters of every dependency used by this process (one RETRY_METRICS line)."""
+    metrics = {name: dict(policy.metrics) for name, policy in RETRY_POLICIES.items() if policy.metrics["calls"]}
+    logger.info("RETRY_METRICS " + json.dumps(metrics, default=str))
+    return metrics
@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# The layer's modules are imported flat (as in the Lambda /opt/python layout)
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
@@ -0,0 +1,107 @@
+import base64
+import gzip
+import json
+
+import pytest
+
+import common_response_utils
+from common_response_utils import api_response, success_response
+
+LARGE_DATA = {"items": [{"id": i, "name": f"item {i}"} for i in range(200)]}
+
+
+def request(**headers):
+    return {"headers": headers}
+
+
+def decode_body(response):
+    body = response["body"]
+    if response.get("isBase64Encoded"):
+        body = base64.b64decode(body)
+        encoding = response["headers"]["Content-Encoding"]
+        body = gzip.decompress(body) if encoding == "gzip" else common_response_utils.brotli.decompress(body)
+    return json.loads(body)
+
+
+def test_response_without_event_is_plain_json():
+    response = success_response({"a": 1})
+    assert response["statusCode"] == 200
+    assert "ETag" not in response["headers"]
+    assert json.loads(response["body"])["data"] == {"a": 1}
+
+
+def test_etag_is_stable_and_content_based():
+    first = success_response(LARGE_DATA, event=request())
+    second = success_response(LARGE_DATA, event=request())
+    other = success_response({"items": []}, event=request())
+    assert first["headers"]["ETag"] == second["headers"]["ETag"]
+    assert first["headers"]["ETag"] != other["headers"]["ETag"]
+    assert first["headers"]["Vary"] == "Accept-Encoding"
+
+
+@pytest.mark.parametrize("if_none_match", ["{etag}", "W/{etag}", '"other", {etag}', "*"])
+def test_matching_if_none_match_returns_304(if_none_match):
+    etag = success_response(LARGE_DATA, event=request())["headers"]["ETag"]
+    response = success_response(LARGE_DATA, event=request(**{"If-None-Match": if_none_match.format(etag=etag)}))
+    assert response["statusCode"] == 304
+    assert response["body"] == ""
+    assert response["headers"]["ETag"] == etag
+
+
+def test_stale_if_none_match_returns_the_body():
+    response = success_response(LARGE_DATA, event=request(**{"if-none-match": '"stale"'}))
+    assert response["statusCode"] == 200
+    assert decode_body(response)["data"] == LARGE_DATA
+
+
+def test_gzip_when_accepted(monkeypatch):
+    monkeypatch.setattr(common_response_utils, "brotli", None)
+    response = success_response(LARGE_DATA, event=request(**{"Accept-Encoding": "gzip, deflate"}))
+    assert response["isBase64Encoded"] is True
+    assert response["headers"]["Content-Encoding"] == "gzip"
+    assert decode_body(response)["data"] == LARGE_DATA
+
+
+def test_brotli_preferred_when_installed():
+    if common_response_utils.brotli is None:
+        pytest.skip("brotli is not installed")
+    response = success_response(LARGE_DATA, event=request(**{"accept-encoding": "gzip, br"}))
+    assert response["headers"]["Content-Encoding"] == "br"
+    assert decode_body(response)["data"] == LARGE_DATA
+
+
+def test_no_compression_when_refused_or_small(monkeypatch):
+    monkeypatch.setattr(common_response_utils, "brotli", None)
+    refused = success_response(LARGE_DATA, event=request(**{"Accept-Encoding": "gzip;q=0"}))
+    small = success_response({"a": 1}, event=request(**{"Accept-Encoding": "gzip"}))
+    for response in (refused, small):
+        assert "Content-Encoding" not in response["headers"]
+        assert not response.get("isBase64Encoded")
+
+
+def test_errors_skip_etag_and_compression():
+    response = api_response(400, "bad", error="details", event=request(**{"Accept-Encoding": "gzip"}))
+    assert response["statusCode"] == 400
+    assert "ETag" not in response["headers"]
+    assert json.loads(response["body"])["message"] == "bad"
+
+
+def test_large_body_is_offloaded(monkeypatch):
+    uploads = []
+    monkeypatch.setattr(common_response_utils, "RESPONSE_OFFLOAD_BUCKET", "responses-bucket")
+    monkeypatch.setattr(common_response_utils, "RESPONSE_OFFLOAD_THRESHOLD_BYTES", 100)
+    monkeypatch.setattr(common_response_utils, "_offload_body", lambda body, etag: uploads.append(body) or "https://signed")
+    response = success_response(LARGE_DATA, event=request())
+    body = json.loads(response["body"])
+    assert body["data"] is None
+    assert body["data_url"] == "https://signed"
+    assert json.loads(uploads[0])["data"] == LARGE_DATA
+
+
+def test_failed_offload_returns_the_body_inline(monkeypatch):
+    def fail(body, etag):
+        raise RuntimeError("S3 is down")
+    monkeypatch.setattr(common_response_utils, "RESPONSE_OFFLOAD_BUCKET", "responses-bucket")
+    monkeypatch.setattr(common_response_utils, "RESPONSE_OFFLOAD_THRESHOLD_BYTES", 100)
+    monkeypatch.setattr(common_response_utils, "_offload_body", fail)
+    assert decode_body(success_response(LARGE_DATA, event=request()))["data"] == LARGE_DATA
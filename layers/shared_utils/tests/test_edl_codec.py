@@ -0,0 +1,130 @@
+from decimal import Decimal
+
+import pytest
+
+import edl_codec
+from edl_codec import (
+    EdlBaseMismatchError,
+    decode_edits,
+    edits_checksum,
+    encode_edits,
+    offload_record,
+    snapshot_uri,
+    write_snapshot
+)
+
+
+class FakeS3:
+    """In-memory stand-in for the two S3 calls the codec makes."""
+
+    def __init__(self):
+        self.objects = {}
+
+    def put_object(self, Bucket, Key, Body, ContentType):
+        self.objects[(Bucket, Key)] = Body
+
+    def get_object(self, Bucket, Key):
+        body = self.objects[(Bucket, Key)]
+        return {"Body": type("Body", (), {"read": lambda self: body})()}
+
+
+def make_edits(count, offset=0):
+    return [
+        {"id": f"E{i + 1}", "source_video_index": 1, "start_time": f"00:00:{i:02}", "duration_seconds": Decimal(i + offset)}
+        for i in range(count)
+    ]
+
+
+def loader(*items):
+    by_version = {item["version"]: item for item in items}
+    return by_version.get
+
+
+def test_plain_all_edits_are_returned_as_is():
+    assert decode_edits({"all_edits": make_edits(2)}) == make_edits(2)
+    assert decode_edits(None) == []
+
+
+def test_full_record_round_trip():
+    edits = make_edits(30)
+    record = encode_edits(edits)
+    assert record["codec"] == edl_codec.CODEC_FULL
+    assert record["count"] == 30
+    assert decode_edits({"version": "v1", "edl": record}) == edits
+
+
+def test_delta_record_round_trip():
+    s3 = FakeS3()
+    base = make_edits(40)
+    edits = base[:10] + make_edits(3, offset=100) + base[12:]
+    uri = snapshot_uri("bucket", "edl/p1/base", base)
+    record = encode_edits(edits, base, uri)
+    assert record["codec"] == edl_codec.CODEC_DELTA
+    assert record["base_uri"] == f"s3://bucket/edl/p1/base/{edits_checksum(base)}.bin"
+    assert record["base_count"] == 40
+
+    write_snapshot(base, uri, s3_client=s3)
+    assert decode_edits({"version": "v2", "edl": record}, s3_client=s3) == edits
+
+
+def test_delta_survives_a_rerun_of_its_base_version():
+    s3 = FakeS3()
+    base = make_edits(40)
+    uri = snapshot_uri("bucket", "edl/p1/base", base)
+    v2 = {"version": "v2", "edl": encode_edits(base[:-1], base, uri)}
+    write_snapshot(base, uri, s3_client=s3)
+
+    # v1 is regenerated with different edits; v2 still decodes from the snapshot it was made against
+    rerun = make_edits(40, offset=1)
+    write_snapshot(rerun, snapshot_uri("bucket", "edl/p1/base", rerun), s3_client=s3)
+    assert decode_edits(v2, s3_client=s3) == base[:-1]
+
+
+def test_corrupt_snapshot_is_rejected():
+    s3 = FakeS3()
+    base = make_edits(40)
+    uri = snapshot_uri("bucket", "edl/p1/base", base)
+    record = encode_edits(base[:-1], base, uri)
+    s3.objects[("bucket", uri.split("bucket/", 1)[1])] = edl_codec._pack(make_edits(40, offset=1))
+    with pytest.raises(EdlBaseMismatchError):
+        decode_edits({"version": "v2", "edl": record}, s3_client=s3)
+
+
+def test_no_delta_without_a_snapshot_location():
+    base = make_edits(40)
+    assert encode_edits(base[:-1], base)["codec"] == edl_codec.CODEC_FULL
+
+
+def test_legacy_delta_against_a_version():
+    base = make_edits(40)
+    edits = base[:-1]
+    ops = edl_codec._pack(edl_codec.delta_ops(base, edits))
+    record = {"codec": edl_codec.CODEC_DELTA, "data": ops, "count": len(edits), "base_version": "v1",
+              "base_count": len(base), "base_checksum": edits_checksum(base)}
+    v1 = {"version": "v1", "edl": encode_edits(base)}
+    assert decode_edits({"version": "v2", "edl": record}, loader(v1)) == edits
+
+    rewritten = {"version": "v1", "all_edits": make_edits(40, offset=1)}
+    with pytest.raises(EdlBaseMismatchError):
+        decode_edits({"version": "v2", "edl": record}, loader(rewritten))
+    with pytest.raises(ValueError):
+        decode_edits({"version": "v2", "edl": record})
+
+
+def test_checksum_ignores_key_order_and_decimal_vs_number():
+    assert edits_checksum([{"a": 1, "b": Decimal("2.5")}]) == edits_checksum([{"b": 2.5, "a": 1}])
+    assert edits_checksum([{"a": 1}, {"a": 2}]) != edits_checksum([{"a": 2}, {"a": 1}])
+
+
+def test_large_records_are_offloaded_and_read_back():
+    s3 = FakeS3()
+    edits = make_edits(50)
+    record = offload_record(encode_edits(edits), "bucket", "edl/p1", threshold_bytes=10, s3_client=s3)
+    assert "data" not in record
+    assert record["s3_uri"].startswith("s3://bucket/edl/p1/")
+    assert decode_edits({"version": "v1", "edl": record}, s3_client=s3) == edits
+
+
+def test_small_records_stay_inline():
+    record = encode_edits(make_edits(2))
+    assert offload_record(record, "bucket", "edl/p1", threshold_bytes=1 << 20, s3_client=FakeS3()) is record
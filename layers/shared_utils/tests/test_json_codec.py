@@ -0,0 +1,59 @@
+from decimal import Decimal
+
+import pytest
+
+import json_codec
+
+
+@pytest.fixture(params=["orjson", "stdlib"])
+def codec(request, monkeypatch):
+    """json_codec with orjson (when installed) and with the standard library fallback."""
+    if request.param == "orjson":
+        if json_codec.orjson is None:
+            pytest.skip("orjson is not installed")
+    else:
+        monkeypatch.setattr(json_codec, "orjson", None)
+    return json_codec
+
+
+def test_dumps_is_compact_and_converts_decimals(codec):
+    item = {"count": Decimal("3"), "ratio": Decimal("0.25"), "tags": {"a"}, "name": "café"}
+    assert codec.dumps(item) == '{"count":3,"ratio":0.25,"tags":["a"],"name":"café"}'.encode("utf-8")
+    assert isinstance(codec.dumps(item), bytes)
+
+
+def test_dumps_sort_keys(codec):
+    assert codec.dumps({"b": 1, "a": 2}, sort_keys=True) == b'{"a":2,"b":1}'
+
+
+def test_dumps_rejects_unknown_types(codec):
+    with pytest.raises(TypeError):
+        codec.dumps({"value": object()})
+
+
+def test_dumps_str_and_prompt_json(codec):
+    assert codec.dumps_str({"a": [1, 2]}) == '{"a":[1,2]}'
+    assert codec.prompt_json({"a": {"b": Decimal("1.5")}}) == '{"a":{"b":1.5}}'
+
+
+def test_loads_with_and_without_decimals(codec):
+    assert codec.loads(b'{"a":1.5,"b":2}') == {"a": 1.5, "b": 2}
+    parsed = codec.loads('{"a":1.5,"b":2}', use_decimal=True)
+    assert parsed == {"a": Decimal("1.5"), "b": 2}
+    assert isinstance(parsed["a"], Decimal)
+
+
+def test_to_native(codec):
+    native = codec.to_native({"a": Decimal("2"), "b": [Decimal("0.5")]})
+    assert native == {"a": 2, "b": [0.5]}
+    assert isinstance(native["a"], int)
+
+
+def test_to_dynamodb_turns_floats_into_decimals(codec):
+    item = codec.to_dynamodb({"start": 1.1, "count": 3, "nested": [{"score": 0.3}], "kept": Decimal("2.5")})
+    assert item == {"start": Decimal("1.1"), "count": 3, "nested": [{"score": Decimal("0.3")}], "kept": Decimal("2.5")}
+
+
+def test_to_dynamodb_keeps_values_json_cannot_carry(codec):
+    item = codec.to_dynamodb({"blob": b"\x00\x01", "tags": {"a"}, "ratio": 0.1})
+    assert item == {"blob": b"\x00\x01", "tags": {"a"}, "ratio": Decimal("0.1")}
@@ -0,0 +1,206 @@
+import asyncio
+import time
+
+import pytest
+
+import retry_policy
+from exceptions import CircuitOpenError, DeadlineExceededError
+from retry_policy import CircuitBreaker, RetryPolicy, is_retryable, retry_after_seconds
+
+
+class HttpError(Exception):
+    def __init__(self, code, headers=None):
+        super().__init__(f"HTTP {code}")
+        self.code = code
+        self.resp = headers
+
+
+class AwsError(Exception):
+    def __init__(self, code):
+        super().__init__(code)
+        self.response = {'Error': {'Code': code}, 'ResponseMetadata': {'HTTPStatusCode': 400}}
+
+
+class ReadTimeout(Exception):
+    pass
+
+
+class Deadline:
+    def __init__(self, seconds, stage="test"):
+        self.at = time.monotonic() + seconds
+        self.stage = stage
+
+
+@pytest.fixture
+def no_sleep(monkeypatch):
+    """Records the retry delays instead of sleeping through them."""
+    delays = []
+
+    async def fake_async_sleep(delay):
+        delays.append(delay)
+
+    monkeypatch.setattr(retry_policy.time, "sleep", delays.append)
+    monkeypatch.setattr(retry_policy.asyncio, "sleep", fake_async_sleep)
+    return delays
+
+
+def failing(errors, result="ok"):
+    """A callable that raises `errors` one by one, then returns `result`."""
+    errors = list(errors)
+    calls = []
+
+    def fn():
+        calls.append(1)
+        if errors:
+            raise errors.pop(0)
+        return result
+    fn.calls = calls
+    return fn
+
+
+@pytest.mark.parametrize("error, expected", [
+    (HttpError(429), True),
+    (HttpError(503), True),
+    (HttpError(400), False),
+    (HttpError(404), False),
+    (AwsError('ProvisionedThroughputExceededException'), True),
+    (AwsError('ValidationException'), False),
+    (asyncio.TimeoutError(), True),
+    (ConnectionResetError(), True),
+    (ReadTimeout(), True),
+    (ValueError("bad model output"), False),
+    (CircuitOpenError("open"), False),
+    (DeadlineExceededError("stage", "late"), False),
+])
+def test_is_retryable(error, expected):
+    assert is_retryable(error) is expected
+
+
+def test_retry_after_header_and_gemini_retry_info():
+    assert retry_after_seconds(HttpError(429, {'retry-after': '7'})) == 7.0
+    error = HttpError(429)
+    error.details = {"error": {"details": [{"@type": "type.googleapis.com/google.rpc.RetryInfo", "retryDelay": "31s"}]}}
+    assert retry_after_seconds(error) == 31.0
+    assert retry_after_seconds(HttpError(500)) is None
+
+
+def test_run_sync_retries_transient_errors(no_sleep):
+    policy = RetryPolicy("test", max_attempts=3, base_delay=0.1, max_delay=1.0)
+    fn = failing([HttpError(503), HttpError(503)])
+    assert policy.run_sync(fn) == "ok"
+    assert len(fn.calls) == 3
+    assert policy.metrics["retries"] == 2
+    assert len(no_sleep) == 2
+
+
+def test_run_sync_raises_fatal_errors_at_once(no_sleep):
+    policy = RetryPolicy("test", max_attempts=3)
+    fn = failing([HttpError(400)])
+    with pytest.raises(HttpError):
+        policy.run_sync(fn)
+    assert len(fn.calls) == 1
+    assert policy.metrics["fatal"] == 1
+    assert no_sleep == []
+
+
+def test_retry_on_makes_an_error_transient_for_one_call(no_sleep):
+    policy = RetryPolicy("test", max_attempts=2, base_delay=0.1)
+    assert policy.run_sync(failing([ValueError("bad json")]), retry_on=(ValueError,)) == "ok"
+
+
+def test_run_sync_raises_after_max_attempts(no_sleep):
+    policy = RetryPolicy("test", max_attempts=2, base_delay=0.1)
+    fn = failing([HttpError(503)] * 5)
+    with pytest.raises(HttpError):
+        policy.run_sync(fn)
+    assert len(fn.calls) == 2
+    assert policy.metrics["exhausted"] == 1
+
+
+def test_run_sync_caps_server_delay(no_sleep):
+    policy = RetryPolicy("test", max_attempts=2, base_delay=0.1, max_delay=30.0)
+    policy.run_sync(failing([HttpError(429, {'retry-after': '25'})]))
+    assert no_sleep == [retry_policy.SYNC_MAX_DELAY_SECONDS]
+
+
+def test_budget_stops_retries_and_reset_restores_it(no_sleep):
+    policy = RetryPolicy("test", max_attempts=5, base_delay=1.0, max_delay=1.0, budget_seconds=2.0)
+    with pytest.raises(HttpError):
+        policy.run_sync(failing([HttpError(503)] * 5))
+    assert no_sleep == [1.0, 1.0]
+
+    with pytest.raises(HttpError):
+        policy.run_sync(failing([HttpError(503)]))
+    assert len(no_sleep) == 2
+
+    policy.reset_budget()
+    assert policy.run_sync(failing([HttpError(503)])) == "ok"
+    assert len(no_sleep) == 3
+
+
+def test_budget_window_returns_old_waits(no_sleep, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(retry_policy.time, "monotonic", lambda: now[0])
+    policy = RetryPolicy("test", max_attempts=2, base_delay=1.0, max_delay=1.0, budget_seconds=1.0, budget_window_seconds=60)
+    policy.run_sync(failing([HttpError(503)]))
+    with pytest.raises(HttpError):
+        policy.run_sync(failing([HttpError(503)]))
+
+    now[0] += 61
+    assert policy.run_sync(failing([HttpError(503)])) == "ok"
+
+
+def test_reset_retry_budgets_resets_every_policy():
+    policy = retry_policy.get_retry_policy("s3")
+    assert policy._take_budget(policy.budget_seconds)
+    assert not policy._take_budget(1.0)
+    retry_policy.reset_retry_budgets()
+    assert policy._take_budget(1.0)
+    retry_policy.reset_retry_budgets()
+
+
+def test_circuit_breaker_opens_and_half_opens(monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr(retry_policy.time, "monotonic", lambda: now[0])
+    breaker = CircuitBreaker("test", failure_threshold=2, reset_seconds=10)
+    breaker.record_failure()
+    breaker.check()
+    breaker.record_failure()
+    with pytest.raises(CircuitOpenError):
+        breaker.check()
+
+    now[0] += 11
+    breaker.check()
+    breaker.record_success()
+    assert breaker.opened_at is None
+
+
+def test_run_retries_async_calls(no_sleep):
+    policy = RetryPolicy("test", max_attempts=3, base_delay=0.1)
+    fn = failing([HttpError(502)])
+
+    async def call():
+        return fn()
+    assert asyncio.run(policy.run(call)) == "ok"
+    assert len(fn.calls) == 2
+
+
+def test_run_raises_deadline_exceeded_when_the_stage_is_over():
+    policy = RetryPolicy("test", max_attempts=3)
+
+    async def slow():
+        await asyncio.sleep(1)
+
+    with pytest.raises(DeadlineExceededError):
+        asyncio.run(policy.run(slow, deadline=Deadline(0.05)))
+
+
+def test_run_skips_a_retry_that_cannot_fit_before_the_deadline(no_sleep):
+    policy = RetryPolicy("test", max_attempts=3, base_delay=1.0, min_attempt_seconds=5)
+    fn = failing([HttpError(503)])
+
+    async def call():
+        return fn()
+    with pytest.raises(HttpError):
+        asyncio.run(policy.run(call, deadline=Deadline(2)))
+    assert len(fn.calls) == 1
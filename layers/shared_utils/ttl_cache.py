@@ -0,0 +1,140 @@
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class TTLCache:
+    """
+    In-process LRU cache whose entries expire after `ttl_seconds`.
+
+    Each entry may carry a `stamp` (an updated_at, a version or an item id). get() with `min_stamp`
+    treats an entry with an older stamp as stale, and get_or_load() can revalidate an expired entry with a
+    cheap `check_stamp()` instead of reloading it. Hits, misses, stale entries and evictions are counted in
+    `metrics` and logged by log_cache_metrics().
+    """
+
+    def __init__(self, name: str, max_entries: int = 256, ttl_seconds: float = 300.0):
+        self.name = name
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[Hashable, tuple[Any, Any, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.metrics = {"hits": 0, "misses": 0, "stale": 0, "revalidated": 0, "evictions": 0}
+        CACHES[name] = self
+
+    def _lookup(self, key: Hashable) -> tuple[Any, Any, float] | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def get(self, key: Hashable, default: Any = None, min_stamp: Any = None) -> Any:
+        """Cached value of `key`, or `default` when missing, expired or stamped older than `min_stamp`."""
+        entry = self._lookup(key)
+        if entry is None:
+            self.metrics["misses"] += 1
+            return default
+        value, stamp, expires_at = entry
+        if time.monotonic() >= expires_at or (min_stamp is not None and (stamp is None or stamp < min_stamp)):
+            self.metrics["stale"] += 1
+            self.invalidate(key)
+            return default
+        self.metrics["hits"] += 1
+        return value
+
+    def put(self, key: Hashable, value: Any, stamp: Any = None) -> None:
+        with self._lock:
+            self._entries[key] = (value, stamp, time.monotonic() + self.ttl_seconds)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.metrics["evictions"] += 1
+
+    def invalidate(self, key: Hashable) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def get_or_load(
+        self,
+        key: Hashable,
+        load: Callable[[], tuple[Any, Any]],
+        check_stamp: Optional[Callable[[], Any]] = None
+    ) -> Any:
+        """
+        Read-through lookup. `load()` returns (value, stamp). Once an entry has expired, `check_stamp()` (when
+        given) returns the current stamp; an unchanged stamp renews the entry without calling load().
+        """
+        entry = self._fresh_entry(key)
+        if entry is not None:
+            value, stamp, expires_at = entry
+            if time.monotonic() < expires_at:
+                return value
+            if check_stamp is not None and check_stamp() == stamp:
+                return self._revalidated(key, value, stamp)
+            self.metrics["stale"] += 1
+        value, stamp = load()
+        self.put(key, value, stamp)
+        return value
+
+    async def get_or_load_async(
+        self,
+        key: Hashable,
+        load: Callable[[], Awaitable[tuple[Any, Any]]],
+        check_stamp: Optional[Callable[[], Awaitable[Any]]] = None
+    ) -> Any:
+        """get_or_load() with coroutine loaders, for the async pipeline."""
+        entry = self._fresh_entry(key)
+        if entry is not None:
+            value, stamp, expires_at = entry
+            if time.monotonic() < expires_at:
+                return value
+            if check_stamp is not None and await check_stamp() == stamp:
+                return self._revalidated(key, value, stamp)
+            self.metrics["stale"] += 1
+        value, stamp = await load()
+        self.put(key, value, stamp)
+        return value
+
+    def _fresh_entry(self, key: Hashable) -> tuple[Any, Any, float] | None:
+        """The entry of `key`, counting a hit when it is unexpired and a miss when there is none."""
+        entry = self._lookup(key)
+        if entry is None:
+            self.metrics["misses"] += 1
+        elif time.monotonic() < entry[2]:
+            self.metrics["hits"] += 1
+        return entry
+
+    def _revalidated(self, key: Hashable, value: Any, stamp: Any) -> Any:
+        self.metrics["revalidated"] += 1
+        self.put(key, value, stamp)
+        return value
+
+    def hit_ratio(self) -> float:
+        served = self.metrics["hits"] + self.metrics["revalidated"]
+        lookups = served + self.metrics["misses"] + self.metrics["stale"]
+        return served / lookups if lookups else 0.0
+
+
+# Every cache of the process by name, for log_cache_metrics()
+CACHES: Dict[str, TTLCache] = {}
+
+
+def log_cache_metrics() -> Dict[str, Dict[str, Any]]:
+    """Logs the counters and hit ratio of every cache used by this process (one CACHE_METRICS line)."""
+    metrics = {
+        name: {**cache.metrics, "hit_ratio": round(cache.hit_ratio(), 3), "size": len(cache._entries)}
+        for name, cache in CACHES.items()
+        if any(cache.metrics.values())
+    }
+    logger.info("CACHE_METRICS " + json.dumps(metrics, default=str))
+    return metrics